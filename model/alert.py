@@ -8,20 +8,26 @@ import ssl
 from abc import ABC, abstractmethod
 import array
 import calendar
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from decimal import Decimal
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from fractions import Fraction
 from statistics import mean
 from typing import Any, Union
 
 from mailjet_rest import Client
 from mysql.connector.cursor import MySQLCursor
 
-from model import utils
+from model import utils, vectorized
+from model.local_cache import Baseline, BaselineCache
+from model.series import MeterSeries, hour_of_epoch, to_epoch
+from model.templates import CompiledTemplate, template_registry
 from model.my_exception import EnumError, ConfigError, NoDataFoundInDatabase, StopCheckAlertDefinition
-from model.utils import get_day_name_from_datetime, get_data_from_json_file, get_str_from_file, \
+from model.utils import get_day_name_from_datetime, \
     get_path_in_data_folder_of, ALERT_TABLE_NAME, ALERT_TABLE_COMPO, \
-    SOURCE_PATH, iter_row, METER_TABLE_NAME, NOTIFICATION_NAME, ALERT_MANAGER_TABLE_NAME, get_path_in_source_folder_of, \
+    SOURCE_PATH, fetch_rows, FetchStrategy, METER_TABLE_NAME, NOTIFICATION_NAME, ALERT_MANAGER_TABLE_NAME, get_path_in_source_folder_of, \
     ALERT_DEFINITION_NOTIFICATION_TIME, ALERT_DEFINITION_NOTIFICATION_TIME_COMPO, my_sql
 from enum import Enum, auto, unique, Flag, IntEnum
 
@@ -41,16 +47,197 @@ def find_min(data: array):
     return min(data)
 
 
+# Incremental
+class Accumulator(ABC):
+    """
+        Calculate an operator result data by data, without keeping data
+    """
+    _count: int
+
+    def __init__(self):
+        self._count = 0
+
+    def add(self, data):
+        self._add(data)
+        self._count += 1
+
+    def merge(self, other):
+        """ add the data of an other accumulator of the same operator (partial result of an other chunk) """
+        if other.count:
+            self._merge(other)
+            self._count += other.count
+
+    def merge_summary(self, count: int, minimum, maximum, total: Fraction):
+        """ add data only known by their summary (model.rollup.BucketSummary) : count, min, max and exact sum """
+        if count:
+            self._merge_summary(minimum=minimum, maximum=maximum, total=total)
+            self._count += count
+
+    def remove(self, other) -> bool:
+        """
+        remove the data of an other accumulator (oldest slice of a moving period)
+
+        :return: False if the result can not be known without all data - the accumulator is then unchanged
+        """
+        if not other.count:
+            return True
+        if other.count > self._count or not self._remove(other):
+            return False
+        self._count -= other.count
+        return True
+
+    @abstractmethod
+    def _add(self, data):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _merge(self, other):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _remove(self, other) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _merge_summary(self, minimum, maximum, total: Fraction):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _get_summary(self) -> tuple:
+        raise NotImplementedError
+
+    @property
+    @abstractmethod
+    def result(self):
+        raise NotImplementedError
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def summary(self) -> tuple:
+        """ (count, minimum, maximum, total) giving the same accumulator with merge_summary, None for what is not kept """
+        return (self._count,) + self._get_summary()
+
+
+class MaxAccumulator(Accumulator):
+    _max: Any
+
+    def __init__(self):
+        super().__init__()
+        self._max = None
+
+    def _add(self, data):
+        if not self._count or data > self._max:
+            self._max = data
+
+    def _merge(self, other):
+        self._add(other.result)
+
+    def _merge_summary(self, minimum, maximum, total: Fraction):
+        self._add(maximum)
+
+    def _remove(self, other) -> bool:
+        # the max is still in the remaining data only if it is strictly bigger than the removed ones
+        return other.count < self._count and other.result < self._max
+
+    def _get_summary(self) -> tuple:
+        return None, self._max, None
+
+    @property
+    def result(self):
+        return self._max
+
+
+class MinAccumulator(Accumulator):
+    _min: Any
+
+    def __init__(self):
+        super().__init__()
+        self._min = None
+
+    def _add(self, data):
+        if not self._count or data < self._min:
+            self._min = data
+
+    def _merge(self, other):
+        self._add(other.result)
+
+    def _merge_summary(self, minimum, maximum, total: Fraction):
+        self._add(minimum)
+
+    def _remove(self, other) -> bool:
+        return other.count < self._count and other.result > self._min
+
+    def _get_summary(self) -> tuple:
+        return self._min, None, None
+
+    @property
+    def result(self):
+        return self._min
+
+
+class AverageAccumulator(Accumulator):
+    """
+        Exact sum kept as numerators per denominator, rounded once like statistics.mean
+    """
+    _partials: dict
+    _type: type
+
+    def __init__(self):
+        super().__init__()
+        self._partials = dict()
+        self._type = None
+
+    def _add(self, data):
+        numerator, denominator = data.as_integer_ratio()
+        self._partials[denominator] = self._partials.get(denominator, 0) + numerator
+        self._type = type(data)
+
+    def _merge(self, other):
+        for denominator, numerator in other._partials.items():
+            self._partials[denominator] = self._partials.get(denominator, 0) + numerator
+        self._type = other._type
+
+    def _merge_summary(self, minimum, maximum, total: Fraction):
+        self._partials[total.denominator] = self._partials.get(total.denominator, 0) + total.numerator
+        # only the exact sum is known (e.g. BaselineCache) : result as a float
+        self._type = type(maximum) if maximum is not None else float
+
+    def _remove(self, other) -> bool:
+        for denominator, numerator in other._partials.items():
+            self._partials[denominator] = self._partials.get(denominator, 0) - numerator
+        return True
+
+    def _get_summary(self) -> tuple:
+        return None, None, sum(Fraction(numerator, denominator) for denominator, numerator in self._partials.items())
+
+    @property
+    def result(self):
+        if not self._count:
+            return None
+        value = sum(Fraction(numerator, denominator) for denominator, numerator in self._partials.items()) / self._count
+        if issubclass(self._type, int):
+            return int(value) if value.denominator == 1 else float(value)
+        if issubclass(self._type, Decimal):
+            return self._type(value.numerator) / self._type(value.denominator)
+        return self._type(value)
+
+
 # CLASS
 class MyOperator(Enum):
-    MAX = "MAX", find_max
-    MIN = "MIN", find_min
-    AVERAGE = "AVERAGE", calculate_average
+    MAX = "MAX", find_max, "MAX", vectorized.find_max_array, MaxAccumulator
+    MIN = "MIN", find_min, "MIN", vectorized.find_min_array, MinAccumulator
+    AVERAGE = "AVERAGE", calculate_average, "AVG", vectorized.calculate_average_array, AverageAccumulator
 
-    def __new__(cls, str_name, method):
+    def __new__(cls, str_name, method, sql_function, array_method, accumulator):
         obj = object.__new__(cls)
         obj._value_ = str_name
         obj.calculate = method
+        obj.sql_function = sql_function
+        obj.calculate_array = array_method
+        obj.accumulator = accumulator
         return obj
 
 
@@ -280,6 +467,16 @@ class ValueGenerator(ABC):
     def calculate_value(self, meter_id: int):
         raise NotImplementedError
 
+    def prefetch(self, meters: list):
+        pass
+
+    def clear_prefetch(self):
+        pass
+
+    def get_period(self):
+        """ :return: Period of the data needed in db, None if no data is needed """
+        return None
+
     @property
     def value(self):
         return self._value
@@ -308,12 +505,90 @@ class DataBaseValueGenerator(ABC):
         self._value = self.get_value_in_db(meter_id=meter_id, is_index=is_index)
 
 
+class ObjectiveRepository:
+    """
+        Objectives of bi_objectifs loaded for all meters of a run with "IN (...)" queries.
+        Values are kept normalized (by hour when the objective has a time_unit).
+        Loaded objectives are read again from db after TTL (long running process)
+    """
+    TTL = timedelta(minutes=15)
+    BATCH_SIZE = 500
+
+    __objectives: dict
+    __meter_ids: set
+    __load_time: datetime
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.__objectives = dict()
+        self.__meter_ids = set()
+        self.__load_time = None
+
+    @staticmethod
+    def normalize(value, time_unit: str):
+        if time_unit:
+            return value / PeriodUnitDefinition(time_unit).nb_hour
+        return value
+
+    @staticmethod
+    def generate_query(nb_meter: int) -> str:
+        return "SELECT o.r_compteur, o.value, o.time_unit from bi_objectifs o where o.r_compteur IN ({})".format(
+            ", ".join(["%s" for i in range(nb_meter)])
+        )
+
+    def load(self, meter_ids):
+        meter_ids = list(dict.fromkeys(meter_ids))
+        objectives = dict()
+        i = 0
+        while i < len(meter_ids):
+            chunk = meter_ids[i:i + ObjectiveRepository.BATCH_SIZE]
+            cursor = my_sql.generate_cursor()
+            cursor.execute(operation=ObjectiveRepository.generate_query(nb_meter=len(chunk)), params=chunk)
+            for meter_id, value, time_unit in cursor.fetchall():
+                # same objective as the query of one meter : the first one
+                if meter_id not in objectives:
+                    objectives[meter_id] = ObjectiveRepository.normalize(value=value, time_unit=time_unit)
+            cursor.close()
+            i += ObjectiveRepository.BATCH_SIZE
+        self.__objectives = objectives
+        self.__meter_ids = set(meter_ids)
+        self.__load_time = datetime.today()
+        print("objectives loaded :", len(objectives), "for", len(meter_ids), "meters")
+
+    def is_expired(self) -> bool:
+        return self.__load_time is not None and datetime.today() - self.__load_time > ObjectiveRepository.TTL
+
+    def get(self, meter_id: int):
+        """ :return: normalized objective, None if not loaded (or no objective for this meter) """
+        if self.is_expired():
+            self.load(meter_ids=self.__meter_ids)
+        return self.__objectives.get(meter_id)
+
+    @property
+    def load_time(self):
+        return self.__load_time
+
+
+objective_repository = ObjectiveRepository()
+
+
 class SimpleDBBasedValueGenerator(DataBaseValueGenerator, ValueGenerator):  # GOAL
 
+    # PRELOAD - objectives of all meters of the run are read at start (see objective_repository)
+    PRELOAD_OBJECTIVES = False
+
     def __init__(self) -> None:
         super().__init__()
 
     def get_value_in_db(self, meter_id: int, is_index: bool):
+        if SimpleDBBasedValueGenerator.PRELOAD_OBJECTIVES:
+            value = objective_repository.get(meter_id=meter_id)
+            if value is not None:
+                print("Find Objectif : preloaded", value)
+                return value
+
         query = """SELECT o.value, o.time_unit from bi_objectifs o where o.r_compteur=%s"""
         params = [meter_id]
 
@@ -324,19 +599,23 @@ class SimpleDBBasedValueGenerator(DataBaseValueGenerator, ValueGenerator):  # GO
         result = cursor.fetchall()
         print("\tresult", result)
         value, time_unit = result[0]
-        if time_unit:
-            period_unit = PeriodUnitDefinition(time_unit)
-            value = value / period_unit.nb_hour
-        return value
+        return ObjectiveRepository.normalize(value=value, time_unit=time_unit)
 
 
 class PeriodBasedValueGenerator(DataBaseValueGenerator, ValueGenerator):
 
+    # BASELINE CACHE - model.local_cache.BaselineCache : values kept between runs and updated by slices
+    BASELINE_CACHE = None
+
     __period: Period
     __operator: MyOperator
+    __data_handler: "HandleDataFromDB"
+    __unit: str
+    __quantity: int
 
     def __init__(self, operator: MyOperator, unit: str, quantity: int, end_date: datetime) -> None:
         super().__init__()
+        self.__data_handler = None
         if not unit or not quantity or quantity <= 0:
             msg = "valid 'value_period_unit' and 'value_period_quantity' NEEDED"
             msg += "(found respectively '{}' and '{}'".format(
@@ -346,19 +625,39 @@ class PeriodBasedValueGenerator(DataBaseValueGenerator, ValueGenerator):
             raise ConfigError(obj=self, msg=msg)
         self.generate_period(quantity=quantity, unit=unit, end_date=end_date)
         self.__operator = operator
+        self.__unit = unit
+        self.__quantity = quantity
 
     def generate_period(self, unit: str, quantity: int, end_date: datetime):
         period_generator = UserBasedGoBackPeriodGenerator(quantity=quantity, unit=unit, to_date=end_date)
         self.__period = period_generator.get_pertinent_period()
 
+    def prefetch(self, meters: list):
+        self.__data_handler = HandleDataFromDB(period=self.__period)
+        self.__data_handler.prefetch(meters=meters, operator=self.__operator)
+
+    def clear_prefetch(self):
+        self.__data_handler = None
+
+    def get_period(self):
+        return self.__period
+
     def get_value_in_db(self, meter_id: int, is_index: bool):
         print("find values in", self.__period)
-        hdl = HandleDataFromDB(period=self.__period)
-        result = hdl.get_data_from_db(meter_id=meter_id, is_index=is_index)
-        if result:
-            return self.__operator.calculate(result)
+        hdl = self.__data_handler if self.__data_handler else HandleDataFromDB(period=self.__period)
+        if PeriodBasedValueGenerator.BASELINE_CACHE is not None and not self.__data_handler:
+            result = hdl.calculate_baseline(
+                meter_id=meter_id,
+                is_index=is_index,
+                operator=self.__operator,
+                cache=PeriodBasedValueGenerator.BASELINE_CACHE,
+                key=(meter_id, self.__unit, self.__quantity, self.__operator.name, None, None, bool(is_index))
+            )
         else:
+            result = hdl.calculate_from_db(meter_id=meter_id, is_index=is_index, operator=self.__operator)
+        if result is None:
             raise NoDataFoundInDatabase(message="no value found for {}".format(self.__period))
+        return result
 
 
 
@@ -407,6 +706,15 @@ class AlertValue:
         print("value type :", self.value_generator_type.name)
         self.value_generator.calculate_value(meter_id=meter_id, is_index=is_index)
 
+    def prefetch(self, meters: list):
+        self.value_generator.prefetch(meters=meters)
+
+    def clear_prefetch(self):
+        self.value_generator.clear_prefetch()
+
+    def get_period(self):
+        return self.value_generator.get_period()
+
     @property
     def value_number(self):
         return self.__value_number
@@ -439,6 +747,7 @@ class AlertData:
     # data
     __data_period_type: PeriodGeneratorType
     __data_period_generator: PeriodGenerator
+    __data_handler: "HandleDataFromDB"  # only set when data are prefetched
     __data: float  # data to check - calculated from value in db
 
     def __init__(self,
@@ -452,6 +761,7 @@ class AlertData:
         print(self.__class__.__name__, " in creation ...")
         self.__hour_start = hour_start
         self.__hour_end = hour_end
+        self.__data_handler = None
 
         try:
             self.__data_period_type = PeriodGeneratorType[data_period_type]
@@ -479,15 +789,32 @@ class AlertData:
                 to_date=today
             )
 
-    def get_all_data_in_db(self, meter_id: int, is_index: bool) -> "list: all data from db":
+    def prefetch(self, meters: list, operator: MyOperator):
         period = self.__data_period_generator.get_pertinent_period()
-        all_data = HandleDataFromDB(period=period).get_data_from_db(
+        self.__data_handler = HandleDataFromDB(period=period)
+        self.__data_handler.prefetch(
+            meters=meters,
+            operator=operator,
+            hour_start=self.__hour_start,
+            hour_end=self.__hour_end
+        )
+
+    def clear_prefetch(self):
+        self.__data_handler = None
+
+    def get_period(self):
+        return self.__data_period_generator.get_pertinent_period()
+
+    def calculate_data_in_db(self, meter_id: int, is_index: bool, operator: MyOperator):
+        period = self.__data_period_generator.get_pertinent_period()
+        hdl = self.__data_handler if self.__data_handler else HandleDataFromDB(period=period)
+        return hdl.calculate_from_db(
             meter_id=meter_id,
             is_index=is_index,
+            operator=operator,
             hour_start=self.__hour_start,
             hour_end=self.__hour_end,
         )
-        return all_data
 
     @property
     def data_period_type(self):
@@ -508,6 +835,130 @@ class AlertData:
 
 # -----------------------------------------------    HANDLE DONNESCOMPTAGE  -------------------------------------------------
 
+@unique
+class CalculationEngine(Enum):
+    PYTHON = auto()  # python lists and MyOperator.calculate
+    NUMPY = auto()  # float64 / int64 arrays and MyOperator.calculate_array - numpy needed
+    STREAMING = auto()  # generator over the cursor and MyOperator.accumulator - constant memory
+    SERIES = auto()  # MeterSeries (array('d') / array('q')) and MyOperator.calculate
+
+
+class RunMemo:
+    """
+        Operator results already calculated during an AlertManager run :
+        AlertDefinitions on the same meter, period, hour window and operator calculate it once
+    """
+    __results: dict
+    __hits: int
+    __misses: int
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.__results = dict()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get_or_calculate(self, key: tuple, calculate):
+        if key in self.__results:
+            self.__hits += 1
+            print("memo hit :", key)
+            return self.__results[key]
+        self.__misses += 1
+        result = calculate()
+        self.__results[key] = result
+        return result
+
+    def summary(self) -> str:
+        return "memo : {} hits / {} misses".format(self.hits, self.misses)
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @property
+    def size(self):
+        return len(self.__results)
+
+
+run_memo = RunMemo()
+
+
+class DataPlanner:
+    """
+        Data needed by a whole run : periods of AlertData and PeriodBasedValueGenerator for each meter.
+        Overlapping or close periods of a meter are read with one scan,
+        then each calculation gets a slice of it (see HandleDataFromDB.PLANNING)
+    """
+    MAX_GAP = timedelta(hours=1)  # periods separated by less than this are merged
+
+    __requirements: dict
+    __series: dict
+    __nb_scans: int
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.__requirements = dict()
+        self.__series = dict()
+        self.__nb_scans = 0
+
+    def add(self, meter_id: int, period: Period):
+        self.__requirements.setdefault(meter_id, list()).append(period)
+
+    @staticmethod
+    def merge_periods(periods: list) -> list:
+        merged = list()
+        for period in sorted(periods, key=lambda p: p.get_start_date()):
+            if merged and period.get_start_date() <= merged[-1].get_end_date() + DataPlanner.MAX_GAP:
+                if period.get_end_date() > merged[-1].get_end_date():
+                    merged[-1] = Period(start=merged[-1].get_start_date(), end=period.get_end_date())
+            else:
+                merged.append(period)
+        return merged
+
+    def load(self):
+        """ read all merged periods - rows are kept as MeterSeries with time """
+        for meter_id, periods in self.__requirements.items():
+            for period in DataPlanner.merge_periods(periods):
+                series = HandleDataFromDB(period=period).get_raw_series_from_db(meter_id=meter_id)
+                self.__series.setdefault(meter_id, list()).append((period, series))
+                self.__nb_scans += 1
+
+    def __find(self, meter_id: int, period: Period):
+        for loaded_period, series in self.__series.get(meter_id, list()):
+            if loaded_period.get_start_date() <= period.get_start_date() \
+                    and period.get_end_date() <= loaded_period.get_end_date():
+                return series
+        return None
+
+    def has_series(self, meter_id: int, period: Period) -> bool:
+        return self.__find(meter_id=meter_id, period=period) is not None
+
+    def get_series(self, meter_id: int, period: Period):
+        """ :return: MeterSeries of the period or None if it was not planned """
+        series = self.__find(meter_id=meter_id, period=period)
+        if series is None:
+            return None
+        return series.between(start=period.get_start_date(), end=period.get_end_date())
+
+    def summary(self) -> str:
+        nb_periods = sum(len(periods) for periods in self.__requirements.values())
+        return "planner : {} periods read with {} scans".format(nb_periods, self.__nb_scans)
+
+    @property
+    def nb_scans(self):
+        return self.__nb_scans
+
+
+run_planner = DataPlanner()
+
 
 class HandleDataFromDB:
     table_name = "bi_donnescomptage"
@@ -515,56 +966,854 @@ class HandleDataFromDB:
     meter_id_column_name = "r_compteur"
     hour_column_name = "date_heure"
 
+    # BATCH - load the data period of all meters of an AlertDefinition with one query
+    BATCH_MODE = False
+    BATCH_SIZE = 500  # max number of meters in one "IN (...)" query
+
+    # PUSHDOWN - let MySQL apply the operator when no python treatment is needed on rows
+    AGGREGATION_PUSHDOWN = False
+
+    # HOUR FILTER - filter hour_start / hour_end with HOUR(date_heure) in the query
+    HOUR_FILTER_IN_QUERY = False
+
+    # INDEX DELTA - compute differences of index meters with LAG() window function (MySQL 8 needed)
+    INDEX_DELTA_IN_QUERY = False
+
+    # INTEGER TIME - select date_heure as epoch seconds : no datetime is built by the connector for each row
+    INTEGER_TIME = False
+
+    # FETCH - how rows are read from the cursor, None : picked from the estimated row count (see utils.FetchStrategy)
+    FETCH_STRATEGY = None
+    ROWS_PER_HOUR = 1  # meters send one data by hour, used to estimate the row count of a period
+
+    # CHUNKED SCAN - periods longer than a month are read by monthly chunks, in parallel over pooled connections
+    CHUNKED_SCAN = False
+    CHUNK_WORKERS = 4  # limited by MySqlConnection.POOL_SIZE
+
+    # LOCAL CACHE - model.local_cache.SeriesCache : only data after the last read are read from MySQL
+    LOCAL_CACHE = None
+
+    # PLANNING - AlertManager reads all periods of the run first with run_planner, then slices are used
+    PLANNING = False
+
+    # ROLLUP - model.rollup.Rollup : whole hours / days of long periods are read from the rollup tables,
+    # rows are only read for the partial hours at the edges of the period
+    ROLLUP = None
+    ROLLUP_MIN_HOURS = 7 * 24  # shorter periods are read from the rows
+
+    # NO DATA CACHE - model.local_cache.NoDataCache : meters without data are not scanned again
+    NO_DATA_CACHE = None
+
+    # MEMO - keep results in run_memo (reset at each AlertManager run)
+    MEMOIZE = False
+
+    # ENGINE - how rows are filtered, differentiated and reduced
+    ENGINE = CalculationEngine.PYTHON
+
     __period: Period
+    __prefetched: dict
+    __prefetched_key: tuple
+    __prefetched_aggregates: dict
+    __prefetched_aggregate_key: tuple
 
     def __init__(self, period: Period):
         self.__period = period
+        self.clear_prefetch()
 
     @staticmethod
-    def generate_query(time_needed: bool) -> str:
+    def is_time_needed(hour_start: int, hour_end: int) -> bool:
+        return bool(hour_end and hour_start)
 
-        def get_select():
-            if time_needed:
-                return "{}, {}".format(
-                    HandleDataFromDB.value_column_name, HandleDataFromDB.hour_column_name
+    @staticmethod
+    def is_hour_filter_needed(hour_start: int, hour_end: int) -> bool:
+        return bool(hour_start and hour_end and hour_end != hour_start)
+
+    @staticmethod
+    def is_hour_filter_in_query(hour_start: int, hour_end: int) -> bool:
+        return HandleDataFromDB.HOUR_FILTER_IN_QUERY and HandleDataFromDB.is_hour_filter_needed(
+            hour_start=hour_start,
+            hour_end=hour_end
+        )
+
+    @staticmethod
+    def is_time_selected(hour_start: int, hour_end: int) -> bool:
+        """ date_heure is only needed to filter hours in python """
+        return HandleDataFromDB.is_time_needed(
+            hour_start=hour_start,
+            hour_end=hour_end
+        ) and not HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end)
+
+    @staticmethod
+    def is_hour_filter_done(hour_start: int, hour_end: int) -> bool:
+        """ True if no python hour filtering is needed on rows """
+        return not HandleDataFromDB.is_hour_filter_needed(
+            hour_start=hour_start,
+            hour_end=hour_end
+        ) or HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end)
+
+    @staticmethod
+    def is_index_delta_in_query(is_index: bool, hour_start: int = None, hour_end: int = None) -> bool:
+        """
+        Differences have to be calculated on filtered rows,
+        so they can be done by MySQL only if the hour filter is also done by MySQL
+        """
+        return HandleDataFromDB.INDEX_DELTA_IN_QUERY and bool(is_index) and HandleDataFromDB.is_hour_filter_done(
+            hour_start=hour_start,
+            hour_end=hour_end
+        )
+
+    @staticmethod
+    def is_raw_rows_usable(hour_start: int = None, hour_end: int = None, index_delta: bool = False) -> bool:
+        """
+        Planner and local cache keep all rows of a meter,
+        they can not be used if rows have to be filtered or changed by MySQL
+        """
+        return not index_delta and not HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end)
+
+    @staticmethod
+    def can_push_down(is_index: bool, hour_start: int = None, hour_end: int = None) -> bool:
+        """
+        Aggregation can be done by MySQL only if rows do not need python treatment :
+        no index difference and no hour filter (unless they are done in the query)
+        """
+        if not HandleDataFromDB.AGGREGATION_PUSHDOWN:
+            return False
+        if is_index and not HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end):
+            return False
+        return HandleDataFromDB.is_hour_filter_done(hour_start=hour_start, hour_end=hour_end)
+
+    # -- QUERIES --
+
+    @staticmethod
+    def generate_time_select() -> str:
+        """
+        Naive epoch seconds of date_heure (same as model.series.to_epoch) :
+        UNIX_TIMESTAMP() is not used because it applies the session time zone
+        """
+        if HandleDataFromDB.INTEGER_TIME:
+            return "TIMESTAMPDIFF(SECOND, '1970-01-01', {})".format(HandleDataFromDB.hour_column_name)
+        return HandleDataFromDB.hour_column_name
+
+    @staticmethod
+    def __get_select(time_needed: bool) -> str:
+        if time_needed:
+            return "{}, {}".format(
+                HandleDataFromDB.value_column_name, HandleDataFromDB.generate_time_select()
+            )
+        return HandleDataFromDB.value_column_name
+
+    @staticmethod
+    def __get_aggregate_select(operator: MyOperator) -> str:
+        return "{}({}), COUNT({})".format(
+            operator.sql_function,
+            HandleDataFromDB.value_column_name,
+            HandleDataFromDB.value_column_name
+        )
+
+    @staticmethod
+    def generate_hour_condition(hour_start: int, hour_end: int) -> str:
+        """
+        SQL equivalent of is_between_hour - a window like 22h -> 6h goes past midnight
+        """
+        hour = "HOUR({})".format(HandleDataFromDB.hour_column_name)
+        if hour_start < hour_end:
+            return "{} >= %s AND {} < %s".format(hour, hour)
+        return "({} >= %s OR {} < %s)".format(hour, hour)
+
+    @staticmethod
+    def __get_where(nb_meter: int = None, hour_start: int = None, hour_end: int = None, half_open: bool = False) -> str:
+        """ :param half_open: date_heure in [start, end[ instead of BETWEEN - chunks do not share their bound """
+        if nb_meter is None:
+            meter_condition = "{} = %s".format(HandleDataFromDB.meter_id_column_name)
+        else:
+            meter_condition = "{} IN ({})".format(
+                HandleDataFromDB.meter_id_column_name,
+                ", ".join(["%s" for i in range(nb_meter)])
+            )
+        period_condition = "{} >= %s AND {} < %s" if half_open else "{} BETWEEN %s AND %s"
+        where = "{} AND {}".format(
+            meter_condition,
+            period_condition.format(HandleDataFromDB.hour_column_name, HandleDataFromDB.hour_column_name)
+        )
+        if HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end):
+            where += " AND " + HandleDataFromDB.generate_hour_condition(hour_start=hour_start, hour_end=hour_end)
+        return where
+
+    @staticmethod
+    def __get_source(nb_meter: int = None, hour_start: int = None, hour_end: int = None, index_delta: bool = False) -> str:
+        """
+        FROM / WHERE part of the queries.
+        For index_delta, rows come from a derived table where valeur is the difference with the previous row
+        """
+        where = HandleDataFromDB.__get_where(nb_meter=nb_meter, hour_start=hour_start, hour_end=hour_end)
+        if not index_delta:
+            return "{} WHERE {}".format(HandleDataFromDB.table_name, where)
+
+        return "(SELECT {meter}, {hour}, {value} - LAG({value}) OVER (PARTITION BY {meter} ORDER BY {hour}) AS {value} " \
+               "FROM {table} WHERE {where}) AS deltas WHERE {value} IS NOT NULL".format(
+                    meter=HandleDataFromDB.meter_id_column_name,
+                    hour=HandleDataFromDB.hour_column_name,
+                    value=HandleDataFromDB.value_column_name,
+                    table=HandleDataFromDB.table_name,
+                    where=where
                 )
-            return HandleDataFromDB.value_column_name
 
-        query = "SELECT {} FROM {} WHERE {} = %s AND {} BETWEEN %s AND %s".format(
-            get_select(),
+    @staticmethod
+    def generate_query(time_needed: bool, hour_start: int = None, hour_end: int = None, index_delta: bool = False) -> str:
+        query = "SELECT {} FROM {}".format(
+            HandleDataFromDB.__get_select(time_needed=time_needed),
+            HandleDataFromDB.__get_source(hour_start=hour_start, hour_end=hour_end, index_delta=index_delta)
+        )
+        if index_delta:
+            query += " ORDER BY {}".format(HandleDataFromDB.hour_column_name)
+        return query
+
+    @staticmethod
+    def generate_chunk_query(time_needed: bool, hour_start: int = None, hour_end: int = None, half_open: bool = True) -> str:
+        """ query of one chunk of the period, ordered so differences can be joined between chunks """
+        return "SELECT {} FROM {} WHERE {} ORDER BY {}".format(
+            HandleDataFromDB.__get_select(time_needed=time_needed),
             HandleDataFromDB.table_name,
+            HandleDataFromDB.__get_where(hour_start=hour_start, hour_end=hour_end, half_open=half_open),
+            HandleDataFromDB.hour_column_name
+        )
+
+    @staticmethod
+    def generate_batch_query(time_needed: bool,
+                             nb_meter: int,
+                             hour_start: int = None,
+                             hour_end: int = None,
+                             index_delta: bool = False) -> str:
+        query = "SELECT {}, {} FROM {} ORDER BY {}, {}".format(
+            HandleDataFromDB.meter_id_column_name,
+            HandleDataFromDB.__get_select(time_needed=time_needed),
+            HandleDataFromDB.__get_source(
+                nb_meter=nb_meter,
+                hour_start=hour_start,
+                hour_end=hour_end,
+                index_delta=index_delta
+            ),
             HandleDataFromDB.meter_id_column_name,
             HandleDataFromDB.hour_column_name
         )
         return query
 
-    def __get_query_result(self, meter_id: int, time_needed: bool):
-        cursor = my_sql.generate_cursor()
-        print("Time needed :", time_needed)
+    @staticmethod
+    def generate_aggregate_query(operator: MyOperator,
+                                 nb_meter: int = None,
+                                 hour_start: int = None,
+                                 hour_end: int = None,
+                                 index_delta: bool = False) -> str:
+        source = HandleDataFromDB.__get_source(
+            nb_meter=nb_meter,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        if nb_meter is None:
+            return "SELECT {} FROM {}".format(
+                HandleDataFromDB.__get_aggregate_select(operator=operator),
+                source
+            )
+        return "SELECT {}, {} FROM {} GROUP BY {}".format(
+            HandleDataFromDB.meter_id_column_name,
+            HandleDataFromDB.__get_aggregate_select(operator=operator),
+            source,
+            HandleDataFromDB.meter_id_column_name
+        )
 
-        query = HandleDataFromDB.generate_query(time_needed=time_needed)
-        params = (
-                meter_id,
-                self.__period.get_start_date(),
-                self.__period.get_end_date()
+    def __get_params(self, meter_ids: list, hour_start: int = None, hour_end: int = None, period: Period = None) -> tuple:
+        period = period if period else self.__period
+        params = tuple(meter_ids) + (period.get_start_date(), period.get_end_date())
+        if HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end):
+            params += (hour_start, hour_end)
+        return params
+
+    # -- FETCH --
+
+    def estimate_row_count(self, nb_meter: int = 1, period: Period = None) -> int:
+        period = period if period else self.__period
+        hours = (period.get_end_date() - period.get_start_date()) // timedelta(hours=1) + 1
+        return max(hours, 0) * HandleDataFromDB.ROWS_PER_HOUR * nb_meter
+
+    @staticmethod
+    def get_fetch_strategy(estimated_row_count: int) -> FetchStrategy:
+        if HandleDataFromDB.FETCH_STRATEGY:
+            return HandleDataFromDB.FETCH_STRATEGY
+        return FetchStrategy.from_row_count(estimated_row_count)
+
+    # -- CHUNKED SCAN --
+
+    @staticmethod
+    def split_period(period: Period) -> list:
+        """ split the period at the first day of each month """
+        chunks = list()
+        start = period.get_start_date()
+        while True:
+            next_start = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+            if next_start >= period.get_end_date():
+                chunks.append(Period(start=start, end=period.get_end_date()))
+                return chunks
+            chunks.append(Period(start=start, end=next_start))
+            start = next_start
+
+    def is_chunked_scan_needed(self, meter_id: int) -> bool:
+        return HandleDataFromDB.CHUNKED_SCAN \
+               and HandleDataFromDB.LOCAL_CACHE is None \
+               and meter_id not in self.__prefetched \
+               and len(HandleDataFromDB.split_period(self.__period)) > 1
+
+    def __scan_chunk(self, meter_id: int, is_index: bool, operator: MyOperator, chunk: Period, is_last: bool,
+                     hour_start: int = None, hour_end: int = None) -> tuple:
+        """
+        Read one chunk on its own pooled connection
+
+        :return: (accumulator of the chunk data, first data, last data) - first and last are None if no data
+        """
+        time_needed = HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end)
+        filter_done = HandleDataFromDB.is_hour_filter_done(hour_start=hour_start, hour_end=hour_end)
+        query = HandleDataFromDB.generate_chunk_query(
+            time_needed=time_needed,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            half_open=not is_last
         )
+        params = self.__get_params(meter_ids=[meter_id], hour_start=hour_start, hour_end=hour_end, period=chunk)
+        print("chunk query :", query)
+        print("chunk params :", params)
+
+        accumulator = operator.accumulator()
+        first = last = None
+        connection = my_sql.get_pooled_connection()
+        try:
+            estimated_row_count = self.estimate_row_count(period=chunk)
+            fetch_strategy = HandleDataFromDB.get_fetch_strategy(estimated_row_count)
+            cursor = connection.cursor(buffered=fetch_strategy.buffered)
+            cursor.execute(operation=query, params=params)
+            for row in fetch_rows(cursor, fetch_strategy=fetch_strategy, estimated_row_count=estimated_row_count):
+                if not filter_done and not self.is_between_hour(row[1], hour_start=hour_start, hour_end=hour_end):
+                    continue
+                data = row[0]
+                if not is_index:
+                    accumulator.add(data)
+                elif last is not None:
+                    accumulator.add(data - last)
+                if first is None:
+                    first = data
+                last = data
+            cursor.close()
+        finally:
+            connection.close()
+        return accumulator, first, last
 
+    @staticmethod
+    def combine_chunks(partials: list, is_index: bool, operator: MyOperator):
+        """
+        Combine chunk results in period order : accumulators are merged (max of maxes, exact sums for the average)
+        and for index meters the difference between the last data of a chunk and the first of the next one is added
+        """
+        accumulator = operator.accumulator()
+        previous_last = None
+        for partial, first, last in partials:
+            if first is None:
+                continue
+            if is_index and previous_last is not None:
+                accumulator.add(first - previous_last)
+            accumulator.merge(partial)
+            previous_last = last
+        return accumulator
+
+    def calculate_by_chunks(self, meter_id: int, is_index: bool, operator: MyOperator,
+                            hour_start: int = None, hour_end: int = None):
+        """ same result as one scan of the period, see combine_chunks """
+        chunks = HandleDataFromDB.split_period(self.__period)
+        workers = min(HandleDataFromDB.CHUNK_WORKERS, utils.MySqlConnection.POOL_SIZE, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self.__scan_chunk,
+                    meter_id=meter_id,
+                    is_index=is_index,
+                    operator=operator,
+                    chunk=chunk,
+                    is_last=i == len(chunks) - 1,
+                    hour_start=hour_start,
+                    hour_end=hour_end
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+            partials = [future.result() for future in futures]
+        accumulator = HandleDataFromDB.combine_chunks(partials=partials, is_index=is_index, operator=operator)
+        print("data from db :", accumulator.count, "values in", len(chunks), "chunks")
+        return accumulator.result
+
+    # -- ROLLUP --
+
+    def get_rollup_range(self, meter_id: int):
+        """ :return: (low, high) part of the period read from the rollups, None if they are not used """
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        if HandleDataFromDB.ROLLUP is None \
+                or meter_id in self.__prefetched \
+                or end - start < timedelta(hours=HandleDataFromDB.ROLLUP_MIN_HOURS):
+            return None
+        return HandleDataFromDB.ROLLUP.get_covered_range(start=start, end=end)
+
+    def calculate_from_rollup(self, meter_id: int, is_index: bool, operator: MyOperator, covered: tuple,
+                              hour_start: int = None, hour_end: int = None):
+        """
+        Same result as one scan of the period : buckets of the covered range and rows of the edges
+        are combined in period order like chunks (see combine_chunks).
+        Day buckets are only used without hour filter, hour buckets are filtered on their hour
+        """
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        low, high = covered
+        filter_needed = HandleDataFromDB.is_hour_filter_needed(hour_start=hour_start, hour_end=hour_end)
+
+        partials = [self.__scan_chunk(
+            meter_id=meter_id,
+            is_index=is_index,
+            operator=operator,
+            chunk=Period(start=start, end=low),
+            is_last=False,
+            hour_start=hour_start,
+            hour_end=hour_end
+        )] if start < low else []
+
+        buckets = HandleDataFromDB.ROLLUP.get_buckets(meter_id=meter_id, start=low, end=high, whole_days=not filter_needed)
+        for bucket in buckets:
+            if filter_needed and not self.is_between_hour(bucket.bucket, hour_start=hour_start, hour_end=hour_end):
+                continue
+            accumulator = operator.accumulator()
+            if is_index:
+                accumulator.merge_summary(bucket.delta_count, bucket.delta_min, bucket.delta_max, bucket.delta_total)
+            else:
+                accumulator.merge_summary(bucket.count, bucket.minimum, bucket.maximum, bucket.total)
+            partials.append((accumulator, bucket.first, bucket.last))
+
+        partials.append(self.__scan_chunk(
+            meter_id=meter_id,
+            is_index=is_index,
+            operator=operator,
+            chunk=Period(start=high, end=end),
+            is_last=True,
+            hour_start=hour_start,
+            hour_end=hour_end
+        ))
+        accumulator = HandleDataFromDB.combine_chunks(partials=partials, is_index=is_index, operator=operator)
+        print("data from db :", accumulator.count, "values with", len(buckets), "rollup buckets")
+        return accumulator.result
+
+    # -- PLANNER / LOCAL CACHE --
+
+    def is_planned(self, meter_id: int, is_index: bool, hour_start: int = None, hour_end: int = None) -> bool:
+        """ True if the rows of the period were read by run_planner and can be used for these filters """
+        if not HandleDataFromDB.PLANNING:
+            return False
+        index_delta = HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        if not HandleDataFromDB.is_raw_rows_usable(hour_start=hour_start, hour_end=hour_end, index_delta=index_delta):
+            return False
+        return run_planner.has_series(meter_id=meter_id, period=self.__period)
+
+    def __get_local_series(self, meter_id: int, hour_start: int = None, hour_end: int = None, index_delta: bool = False):
+        """ :return: all rows of the period already read by run_planner or from the local cache, None if not found """
+        if not HandleDataFromDB.is_raw_rows_usable(hour_start=hour_start, hour_end=hour_end, index_delta=index_delta):
+            return None
+        if HandleDataFromDB.PLANNING:
+            series = run_planner.get_series(meter_id=meter_id, period=self.__period)
+            if series is not None:
+                print("planned data used for meter", meter_id)
+                return series
+        if HandleDataFromDB.LOCAL_CACHE is not None:
+            return self.__get_cached_series(meter_id=meter_id)
+        return None
+
+    def get_raw_series_from_db(self, meter_id: int) -> MeterSeries:
+        """ all rows of the period with time, no filter """
+        return self.__get_series(meter_id=meter_id, time_needed=True, hour_start=None, hour_end=None, index_delta=False)
+
+    def __get_cached_series(self, meter_id: int) -> MeterSeries:
+        """ read the missing part of the period from MySQL (up to now), save it in the cache and load the period """
+        cache = HandleDataFromDB.LOCAL_CACHE
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        missing = cache.get_missing_range(meter_id=meter_id, start=start, end=end)
+        if missing:
+            missing_period = Period(start=missing[0], end=min(missing[1], datetime.today()))
+            if missing_period.get_start_date() <= missing_period.get_end_date():
+                print("cache : read", missing_period, "for meter", meter_id)
+                rows = self.__execute(
+                    query=HandleDataFromDB.generate_chunk_query(time_needed=True, half_open=False),
+                    params=self.__get_params(meter_ids=[meter_id], period=missing_period),
+                    estimated_row_count=self.estimate_row_count(period=missing_period)
+                )
+                cache.store(
+                    meter_id=meter_id,
+                    series=MeterSeries.from_rows(rows, time_needed=True),
+                    start=missing_period.get_start_date(),
+                    end=missing_period.get_end_date()
+                )
+        return cache.load(meter_id=meter_id, start=start, end=end)
+
+    # -- NO DATA --
+
+    @staticmethod
+    def generate_last_data_query() -> str:
+        return "SELECT MAX({hour}) FROM {table} WHERE {meter} = %s AND {hour} <= %s".format(
+            hour=HandleDataFromDB.hour_column_name,
+            table=HandleDataFromDB.table_name,
+            meter=HandleDataFromDB.meter_id_column_name
+        )
+
+    @staticmethod
+    def generate_exists_query() -> str:
+        return "SELECT 1 FROM {table} WHERE {meter} = %s AND {hour} > %s AND {hour} <= %s LIMIT 1".format(
+            hour=HandleDataFromDB.hour_column_name,
+            table=HandleDataFromDB.table_name,
+            meter=HandleDataFromDB.meter_id_column_name
+        )
+
+    def __fetch_one(self, query: str, params: tuple):
         print("query :", query)
         print("params :", params)
-
+        cursor = my_sql.generate_cursor()
         cursor.execute(operation=query, params=params)
+        result = cursor.fetchall()
+        cursor.close()
+        return result[0] if result else None
 
-        result = list()
-        for row in iter_row(cursor, 10):
-            if time_needed:
-                result.append(row)
+    def __is_known_without_data(self, meter_id: int) -> bool:
+        """
+        True if the meter had no row in the period at its last check, and still has no row after it
+        (only an existence check on the rows after checked_until)
+        """
+        cache = HandleDataFromDB.NO_DATA_CACHE
+        known = cache.get(meter_id=meter_id)
+        if not known:
+            return False
+        last_data, checked_until = known
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        if last_data is not None and start <= last_data:
+            return False
+        if end > checked_until:
+            if self.__fetch_one(query=HandleDataFromDB.generate_exists_query(), params=(meter_id, checked_until, end)):
+                cache.invalidate(meter_id=meter_id)
+                return False
+            cache.put(meter_id=meter_id, last_data=last_data, checked_until=max(checked_until, min(end, datetime.today())))
+        print("no data cache : no data for meter", meter_id)
+        cache.add_run_meter(meter_id=meter_id)
+        return True
+
+    def __remember_if_no_data(self, meter_id: int):
+        """ remember the meter only if it has no row at all in the period (not just filtered rows) """
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        last_data = self.__fetch_one(query=HandleDataFromDB.generate_last_data_query(), params=(meter_id, end))[0]
+        if last_data is None or last_data < start:
+            HandleDataFromDB.NO_DATA_CACHE.put(meter_id=meter_id, last_data=last_data, checked_until=min(end, datetime.today()))
+
+    # -- BASELINE --
+
+    def __get_slice_accumulator(self, meter_id: int, operator: MyOperator, start: datetime, end: datetime,
+                                include_start: bool, include_end: bool, hour_start: int = None, hour_end: int = None):
+        """ accumulator of the data between start and end (bounds included or not) """
+        series = HandleDataFromDB(period=Period(start=start, end=end)).get_raw_series_from_db(meter_id=meter_id)
+        low, high = to_epoch(start), to_epoch(end)
+        filter_needed = HandleDataFromDB.is_hour_filter_needed(hour_start=hour_start, hour_end=hour_end)
+        accumulator = operator.accumulator()
+        for value, epoch in zip(series.values, series.epochs):
+            if (epoch > low or include_start and epoch == low) and (epoch < high or include_end and epoch == high) \
+                    and (not filter_needed or self.is_between_hour(epoch, hour_start=hour_start, hour_end=hour_end)):
+                accumulator.add(value)
+        return accumulator
+
+    def __calculate_accumulator(self, meter_id: int, is_index: bool, operator: MyOperator,
+                                hour_start: int = None, hour_end: int = None):
+        accumulator = operator.accumulator()
+        for data in self.iter_data_from_db(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end):
+            accumulator.add(data)
+        return accumulator
+
+    def __update_baseline(self, baseline: Baseline, meter_id: int, operator: MyOperator,
+                          hour_start: int = None, hour_end: int = None) -> bool:
+        """
+        Move the baseline to the period : remove the oldest slice and add the newest one.
+        Not possible if the periods do not overlap or if the operator result was in the oldest slice (MAX / MIN)
+        """
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        if start < baseline.start or end < baseline.end or start > baseline.end:
+            return False
+        removed = self.__get_slice_accumulator(
+            meter_id=meter_id,
+            operator=operator,
+            start=baseline.start,
+            end=start,
+            include_start=True,
+            include_end=False,
+            hour_start=hour_start,
+            hour_end=hour_end
+        )
+        if not baseline.accumulator.remove(removed):
+            return False
+        baseline.accumulator.merge(self.__get_slice_accumulator(
+            meter_id=meter_id,
+            operator=operator,
+            start=baseline.end,
+            end=end,
+            include_start=False,
+            include_end=True,
+            hour_start=hour_start,
+            hour_end=hour_end
+        ))
+        baseline.start, baseline.end = start, end
+        return True
+
+    def calculate_baseline(self, meter_id: int, is_index: bool, operator: MyOperator, cache: BaselineCache, key: tuple,
+                           hour_start: int = None, hour_end: int = None):
+        """
+        calculate_from_db with a BaselineCache :
+        - a baseline of about the same period (BaselineCache.TOLERANCE) is used as it is
+        - else it is updated by slices, except for index meters (differences between slices)
+        - else the whole period is calculated
+
+        :return: same as calculate_from_db (float or None), with MEMOIZE and NO_DATA_CACHE
+        """
+        return self.__calculate_with_caches(
+            meter_id=meter_id,
+            is_index=is_index,
+            operator=operator,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            calculate=lambda: self.__calculate_baseline(
+                meter_id=meter_id,
+                is_index=is_index,
+                operator=operator,
+                cache=cache,
+                key=key,
+                hour_start=hour_start,
+                hour_end=hour_end
+            )
+        )
+
+    def __calculate_baseline(self, meter_id: int, is_index: bool, operator: MyOperator, cache: BaselineCache,
+                             key: tuple, hour_start: int = None, hour_end: int = None):
+        start, end = self.__period.get_start_date(), self.__period.get_end_date()
+        baseline = cache.get(key=key, accumulator=operator.accumulator)
+        if baseline and cache.is_fresh(baseline=baseline, start=start, end=end):
+            print("baseline cache : used for", key)
+            return baseline.value
+
+        if baseline and not is_index and self.__update_baseline(
+                baseline=baseline,
+                meter_id=meter_id,
+                operator=operator,
+                hour_start=hour_start,
+                hour_end=hour_end
+        ):
+            print("baseline cache : updated for", key)
+        else:
+            print("baseline cache : calculated for", key)
+            baseline = Baseline(
+                start=start,
+                end=end,
+                accumulator=self.__calculate_accumulator(
+                    meter_id=meter_id,
+                    is_index=is_index,
+                    operator=operator,
+                    hour_start=hour_start,
+                    hour_end=hour_end
+                )
+            )
+        cache.put(key=key, baseline=baseline)
+        return baseline.value
+
+    # -- BATCH --
+
+    def prefetch(self, meters: list, operator: MyOperator, hour_start: int = None, hour_end: int = None):
+        """
+        Load the data period of all meters with "IN (...)" queries (BATCH_SIZE meters per query).
+        Results are split per meter in memory and then served by calculate_from_db and get_data_from_db
+
+        :param meters list of (meter_id, is_index)
+        :param operator operator that will be applied on data
+        :param hour_start start of the hour filter
+        :param hour_end end of the hour filter
+
+        """
+        self.clear_prefetch()
+        self.__prefetched_aggregate_key = (operator, hour_start, hour_end)
+        self.__prefetched_key = (
+            HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end),
+            hour_start,
+            hour_end
+        )
+
+        # Group meters by the query they need
+        groups = dict()
+        for meter_id, is_index in meters:
+            key = (
+                HandleDataFromDB.can_push_down(is_index=bool(is_index), hour_start=hour_start, hour_end=hour_end),
+                HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+            )
+            groups.setdefault(key, list()).append(meter_id)
+
+        for (aggregate, index_delta), meter_ids in groups.items():
+            if aggregate:
+                self.__prefetch_aggregates(
+                    meter_ids=meter_ids,
+                    operator=operator,
+                    hour_start=hour_start,
+                    hour_end=hour_end,
+                    index_delta=index_delta
+                )
             else:
-                result.append(row[0])
+                self.__prefetch_rows(
+                    meter_ids=meter_ids,
+                    hour_start=hour_start,
+                    hour_end=hour_end,
+                    index_delta=index_delta
+                )
+
+    def __prefetch_aggregates(self, meter_ids: list, operator: MyOperator, hour_start: int, hour_end: int, index_delta: bool):
+        for meter_id in meter_ids:
+            self.__prefetched_aggregates[meter_id] = (None, 0)
+        for chunk in HandleDataFromDB.__chunks(meter_ids):
+            query = HandleDataFromDB.generate_aggregate_query(
+                operator=operator,
+                nb_meter=len(chunk),
+                hour_start=hour_start,
+                hour_end=hour_end,
+                index_delta=index_delta
+            )
+            params = self.__get_params(meter_ids=chunk, hour_start=hour_start, hour_end=hour_end)
+            for row in self.__execute(query=query, params=params, estimated_row_count=len(chunk)):
+                self.__prefetched_aggregates[row[0]] = row[1:]
+
+    def __prefetch_rows(self, meter_ids: list, hour_start: int, hour_end: int, index_delta: bool):
+        time_needed = HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end)
+        for meter_id in meter_ids:
+            self.__prefetched[meter_id] = list()
+        for chunk in HandleDataFromDB.__chunks(meter_ids):
+            query = HandleDataFromDB.generate_batch_query(
+                time_needed=time_needed,
+                nb_meter=len(chunk),
+                hour_start=hour_start,
+                hour_end=hour_end,
+                index_delta=index_delta
+            )
+            params = self.__get_params(meter_ids=chunk, hour_start=hour_start, hour_end=hour_end)
+            for row in self.__execute(query=query, params=params, estimated_row_count=self.estimate_row_count(len(chunk))):
+                rows = self.__prefetched.setdefault(row[0], list())
+                rows.append(row[1:] if time_needed else row[1])
+
+    def clear_prefetch(self):
+        self.__prefetched = dict()
+        self.__prefetched_key = None
+        self.__prefetched_aggregates = dict()
+        self.__prefetched_aggregate_key = None
+
+    @staticmethod
+    def __chunks(meter_ids: list):
+        i = 0
+        while i < len(meter_ids):
+            yield meter_ids[i:i + HandleDataFromDB.BATCH_SIZE]
+            i += HandleDataFromDB.BATCH_SIZE
+
+    @staticmethod
+    def __execute(query: str, params: tuple, estimated_row_count: int = None):
+        print("query :", query)
+        print("params :", params)
+
+        fetch_strategy = HandleDataFromDB.get_fetch_strategy(estimated_row_count)
+        cursor = my_sql.generate_cursor(fetch_strategy=fetch_strategy)
+        cursor.execute(operation=query, params=params)
+        for row in fetch_rows(cursor, fetch_strategy=fetch_strategy, estimated_row_count=estimated_row_count):
+            yield row
+        cursor.close()
+
+    # -- RESULTS --
+
+    def __get_query_result(self,
+                           meter_id: int,
+                           time_needed: bool,
+                           hour_start: int = None,
+                           hour_end: int = None,
+                           index_delta: bool = False):
+        if meter_id in self.__prefetched and (time_needed, hour_start, hour_end) == self.__prefetched_key:
+            print("prefetched result used for meter", meter_id)
+            return self.__prefetched.pop(meter_id)
+
+        result = list(self.__iter_query_result(
+            meter_id=meter_id,
+            time_needed=time_needed,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        ))
 
         print("result :", result)
 
         return result
 
+    def __iter_query_result(self,
+                            meter_id: int,
+                            time_needed: bool,
+                            hour_start: int = None,
+                            hour_end: int = None,
+                            index_delta: bool = False):
+        if meter_id in self.__prefetched and (time_needed, hour_start, hour_end) == self.__prefetched_key:
+            print("prefetched result used for meter", meter_id)
+            yield from self.__prefetched.pop(meter_id)
+            return
+
+        series = self.__get_local_series(meter_id=meter_id, hour_start=hour_start, hour_end=hour_end, index_delta=index_delta)
+        if series is not None:
+            yield from zip(series.values, series.epochs) if time_needed else series.values
+            return
+
+        estimated_row_count = self.estimate_row_count()
+        fetch_strategy = HandleDataFromDB.get_fetch_strategy(estimated_row_count)
+        cursor = my_sql.generate_cursor(fetch_strategy=fetch_strategy)
+        print("Time needed :", time_needed, "- fetch :", fetch_strategy)
+
+        query = HandleDataFromDB.generate_query(
+            time_needed=time_needed,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        params = self.__get_params(meter_ids=[meter_id], hour_start=hour_start, hour_end=hour_end)
+
+        print("query :", query)
+        print("params :", params)
+
+        cursor.execute(operation=query, params=params)
+
+        for row in fetch_rows(cursor, fetch_strategy=fetch_strategy, estimated_row_count=estimated_row_count):
+            if time_needed:
+                yield row
+            else:
+                yield row[0]
+        cursor.close()
+
+    def __get_aggregate_result(self,
+                               meter_id: int,
+                               operator: MyOperator,
+                               hour_start: int = None,
+                               hour_end: int = None,
+                               index_delta: bool = False) -> tuple:
+        if meter_id in self.__prefetched_aggregates and (operator, hour_start, hour_end) == self.__prefetched_aggregate_key:
+            print("prefetched aggregate used for meter", meter_id)
+            return self.__prefetched_aggregates.pop(meter_id)
+
+        query = HandleDataFromDB.generate_aggregate_query(
+            operator=operator,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        params = self.__get_params(meter_ids=[meter_id], hour_start=hour_start, hour_end=hour_end)
+        result = list(self.__execute(query=query, params=params))
+        print("result :", result)
+        return result[0] if result else (None, 0)
+
     def __aggregate_result(self, result):
         agg = list()
         i = 1
@@ -573,8 +1822,20 @@ class HandleDataFromDB:
             i += 1
         return agg
 
-    def is_between_hour(self, time: datetime, hour_start: int, hour_end: int):
-        hour = time.hour
+    @staticmethod
+    def __iter_aggregate_result(results):
+        """ generator version of __aggregate_result """
+        previous = None
+        first = True
+        for result in results:
+            if not first:
+                yield result - previous
+            previous = result
+            first = False
+
+    def is_between_hour(self, time: Union[datetime, int], hour_start: int, hour_end: int):
+        """ :param time: datetime or epoch seconds (INTEGER_TIME) """
+        hour = hour_of_epoch(time) if isinstance(time, int) else time.hour
         if hour_start < hour_end:
             return hour_start <= hour < hour_end
         if hour >= hour_end:
@@ -582,13 +1843,230 @@ class HandleDataFromDB:
         return True
 
     def get_data_from_db(self, meter_id: int, is_index: bool, hour_start: int = None, hour_end: int = None,):
-        results = self.__get_query_result(meter_id=meter_id, time_needed=bool(hour_end and hour_start))
-        if hour_start and hour_end and hour_end != hour_start:
+        index_delta = HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        results = self.__get_query_result(
+            meter_id=meter_id,
+            time_needed=HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end),
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        if HandleDataFromDB.is_hour_filter_needed(
+                hour_start=hour_start,
+                hour_end=hour_end
+        ) and not HandleDataFromDB.is_hour_filter_in_query(hour_start=hour_start, hour_end=hour_end):
             results = [result[0] for result in results if self.is_between_hour(result[1], hour_start=hour_start, hour_end=hour_end)]
-        if is_index:
+        if is_index and not index_delta:
             results = self.__aggregate_result(result=results)
         return results
 
+    def iter_data_from_db(self, meter_id: int, is_index: bool, hour_start: int = None, hour_end: int = None):
+        """
+        Generator version of get_data_from_db (CalculationEngine.STREAMING) :
+        filter -> difference are applied on each row while the cursor is read, nothing is stored
+        """
+        index_delta = HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        results = self.__iter_query_result(
+            meter_id=meter_id,
+            time_needed=HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end),
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        if not HandleDataFromDB.is_hour_filter_done(hour_start=hour_start, hour_end=hour_end):
+            results = (
+                result[0] for result in results if self.is_between_hour(result[1], hour_start=hour_start, hour_end=hour_end)
+            )
+        if is_index and not index_delta:
+            results = HandleDataFromDB.__iter_aggregate_result(results)
+        return results
+
+    def __get_series(self, meter_id: int, time_needed: bool, hour_start: int, hour_end: int, index_delta: bool):
+        return MeterSeries.from_rows(
+            rows=self.__iter_query_result(
+                meter_id=meter_id,
+                time_needed=time_needed,
+                hour_start=hour_start,
+                hour_end=hour_end,
+                index_delta=index_delta
+            ),
+            time_needed=time_needed
+        )
+
+    def get_series_from_db(self, meter_id: int, is_index: bool, hour_start: int = None, hour_end: int = None):
+        """
+        MeterSeries version of get_data_from_db (CalculationEngine.SERIES) : rows are read into arrays, no list is made
+
+        :return: MeterSeries of the data - with time if it was selected
+        """
+        index_delta = HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        series = self.__get_series(
+            meter_id=meter_id,
+            time_needed=HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end),
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        if not HandleDataFromDB.is_hour_filter_done(hour_start=hour_start, hour_end=hour_end):
+            series = series.hour_mask(hour_start=hour_start, hour_end=hour_end)
+        if is_index and not index_delta:
+            series = series.delta()
+        return series
+
+    def get_arrays_from_db(self, meter_id: int, is_index: bool, hour_start: int = None, hour_end: int = None):
+        """
+        Vectorized get_data_from_db (CalculationEngine.NUMPY)
+
+        :return: float64 array of the data
+        """
+        index_delta = HandleDataFromDB.is_index_delta_in_query(is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        time_needed = HandleDataFromDB.is_time_selected(hour_start=hour_start, hour_end=hour_end)
+        series = self.__get_series(
+            meter_id=meter_id,
+            time_needed=time_needed,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            index_delta=index_delta
+        )
+        values, epochs = vectorized.load_series(series)
+        if time_needed:
+            if not HandleDataFromDB.is_hour_filter_done(hour_start=hour_start, hour_end=hour_end):
+                values = values[vectorized.hour_mask(epochs, hour_start=hour_start, hour_end=hour_end)]
+        if is_index and not index_delta:
+            values = vectorized.diff(values)
+        return values
+
+    def calculate_from_db(self,
+                          meter_id: int,
+                          is_index: bool,
+                          operator: MyOperator,
+                          hour_start: int = None,
+                          hour_end: int = None,
+                          engine: CalculationEngine = None):
+        """
+        Apply the operator on the data of the period
+
+        :param engine default is HandleDataFromDB.ENGINE
+        :return: operator result as a float - same type whatever the engine / cache (MeterSeries keeps floats,
+        the connector gives Decimal / int) - or None if no data found
+        """
+        return self.__calculate_with_caches(
+            meter_id=meter_id,
+            is_index=is_index,
+            operator=operator,
+            hour_start=hour_start,
+            hour_end=hour_end,
+            calculate=lambda: self.__calculate_from_db(
+                meter_id=meter_id,
+                is_index=is_index,
+                operator=operator,
+                hour_start=hour_start,
+                hour_end=hour_end,
+                engine=engine
+            )
+        )
+
+    def __calculate_with_caches(self, meter_id: int, is_index: bool, operator: MyOperator, hour_start: int,
+                                hour_end: int, calculate):
+        """ calculate() with NO_DATA_CACHE and run_memo (MEMOIZE), its result as a float """
+        def calculate_float():
+            if HandleDataFromDB.NO_DATA_CACHE is not None and self.__is_known_without_data(meter_id=meter_id):
+                return None
+            result = calculate()
+            if result is None:
+                if HandleDataFromDB.NO_DATA_CACHE is not None:
+                    self.__remember_if_no_data(meter_id=meter_id)
+                return None
+            return float(result)
+
+        if not HandleDataFromDB.MEMOIZE:
+            return calculate_float()
+        key = (
+            meter_id,
+            self.__period.get_start_date(),
+            self.__period.get_end_date(),
+            hour_start,
+            hour_end,
+            bool(is_index),
+            operator
+        )
+        return run_memo.get_or_calculate(key=key, calculate=calculate_float)
+
+    def __calculate_from_db(self,
+                            meter_id: int,
+                            is_index: bool,
+                            operator: MyOperator,
+                            hour_start: int = None,
+                            hour_end: int = None,
+                            engine: CalculationEngine = None):
+        engine = engine if engine else HandleDataFromDB.ENGINE
+
+        # rows already read by run_planner : the pushdown / rollup / chunked paths would read MySQL again
+        planned = self.is_planned(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+
+        if not planned and HandleDataFromDB.can_push_down(is_index=is_index, hour_start=hour_start, hour_end=hour_end):
+            value, count = self.__get_aggregate_result(
+                meter_id=meter_id,
+                operator=operator,
+                hour_start=hour_start,
+                hour_end=hour_end,
+                index_delta=HandleDataFromDB.is_index_delta_in_query(
+                    is_index=is_index,
+                    hour_start=hour_start,
+                    hour_end=hour_end
+                )
+            )
+            return value if count else None
+
+        covered = None if planned else self.get_rollup_range(meter_id=meter_id)
+        if covered:
+            return self.calculate_from_rollup(
+                meter_id=meter_id,
+                is_index=is_index,
+                operator=operator,
+                covered=covered,
+                hour_start=hour_start,
+                hour_end=hour_end
+            )
+
+        if not planned and self.is_chunked_scan_needed(meter_id=meter_id):
+            return self.calculate_by_chunks(
+                meter_id=meter_id,
+                is_index=is_index,
+                operator=operator,
+                hour_start=hour_start,
+                hour_end=hour_end
+            )
+
+        if engine is CalculationEngine.STREAMING:
+            accumulator = operator.accumulator()
+            for data in self.iter_data_from_db(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end):
+                accumulator.add(data)
+            print("data from db :", accumulator.count, "values")
+            return accumulator.result
+
+        if engine is CalculationEngine.SERIES:
+            series = self.get_series_from_db(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+            print("data from db :", series)
+            if not len(series):
+                return None
+            return operator.calculate(series)
+
+        if engine is CalculationEngine.NUMPY:
+            if not vectorized.is_numpy_available():
+                raise ConfigError(obj=self, msg="numpy is needed by {}".format(engine))
+            values = self.get_arrays_from_db(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+            print("data from db :", values)
+            if not len(values):
+                return None
+            return operator.calculate_array(values)
+
+        results = self.get_data_from_db(meter_id=meter_id, is_index=is_index, hour_start=hour_start, hour_end=hour_end)
+        print("data from db :", results)
+        if not results:
+            return None
+        return operator.calculate(results)
+
 
 # ------------------   [ FACTORY Class ]   ---------------------
 
@@ -736,14 +2214,28 @@ class AlertCalculator:
             )
         return self.alert_value.value
 
+    # -- Load data of all meters at once (HandleDataFromDB.BATCH_MODE) --
+    def prefetch(self, meters: list):
+        self.__alert_data.prefetch(meters=meters, operator=self.__operator)
+        self.__alert_value.prefetch(meters=meters)
+
+    def clear_prefetch(self):
+        self.__alert_data.clear_prefetch()
+        self.__alert_value.clear_prefetch()
+
+    def is_objective_needed(self) -> bool:
+        return isinstance(self.__alert_value.value_generator, SimpleDBBasedValueGenerator)
+
+    def get_periods(self) -> list:
+        """ Periods of data needed in db by this calculator (for DataPlanner) """
+        return [period for period in (self.__alert_data.get_period(), self.__alert_value.get_period()) if period]
+
     def is_alert_situation(self, meter_id: int, is_index: bool) -> bool:
         print("\n --- Calculate Data ---")
-        data_from_db = self.alert_data.get_all_data_in_db(meter_id=meter_id, is_index=is_index)
-        print("data from db :", data_from_db)
-        if not data_from_db:
+        print("operator :", self.__operator.name, "engine :", HandleDataFromDB.ENGINE.name)
+        self.__data = self.alert_data.calculate_data_in_db(meter_id=meter_id, is_index=is_index, operator=self.__operator)
+        if self.__data is None:
             raise NoDataFoundInDatabase("no data found in db for meter id {}".format(meter_id))
-        print("operator :", self.__operator.name)
-        self.__data = self.__operator.calculate(data_from_db)
         print("____________________  DATA  :", self.__data)
 
         self.__value = self.__get_value(meter_id=meter_id, is_index=is_index)
@@ -1044,19 +2536,25 @@ class Email:
     __config: dict
     __message: MIMEMultipart
     __email_content: str
+    __template: CompiledTemplate
 
     def __init__(self):
         pass
 
     def prepare(self, filename: str):
-        self.__config = get_data_from_json_file(self.email_config_path(filename))
+        """ config and template come from template_registry : files are only read again when they change """
+        self.__config = template_registry.get_config(self.email_config_path(filename))
         self.__subject = self.config["subject"]
         self.__sender_email = self.config["sender_email"]
-        self.__email_content = get_str_from_file(self.get_file_path_name())
+        self.__template = template_registry.get_template(self.get_file_path_name())
+        self.__email_content = self.__template.source
 
     def generate_template(self, replacements: dict):
-        for key, value in replacements.items():
-            self.__email_content = self.email_content.replace("{{" + key + "}}", value)
+        """ all {{key}} are replaced in one pass """
+        template = self.__template
+        if template.source is not self.__email_content:
+            template = CompiledTemplate(self.__email_content)
+        self.__email_content = template.render(replacements)
 
     def send(self, receiver_email: str):
         self.__receiver_email = receiver_email
@@ -1133,6 +2631,12 @@ class AlertStatus(Enum):
 
 
 class Alert:
+    # UPSERT - one CURRENT alert per (alert_definition_id, meter_id) : updated while the situation lasts
+    # and archived when it ends, instead of one new alert each run.
+    # Goes with uk_current_alert : run scripts/alert_current_key_migration.py before setting it
+    # (not possible on a partitioned alert_alert)
+    UPSERT = False
+
     __id: int
     __datetime: datetime
     __alert_definition_id: id
@@ -1168,6 +2672,7 @@ class Alert:
         cursor = my_sql.generate_cursor()
         cursor.execute(operation=query, params=params)
         my_sql.commit()
+        # UPSERT : the id of the updated CURRENT alert (LAST_INSERT_ID(id) of the update)
         self.__id = cursor.lastrowid
         print("[Alert] saved with id :", self.__id)
 
@@ -1182,9 +2687,38 @@ class Alert:
 
         # QUERY
         query = "INSERT INTO {} ({}) VALUES ({})".format(ALERT_TABLE_NAME, params_str, format_param)
+        if Alert.UPSERT:
+            query += " ON DUPLICATE KEY UPDATE modification_date = VALUES(modification_date), " \
+                     "data = VALUES(data), value = VALUES(value), id = LAST_INSERT_ID(id)"
         print(query)
         return query
 
+    @staticmethod
+    def generate_archive_query(nb_meter: int) -> str:
+        return "UPDATE {} SET status = %s, modification_date = %s " \
+               "WHERE alert_definition_id = %s AND status = %s AND meter_id IN ({})".format(
+                    ALERT_TABLE_NAME,
+                    ", ".join(["%s" for i in range(nb_meter)])
+                )
+
+    @staticmethod
+    def archive(alert_definition_id: int, meter_ids: list, today: datetime) -> int:
+        """
+        UPSERT : the situation ended for these meters, their CURRENT alert is archived
+
+        :return: number of archived alerts
+        """
+        if not meter_ids:
+            return 0
+        params = [AlertStatus.ARCHIVE.value, today, alert_definition_id, AlertStatus.CURRENT.value] + list(meter_ids)
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=Alert.generate_archive_query(nb_meter=len(meter_ids)), params=params)
+        my_sql.commit()
+        nb_archived = cursor.rowcount
+        cursor.close()
+        print("[Alert] archived :", nb_archived)
+        return nb_archived
+
     @property
     def id(self):
         return self.__id
@@ -1214,6 +2748,67 @@ class Level(Enum):
 
 
 # CLASS
+class MeterRegistry:
+    """
+        Meters of bi_compteurs used by the run, loaded with one query for all AlertDefinitions
+    """
+    COLUMNS = ["id", "IS_INDEX"]  # add the attributes needed
+    BATCH_SIZE = 500
+
+    __meters: dict
+    __loaded_ids: set
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.__meters = dict()
+        self.__loaded_ids = set()
+
+    @staticmethod
+    def generate_query(nb_meter: int) -> str:
+        return "select {} from {} where id IN ({})".format(
+            ", ".join(MeterRegistry.COLUMNS),
+            METER_TABLE_NAME,
+            ", ".join(["%s" for i in range(nb_meter)])
+        )
+
+    def load(self, meter_ids):
+        meter_ids = [meter_id for meter_id in dict.fromkeys(meter_ids) if meter_id is not None]
+        i = 0
+        while i < len(meter_ids):
+            chunk = meter_ids[i:i + MeterRegistry.BATCH_SIZE]
+            cursor = my_sql.generate_cursor()
+            cursor.execute(operation=MeterRegistry.generate_query(nb_meter=len(chunk)), params=chunk)
+            for row in cursor.fetchall():
+                self.__meters[row[0]] = dict(zip(MeterRegistry.COLUMNS, row))
+            cursor.close()
+            i += MeterRegistry.BATCH_SIZE
+        self.__loaded_ids.update(meter_ids)
+        print("meters loaded :", len(self.__meters), "for", len(self.__loaded_ids), "meter ids")
+
+    def is_loaded(self, meter_ids) -> bool:
+        """ True if these meters were asked to db - even if they do not exist """
+        return all(meter_id is None or meter_id in self.__loaded_ids for meter_id in meter_ids)
+
+    def get(self, meter_id: int) -> dict:
+        """ :return: columns of the meter or None if it does not exist """
+        return self.__meters.get(meter_id)
+
+    def find_is_index(self, meter_ids) -> list:
+        """
+        same result as AlertDefinition.find_is_index : (id, IS_INDEX) of the existing meters,
+        once by meter and in the primary key order, like the rows of the IN query
+        """
+        return [
+            (meter_id, self.__meters[meter_id]["IS_INDEX"])
+            for meter_id in sorted(set(meter_ids) & self.__meters.keys())
+        ]
+
+
+meter_registry = MeterRegistry()
+
+
 class AlertDefinition:
     """
     This class represent how is define an Alert.
@@ -1287,25 +2882,44 @@ class AlertDefinition:
 
         """
         print("\n______________________________________________________ CHECK AlertDefinition", self.__id)
-        results = AlertDefinition.find_is_index(meter_ids=self.meter_ids)
+        if meter_registry.is_loaded(meter_ids=self.meter_ids):
+            results = meter_registry.find_is_index(meter_ids=self.meter_ids)
+        else:
+            results = AlertDefinition.find_is_index(meter_ids=self.meter_ids)
         print("meters_ids to Handle :", self.__meter_ids)
-        for meter_id, is_index in results:
-            print("\n     ==>  for meter_id : {} is_idx = {}".format(meter_id, is_index))
-            if self.calculator.is_alert_situation(meter_id=meter_id, is_index=bool(is_index)):
-                print("____________________  this IS an Alert Situation")
-                alert = Alert(
-                    alert_definition_id=self.__id,
-                    value=self.calculator.value,
-                    data=self.calculator.data,
-                    today=today,
-                    meter_id=meter_id
-                )
-                alert.save()
-                print("____________________  Notify ?")
-                if self.notification.is_notification_allowed(datetime_to_check=today, alert_definition_id=self.__id):
-                    self.notify(meter_id=meter_id, alert=alert, time=today)
-            else:
-                print("____________________  this IS NOT an Alert Situation")
+        if HandleDataFromDB.BATCH_MODE:
+            self.calculator.prefetch(meters=results)
+        ended = list()
+        try:
+            for meter_id, is_index in results:
+                print("\n     ==>  for meter_id : {} is_idx = {}".format(meter_id, is_index))
+                if self.calculator.is_alert_situation(meter_id=meter_id, is_index=bool(is_index)):
+                    print("____________________  this IS an Alert Situation")
+                    alert = Alert(
+                        alert_definition_id=self.__id,
+                        value=self.calculator.value,
+                        data=self.calculator.data,
+                        today=today,
+                        meter_id=meter_id
+                    )
+                    alert.save()
+                    print("____________________  Notify ?")
+                    if self.notification.is_notification_allowed(datetime_to_check=today, alert_definition_id=self.__id):
+                        self.notify(meter_id=meter_id, alert=alert, time=today)
+                else:
+                    print("____________________  this IS NOT an Alert Situation")
+                    ended.append(meter_id)
+        finally:
+            self.calculator.clear_prefetch()
+            # even if a meter stopped the check : the situations seen ended are archived
+            if Alert.UPSERT:
+                Alert.archive(alert_definition_id=self.__id, meter_ids=ended, today=today)
+
+    # ---- PLAN ----
+    def plan(self, planner: "DataPlanner"):
+        for meter_id in self.meter_ids:
+            for period in self.calculator.get_periods():
+                planner.add(meter_id=meter_id, period=period)
 
     # ---- NOTIFY ----
     def notify(self, meter_id, alert, time: datetime):
@@ -1389,13 +3003,17 @@ class AlertDefinition:
 
 class AlertManager:
 
+    # DEFINITION SOURCE - AlertDefinitionFile (model.definition_file) : definitions read from a json file
+    # None : definitions read from the DB
+    DEFINITION_FILE = None
+
     __alert_definition_list: list
     __today: datetime
 
     def __init__(self, alert_definition_id=None):
         print("\n\nALERT MANAGER *** INIT ***")
         self.__today = datetime.today()
-        data = self.get_alert_def_in_db()
+        data = self.get_alert_def()
         self.__alert_definition_list = list()
 
         last_check = self.get_last_check_from_db()
@@ -1418,11 +3036,54 @@ class AlertManager:
 
     def start_check(self):
         print("\n\nALERT MANAGER *** START ***")
+        run_memo.reset()
+        run_planner.clear()
+        self.load_meters()
+        if HandleDataFromDB.NO_DATA_CACHE is not None:
+            HandleDataFromDB.NO_DATA_CACHE.reset_run()
+        if HandleDataFromDB.PLANNING:
+            self.plan()
+        if SimpleDBBasedValueGenerator.PRELOAD_OBJECTIVES:
+            self.load_objectives()
+        try:
+            for alert_definition in self.alert_definition_list:
+                try:
+                    alert_definition.check(today=self.today)
+                except StopCheckAlertDefinition as error:
+                    log.warning("[ALERT_DEFINITION_{}] {}".format(alert_definition.id, error.__str__()))
+            self.print_run_summary()
+        finally:
+            run_planner.clear()
+
+    def load_meters(self):
+        meter_registry.clear()
+        meter_ids = list()
         for alert_definition in self.alert_definition_list:
-            try:
-                alert_definition.check(today=self.today)
-            except StopCheckAlertDefinition as error:
-                log.warning("[ALERT_DEFINITION_{}] {}".format(alert_definition.id, error.__str__()))
+            meter_ids.extend(alert_definition.meter_ids)
+        meter_registry.load(meter_ids=meter_ids)
+
+    def load_objectives(self):
+        meter_ids = list()
+        for alert_definition in self.alert_definition_list:
+            if alert_definition.calculator.is_objective_needed():
+                meter_ids.extend(alert_definition.meter_ids)
+        objective_repository.load(meter_ids=meter_ids)
+
+    def plan(self):
+        print("\n\nALERT MANAGER *** PLAN ***")
+        for alert_definition in self.alert_definition_list:
+            alert_definition.plan(planner=run_planner)
+        run_planner.load()
+        print(run_planner.summary())
+
+    def print_run_summary(self):
+        print("\n\nALERT MANAGER *** SUMMARY ***")
+        print(len(self.alert_definition_list), "alert definitions checked")
+        print(run_memo.summary())
+        if HandleDataFromDB.PLANNING:
+            print(run_planner.summary())
+        if HandleDataFromDB.NO_DATA_CACHE is not None:
+            print("meters without data :", HandleDataFromDB.NO_DATA_CACHE.run_meter_ids)
 
     def save(self):
         print("\n\nALERT MANAGER *** SAVE ***")
@@ -1445,6 +3106,12 @@ class AlertManager:
             return go_past_with_years(end_date=datetime.today(), quantity=1)
         return result[0][0]
 
+    @staticmethod
+    def get_alert_def():
+        if AlertManager.DEFINITION_FILE is not None:
+            return AlertManager.DEFINITION_FILE.load()
+        return AlertManager.get_alert_def_in_db()
+
     @staticmethod
     def get_alert_def_in_db():
         query = """select d.*, 
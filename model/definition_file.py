@@ -0,0 +1,231 @@
+import hashlib
+import logging as log
+import os
+import pickle
+
+from model.alert import Level, AlertDefinitionStatus, MyOperator, MyComparator, PeriodGeneratorType, \
+    PeriodUnitDefinition, ValueGeneratorType, ValuePeriodType, NotificationPeriod, Day, Hour
+from model.my_exception import EnumError
+from model.utils import my_sql, get_path_in_data_folder_of, get_data_from_json_file, generate_days_flag, \
+    generate_hours_flag, DEFINITION_TABLE_NAME, NOTIFICATION_NAME
+
+
+class AlertDefinitionFile:
+    """
+        AlertDefinitions read from alert_definitions.json instead of the DB (AlertManager.DEFINITION_FILE).
+
+        The json is mapped to the setup dicts of AlertManager.get_alert_def_in_db and the enums are validated once :
+        the result is saved in a pickle file with the mtime / size / sha256 of the json.
+        Next starts read the pickle file while the json does not change - no json parsing and no enum validation.
+
+        Alerts and notification times are saved with the ids of the file (foreign keys) : the AlertDefinition and its
+        notification have to exist in the DB, the others are not checked
+    """
+    FILENAME = "alert_definitions.json"
+    COMPILED_FILENAME = "alert_definitions.pickle"
+    FORMAT_VERSION = 2  # increase it when the mapping changes : compiled files of the previous version are ignored
+
+    __path: str
+    __compiled_path: str
+    __nb_compilations: int
+
+    def __init__(self, path: str = None, compiled_path: str = None):
+        self.__path = path if path else get_path_in_data_folder_of(AlertDefinitionFile.FILENAME)
+        self.__compiled_path = compiled_path if compiled_path else get_path_in_data_folder_of(
+            AlertDefinitionFile.COMPILED_FILENAME
+        )
+        self.__nb_compilations = 0
+
+    # ____________________________________________ LOAD ________________________________________________________________
+
+    def load(self) -> list:
+        """ :return: setup dicts of the ACTIVE AlertDefinitions """
+        stat = os.stat(self.__path)
+        header = self.__read_header()
+        if header is not None and not self.__is_same_file(header=header, stat=stat):
+            header = None
+
+        if header is None:
+            setups, errors = self.compile()
+        else:
+            setups, errors = self.__read_body()
+
+        # read at each load : not kept in the compiled file
+        definition_ids = AlertDefinitionFile.get_existing_ids(
+            table_name=DEFINITION_TABLE_NAME,
+            ids=[setup["id"] for setup in setups]
+        )
+        notification_ids = AlertDefinitionFile.get_existing_ids(
+            table_name=NOTIFICATION_NAME,
+            ids=[setup["notification_id"] for setup in setups]
+        )
+        saved_setups = list()
+        for setup in setups:
+            if setup["id"] not in definition_ids:
+                errors.append((setup["id"], "not in {} : its alerts can not be saved".format(DEFINITION_TABLE_NAME)))
+            elif setup["notification_id"] not in notification_ids:
+                errors.append((setup["id"], "notification {} not in {} : its notifications can not be saved".format(
+                    setup["notification_id"],
+                    NOTIFICATION_NAME
+                )))
+            else:
+                saved_setups.append(setup)
+
+        for definition_id, error in errors:
+            log.error("[ALERT_DEFINITION_{}] {}".format(definition_id, error))
+        return saved_setups
+
+    @staticmethod
+    def get_existing_ids(table_name: str, ids: list) -> set:
+        if not ids:
+            return set()
+        ids = list(dict.fromkeys(ids))
+        query = "SELECT id FROM {} WHERE id IN ({})".format(table_name, ", ".join(["%s" for i in ids]))
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=query, params=ids)
+        result = set(row[0] for row in cursor.fetchall())
+        cursor.close()
+        return result
+
+    def __is_same_file(self, header: dict, stat: os.stat_result) -> bool:
+        if header["version"] != AlertDefinitionFile.FORMAT_VERSION or header["size"] != stat.st_size:
+            return False
+        if header["mtime_ns"] == stat.st_mtime_ns:
+            return True
+        # touched or copied : same content if same hash
+        return header["sha256"] == self.generate_hash()
+
+    def generate_hash(self) -> str:
+        my_hash = hashlib.sha256()
+        with open(self.__path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                my_hash.update(block)
+        return my_hash.hexdigest()
+
+    # ____________________________________________ COMPILED FILE _______________________________________________________
+
+    def compile(self):
+        """ parse and validate the json, then save the compiled file """
+        print("compile", self.__path)
+        # taken before the parsing : a change during the compilation is seen at the next load
+        stat = os.stat(self.__path)
+        sha256 = self.generate_hash()
+        setups, errors = list(), list()
+        for definition in get_data_from_json_file(self.__path):
+            try:
+                setup = AlertDefinitionFile.generate_setup(definition)
+                if setup["status"] == AlertDefinitionStatus.ACTIVE.value:
+                    setups.append(setup)
+            except (KeyError, TypeError, EnumError) as error:
+                errors.append((definition.get("id"), error.__str__()))
+
+        header = {
+            "version": AlertDefinitionFile.FORMAT_VERSION,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+        }
+        tmp_path = self.__compiled_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            # header first : it is read without the body to know if the compiled file is still valid
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((setups, errors), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.__compiled_path)
+        self.__nb_compilations += 1
+        return setups, errors
+
+    def __read_header(self):
+        try:
+            with open(self.__compiled_path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def __read_body(self):
+        with open(self.__compiled_path, "rb") as f:
+            pickle.load(f)
+            return pickle.load(f)
+
+    # ____________________________________________ MAPPING _____________________________________________________________
+
+    @staticmethod
+    def get_enum(enum, name):
+        try:
+            return enum[name]
+        except KeyError:
+            raise EnumError(except_enum=enum, wrong_value=name, where=AlertDefinitionFile.__name__)
+
+    @staticmethod
+    def get_optional_enum(enum, name):
+        return None if name is None else AlertDefinitionFile.get_enum(enum, name)
+
+    @staticmethod
+    def get_id(definition: dict, name: str) -> int:
+        """ ids are the ones of the DB (foreign keys of the saved alerts and notification times) """
+        my_id = definition.get("id")
+        if type(my_id) is not int:
+            raise TypeError("{} id must be an integer (found {!r})".format(name, my_id))
+        return my_id
+
+    @staticmethod
+    def generate_setup(definition: dict) -> dict:
+        """ json definition (README format) -> setup dict as AlertManager.get_alert_def_in_db gives it """
+        calculator = definition["calculator"]
+        data = calculator["data"]
+        data_period = data.get("data_period") or {}
+        value = calculator["value"]
+        notification = definition["notification"]
+        get_enum = AlertDefinitionFile.get_enum
+
+        get_enum(MyOperator, calculator["operator"])
+        get_enum(MyComparator, calculator["comparator"])
+        get_enum(PeriodGeneratorType, data["data_period_type"])
+        AlertDefinitionFile.get_optional_enum(PeriodUnitDefinition, data_period.get("unit"))
+        get_enum(ValueGeneratorType, value["value_type"])
+        AlertDefinitionFile.get_optional_enum(ValuePeriodType, value.get("value_period_type"))
+        get_enum(NotificationPeriod, notification["period"])
+
+        return {
+            "name": definition["name"],
+            "id": AlertDefinitionFile.get_id(definition, name="AlertDefinition"),
+            "description": definition.get("description"),
+            "category": definition.get("category", definition.get("category_id")),
+            "level": get_enum(Level, definition["level"]).value,
+            "meter_ids": list(definition["meter_ids"]),
+            "status": get_enum(AlertDefinitionStatus, definition["status"]).value,
+            "notification_id": AlertDefinitionFile.get_id(notification, name="notification"),
+            "notification_period_unit": notification["period"],
+            "notification_period_quantity": notification["number"],
+            "notification_email": notification["email"],
+            "notification_days": generate_days_flag(
+                notification_days=[get_enum(Day, day) for day in notification.get("notification_days", [])]
+            ),
+            "notification_hours": generate_hours_flag(
+                notification_hours=[
+                    get_enum(Hour, "H_{}".format(hour)) for hour in notification.get("notification_hours", [])
+                ]
+            ),
+            "operator": calculator["operator"],
+            "comparator": calculator["comparator"],
+            "data_period_type": data["data_period_type"],
+            "data_period_quantity": data_period.get("quantity"),
+            "data_period_unit": data_period.get("unit"),
+            "value_type": value["value_type"],
+            "value_number": value.get("value_number"),
+            "value_period_type": value.get("value_period_type"),
+            "acceptable_diff": calculator.get("acceptable_diff", False),
+            "hour_start": calculator.get("hour_start"),
+            "hour_end": calculator.get("hour_end"),
+        }
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def compiled_path(self):
+        return self.__compiled_path
+
+    @property
+    def nb_compilations(self) -> int:
+        return self.__nb_compilations
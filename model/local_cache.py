@@ -0,0 +1,384 @@
+import os.path
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from fractions import Fraction
+
+from model.series import MeterSeries, to_epoch, from_epoch
+from model.utils import get_path_in_data_folder_of
+
+
+class SeriesCache:
+    """
+        Local copy of bi_donnescomptage in a SQLite file.
+        For each meter the ranges [low, high] (epoch seconds) already read from MySQL are kept as disjoint segments
+        (e.g. the current period and the same period of last year), touching segments are merged :
+        - data of a segment are read from the file
+        - only data after the high of the segment are read from MySQL (from high - REFETCH_OVERLAP, for data saved late)
+        Meters not used for the longest time are evicted when the file has more than MAX_ROWS data
+    """
+    FILENAME = "series_cache.sqlite"
+    SCHEMA_VERSION = 2  # files of another version are emptied
+    MAX_ROWS = 5000000
+    REFETCH_OVERLAP = timedelta(hours=2)
+
+    __path: str
+    __connection: sqlite3.Connection
+
+    def __init__(self, path: str = None):
+        self.__path = path if path else get_path_in_data_folder_of(SeriesCache.FILENAME)
+        self.__connection = sqlite3.connect(self.__path)
+        self.__create_tables()
+
+    def __create_tables(self):
+        version = self.__connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SeriesCache.SCHEMA_VERSION:
+            self.__connection.executescript("""
+                DROP TABLE IF EXISTS series;
+                DROP TABLE IF EXISTS meter_range;
+                DROP TABLE IF EXISTS meter_usage;
+                PRAGMA user_version = {};
+            """.format(SeriesCache.SCHEMA_VERSION))
+        self.__connection.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                meter_id INTEGER NOT NULL,
+                epoch INTEGER NOT NULL,
+                value REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS series_meter_epoch ON series (meter_id, epoch);
+            CREATE TABLE IF NOT EXISTS meter_range (
+                meter_id INTEGER NOT NULL,
+                low INTEGER NOT NULL,
+                high INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS meter_range_meter_low ON meter_range (meter_id, low);
+            CREATE TABLE IF NOT EXISTS meter_usage (
+                meter_id INTEGER PRIMARY KEY,
+                nb_rows INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self.__connection.commit()
+
+    # ____________________________________________ READ ________________________________________________________________
+
+    def get_ranges(self, meter_id: int) -> list:
+        """ :return: [(low, high)] in epoch seconds, in time order - empty if the meter is not in cache """
+        return self.__connection.execute(
+            "SELECT low, high FROM meter_range WHERE meter_id = ? ORDER BY low", (meter_id,)
+        ).fetchall()
+
+    def get_missing_range(self, meter_id: int, start: datetime, end: datetime):
+        """
+        :return: (start, end) datetime to read from MySQL before load() can answer [start, end], or None.
+        The whole period is returned if no segment of the meter contains start
+        """
+        epoch_start = to_epoch(start)
+        cached = self.__connection.execute(
+            "SELECT low, high FROM meter_range WHERE meter_id = ? AND low <= ? AND high >= ?",
+            (meter_id, epoch_start, epoch_start)
+        ).fetchone()
+        if not cached:
+            return start, end
+        if cached[1] >= to_epoch(end):
+            return None
+        refetch_start = from_epoch(cached[1]) - SeriesCache.REFETCH_OVERLAP
+        return max(start, refetch_start), end
+
+    def load(self, meter_id: int, start: datetime, end: datetime) -> MeterSeries:
+        """ data with start <= date_heure <= end, in time order """
+        self.__connection.execute(
+            "UPDATE meter_usage SET last_used = ? WHERE meter_id = ?", (time.time(), meter_id)
+        )
+        self.__connection.commit()
+        cursor = self.__connection.execute(
+            "SELECT value, epoch FROM series WHERE meter_id = ? AND epoch BETWEEN ? AND ? ORDER BY epoch, rowid",
+            (meter_id, to_epoch(start), to_epoch(end))
+        )
+        return MeterSeries.from_rows(cursor, time_needed=True)
+
+    # ____________________________________________ WRITE _______________________________________________________________
+
+    def store(self, meter_id: int, series: MeterSeries, start: datetime, end: datetime):
+        """
+        Save the data read from MySQL for [start, end] - data already in cache for this range are replaced
+
+        :param end: should not be after now, data can still come for a future date
+        """
+        start, end = to_epoch(start), to_epoch(end)
+        # segments overlapping or touching [start, end] are merged with it
+        touching = self.__connection.execute(
+            "SELECT MIN(low), MAX(high) FROM meter_range WHERE meter_id = ? AND low <= ? AND high >= ?",
+            (meter_id, end + 1, start - 1)
+        ).fetchone()
+        low = start if touching[0] is None else min(touching[0], start)
+        high = end if touching[1] is None else max(touching[1], end)
+
+        self.__connection.execute(
+            "DELETE FROM series WHERE meter_id = ? AND epoch BETWEEN ? AND ?", (meter_id, start, end)
+        )
+        self.__connection.executemany(
+            "INSERT INTO series (meter_id, epoch, value) VALUES (?, ?, ?)",
+            ((meter_id, epoch, value) for value, epoch in zip(series.values, series.epochs))
+        )
+        self.__connection.execute(
+            "DELETE FROM meter_range WHERE meter_id = ? AND low >= ? AND high <= ?", (meter_id, low, high)
+        )
+        self.__connection.execute(
+            "INSERT INTO meter_range (meter_id, low, high) VALUES (?, ?, ?)", (meter_id, low, high)
+        )
+        nb_rows = self.__connection.execute(
+            "SELECT COUNT(*) FROM series WHERE meter_id = ?", (meter_id,)
+        ).fetchone()[0]
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO meter_usage (meter_id, nb_rows, last_used) VALUES (?, ?, ?)",
+            (meter_id, nb_rows, time.time())
+        )
+        self.__connection.commit()
+        self.evict()
+
+    # ____________________________________________ INVALIDATION ________________________________________________________
+
+    def invalidate(self, meter_id: int = None, since: datetime = None):
+        """
+        Hook to call when bi_donnescomptage is changed outside of the normal flow (correction, late import...)
+
+        :param meter_id: None for all meters
+        :param since: only data from this datetime are forgotten (segments of the meter are cut before it)
+        """
+        meter_condition, params = ("", ()) if meter_id is None else (" AND meter_id = ?", (meter_id,))
+        if since is None:
+            self.__connection.execute("DELETE FROM series WHERE 1 = 1" + meter_condition, params)
+            self.__connection.execute("DELETE FROM meter_range WHERE 1 = 1" + meter_condition, params)
+            self.__connection.execute("DELETE FROM meter_usage WHERE 1 = 1" + meter_condition, params)
+        else:
+            since = to_epoch(since)
+            self.__connection.execute("DELETE FROM series WHERE epoch >= ?" + meter_condition, (since,) + params)
+            self.__connection.execute("DELETE FROM meter_range WHERE low >= ?" + meter_condition, (since,) + params)
+            self.__connection.execute(
+                "UPDATE meter_range SET high = ? WHERE high >= ?" + meter_condition, (since - 1, since) + params
+            )
+            self.__connection.execute(
+                "UPDATE meter_usage SET nb_rows = "
+                "(SELECT COUNT(*) FROM series WHERE series.meter_id = meter_usage.meter_id) WHERE 1 = 1" + meter_condition,
+                params
+            )
+        self.__connection.commit()
+
+    def evict(self, max_rows: int = None):
+        """ forget least recently used meters until the cache has at most max_rows data (default MAX_ROWS) """
+        max_rows = max_rows if max_rows is not None else SeriesCache.MAX_ROWS
+        total = self.nb_rows
+        if total <= max_rows:
+            return
+        for meter_id, nb_rows in self.__connection.execute(
+                "SELECT meter_id, nb_rows FROM meter_usage ORDER BY last_used"
+        ).fetchall():
+            if total <= max_rows:
+                break
+            self.invalidate(meter_id=meter_id)
+            total -= nb_rows
+            print("meter", meter_id, "evicted from series cache")
+
+    def close(self):
+        self.__connection.close()
+
+    @property
+    def nb_rows(self) -> int:
+        return self.__connection.execute("SELECT COALESCE(SUM(nb_rows), 0) FROM meter_usage").fetchone()[0]
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def size(self) -> int:
+        """ size of the file in bytes """
+        return os.path.getsize(self.__path) if os.path.exists(self.__path) else 0
+
+
+class Baseline:
+    """ value of a period kept by BaselineCache, with the operator accumulator to update it by slices """
+    __slots__ = ("start", "end", "accumulator")
+
+    def __init__(self, start: datetime, end: datetime, accumulator):
+        self.start = start
+        self.end = end
+        self.accumulator = accumulator
+
+    @property
+    def value(self):
+        return self.accumulator.result
+
+
+class BaselineCache:
+    """
+        Values of PERIOD_BASED_VALUE periods kept in a SQLite file between runs.
+        key : (meter_id, unit, quantity, operator, hour_start, hour_end, is_index)
+        The accumulator is kept by its summary (count, min, max, exact sum) and rebuilt with merge_summary
+    """
+    FILENAME = "baseline_cache.sqlite"
+    SCHEMA_VERSION = 2  # files of another version are emptied
+    TOLERANCE = timedelta(hours=1)  # a baseline whose period moved less than this is used as it is
+
+    __path: str
+    __connection: sqlite3.Connection
+
+    def __init__(self, path: str = None):
+        self.__path = path if path else get_path_in_data_folder_of(BaselineCache.FILENAME)
+        self.__connection = sqlite3.connect(self.__path)
+        version = self.__connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != BaselineCache.SCHEMA_VERSION:
+            self.__connection.executescript("""
+                DROP TABLE IF EXISTS baseline;
+                PRAGMA user_version = {};
+            """.format(BaselineCache.SCHEMA_VERSION))
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS baseline (
+                key TEXT PRIMARY KEY,
+                meter_id INTEGER NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                minimum REAL,
+                maximum REAL,
+                total TEXT
+            )
+        """)
+        self.__connection.commit()
+
+    @staticmethod
+    def generate_key(key: tuple) -> str:
+        return "|".join(str(item) for item in key)
+
+    def get(self, key: tuple, accumulator):
+        """
+        :param accumulator: class of the accumulator of the operator (MyOperator.accumulator)
+        :return: Baseline or None
+        """
+        row = self.__connection.execute(
+            "SELECT start, end, count, minimum, maximum, total FROM baseline WHERE key = ?",
+            (BaselineCache.generate_key(key),)
+        ).fetchone()
+        if not row:
+            return None
+        start, end, count, minimum, maximum, total = row
+        # isoformat : the slices of the update start exactly at the bounds of the baseline
+        baseline = Baseline(
+            start=datetime.fromisoformat(start),
+            end=datetime.fromisoformat(end),
+            accumulator=accumulator()
+        )
+        baseline.accumulator.merge_summary(
+            count=count,
+            minimum=minimum,
+            maximum=maximum,
+            total=None if total is None else Fraction(total)
+        )
+        return baseline
+
+    def put(self, key: tuple, baseline: Baseline):
+        count, minimum, maximum, total = baseline.accumulator.summary
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO baseline (key, meter_id, start, end, count, minimum, maximum, total) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                BaselineCache.generate_key(key),
+                key[0],
+                baseline.start.isoformat(),
+                baseline.end.isoformat(),
+                count,
+                None if minimum is None else float(minimum),
+                None if maximum is None else float(maximum),
+                None if total is None else str(total)
+            )
+        )
+        self.__connection.commit()
+
+    def is_fresh(self, baseline: Baseline, start: datetime, end: datetime) -> bool:
+        return abs(baseline.start - start) <= BaselineCache.TOLERANCE and abs(baseline.end - end) <= BaselineCache.TOLERANCE
+
+    def invalidate(self, meter_id: int = None):
+        """ Hook to call when past data of bi_donnescomptage are changed """
+        if meter_id is None:
+            self.__connection.execute("DELETE FROM baseline")
+        else:
+            self.__connection.execute("DELETE FROM baseline WHERE meter_id = ?", (meter_id,))
+        self.__connection.commit()
+
+    def close(self):
+        self.__connection.close()
+
+    @property
+    def path(self):
+        return self.__path
+
+
+class NoDataCache:
+    """
+        Meters without data kept in a SQLite file between runs :
+        for meter_id, no row after last_data (None if the meter never had data) until checked_until.
+        Later periods only need to check if rows exist after checked_until
+    """
+    FILENAME = "no_data_cache.sqlite"
+
+    __path: str
+    __connection: sqlite3.Connection
+    __run_meter_ids: set
+
+    def __init__(self, path: str = None):
+        self.__path = path if path else get_path_in_data_folder_of(NoDataCache.FILENAME)
+        self.__connection = sqlite3.connect(self.__path)
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS no_data (
+                meter_id INTEGER PRIMARY KEY,
+                last_data INTEGER,
+                checked_until INTEGER NOT NULL
+            )
+        """)
+        self.__connection.commit()
+        self.__run_meter_ids = set()
+
+    def get(self, meter_id: int):
+        """ :return: (last_data, checked_until) datetime or None if the meter is not known without data """
+        row = self.__connection.execute(
+            "SELECT last_data, checked_until FROM no_data WHERE meter_id = ?", (meter_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return None if row[0] is None else from_epoch(row[0]), from_epoch(row[1])
+
+    def put(self, meter_id: int, last_data: datetime, checked_until: datetime):
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO no_data (meter_id, last_data, checked_until) VALUES (?, ?, ?)",
+            (meter_id, None if last_data is None else to_epoch(last_data), to_epoch(checked_until))
+        )
+        self.__connection.commit()
+        self.__run_meter_ids.add(meter_id)
+
+    def invalidate(self, meter_id: int = None):
+        """ Hook to call when data of a meter are imported late """
+        if meter_id is None:
+            self.__connection.execute("DELETE FROM no_data")
+        else:
+            self.__connection.execute("DELETE FROM no_data WHERE meter_id = ?", (meter_id,))
+        self.__connection.commit()
+
+    # RUN - meters found without data during the current run (for the run summary)
+
+    def reset_run(self):
+        self.__run_meter_ids = set()
+
+    def add_run_meter(self, meter_id: int):
+        self.__run_meter_ids.add(meter_id)
+
+    @property
+    def run_meter_ids(self) -> list:
+        return sorted(self.__run_meter_ids)
+
+    def close(self):
+        self.__connection.close()
+
+    @property
+    def path(self):
+        return self.__path
@@ -0,0 +1,230 @@
+import time
+from datetime import datetime, timedelta
+from enum import Enum
+
+from model.my_exception import ConfigError, EnumError
+from model.utils import my_sql, get_path_in_data_folder_of, get_data_from_json_file, ALERT_TABLE_NAME, \
+    ALERT_TABLE_COMPO, ALERT_DEFINITION_NOTIFICATION_TIME, ALERT_DEFINITION_NOTIFICATION_TIME_COMPO, \
+    ALERT_MANAGER_TABLE_NAME, ALERT_MANAGER_TABLE_COMPO
+
+# tables the retention can be configured for : their columns are copied to the archive tables
+RETENTION_TABLES = {
+    ALERT_TABLE_NAME: ALERT_TABLE_COMPO,
+    ALERT_DEFINITION_NOTIFICATION_TIME: ALERT_DEFINITION_NOTIFICATION_TIME_COMPO,
+    ALERT_MANAGER_TABLE_NAME: ALERT_MANAGER_TABLE_COMPO,
+}
+
+
+class RetentionMode(Enum):
+    ARCHIVE = "ARCHIVE"  # rows moved to <table>_archive
+    DELETE = "DELETE"
+
+
+class RetentionPolicy:
+    """
+        Rows of a table older than retention_days (date_column) and matching the filters are archived or deleted.
+
+        keep_latest_by : the row with the highest id of each group (columns, [] for the whole table) is always kept,
+        e.g. the last notification of an AlertDefinition or the last run of the AlertManager (last check)
+    """
+    ARCHIVE_SUFFIX = "_archive"
+    id_column_name = "id"
+
+    __table_name: str
+    __date_column: str
+    __retention: timedelta
+    __mode: RetentionMode
+    __filters: dict
+    __keep_latest_by: list
+    __max_rows: int
+
+    def __init__(self, table_name: str, date_column: str, retention_days: int, mode: RetentionMode,
+                 filters: dict = None, keep_latest_by: list = None, max_rows: int = None):
+        """
+        :param filters: {column: value} the rows have to match (e.g. status ARCHIVE for alert_alert)
+        :param max_rows: rows handled by run at most, None for all
+        """
+        self.__table_name = table_name
+        self.__date_column = date_column
+        self.__retention = timedelta(days=retention_days)
+        self.__mode = mode
+        self.__filters = filters if filters else dict()
+        self.__keep_latest_by = keep_latest_by
+        self.__max_rows = max_rows
+        if table_name not in RETENTION_TABLES:
+            raise ConfigError(obj=self, msg="no retention for the table {}".format(table_name))
+        # columns of the config are formatted in the queries : only the columns of the table are accepted
+        columns = [date_column] + list(self.__filters) + list(keep_latest_by if keep_latest_by else [])
+        for column in columns:
+            if column not in RETENTION_TABLES[table_name]:
+                raise ConfigError(obj=self, msg="{} is not a column of {}".format(column, table_name))
+
+    @staticmethod
+    def from_config(config: dict) -> "RetentionPolicy":
+        try:
+            mode = RetentionMode[config.get("mode", RetentionMode.ARCHIVE.name)]
+        except KeyError:
+            raise EnumError(except_enum=RetentionMode, wrong_value=config.get("mode"), where=RetentionPolicy.__name__)
+        return RetentionPolicy(
+            table_name=config["table"],
+            date_column=config["date_column"],
+            retention_days=config["retention_days"],
+            mode=mode,
+            filters=config.get("filters"),
+            keep_latest_by=config.get("keep_latest_by"),
+            max_rows=config.get("max_rows")
+        )
+
+    def get_limit(self, today: datetime) -> datetime:
+        """ rows before the limit are expired """
+        return today - self.__retention
+
+    # ____________________________________________ QUERIES _____________________________________________________________
+
+    def generate_select_query(self) -> str:
+        """ keyset pagination on the primary key : each batch starts after the last id of the previous one """
+        conditions = ["{} > %s".format(RetentionPolicy.id_column_name), "{} < %s".format(self.__date_column)]
+        conditions += ["{} = %s".format(column) for column in self.__filters]
+        return "SELECT {id} FROM {table} WHERE {conditions} ORDER BY {id} LIMIT %s".format(
+            id=RetentionPolicy.id_column_name,
+            table=self.__table_name,
+            conditions=" AND ".join(conditions)
+        )
+
+    def generate_select_params(self, last_id: int, limit: datetime, batch_size: int) -> tuple:
+        return (last_id, limit) + tuple(self.__filters.values()) + (batch_size,)
+
+    def generate_latest_query(self) -> str:
+        query = "SELECT MAX({}) FROM {}".format(RetentionPolicy.id_column_name, self.__table_name)
+        if self.__keep_latest_by:
+            query += " GROUP BY {}".format(", ".join(self.__keep_latest_by))
+        return query
+
+    def generate_archive_table_query(self) -> str:
+        return "CREATE TABLE IF NOT EXISTS {} LIKE {}".format(self.archive_table_name, self.__table_name)
+
+    def generate_copy_query(self, nb_row: int) -> str:
+        # columns listed : the generated columns (e.g. current_key) are calculated again in the archive table
+        columns = ", ".join(RETENTION_TABLES[self.__table_name].keys())
+        return "INSERT INTO {archive} ({columns}) SELECT {columns} FROM {table} WHERE {id} IN ({ids})".format(
+            archive=self.archive_table_name,
+            columns=columns,
+            table=self.__table_name,
+            id=RetentionPolicy.id_column_name,
+            ids=", ".join(["%s" for i in range(nb_row)])
+        )
+
+    def generate_delete_query(self, nb_row: int) -> str:
+        return "DELETE FROM {} WHERE {} IN ({})".format(
+            self.__table_name,
+            RetentionPolicy.id_column_name,
+            ", ".join(["%s" for i in range(nb_row)])
+        )
+
+    def __str__(self):
+        return "{} retention ({} after {} days)".format(self.__table_name, self.__mode.name, self.__retention.days)
+
+    @property
+    def table_name(self):
+        return self.__table_name
+
+    @property
+    def archive_table_name(self):
+        return self.__table_name + RetentionPolicy.ARCHIVE_SUFFIX
+
+    @property
+    def mode(self):
+        return self.__mode
+
+    @property
+    def keep_latest_by(self):
+        return self.__keep_latest_by
+
+    @property
+    def max_rows(self):
+        return self.__max_rows
+
+
+class RetentionJob:
+    """
+        Archive / delete job of the alert history tables (alert_retention_config.json), to run regularly (cron).
+
+        Rows are handled in small batches, each one in its own transaction (copy + delete by primary key),
+        with a pause between batches : locks are short and the checks running at the same time are not blocked
+    """
+    FILENAME = "alert_retention_config.json"
+    BATCH_SIZE = 500
+    SLEEP_SECONDS = 0.5
+
+    __batch_size: int
+    __sleep_seconds: float
+    __policies: list
+
+    def __init__(self, path: str = None):
+        config = get_data_from_json_file(path if path else get_path_in_data_folder_of(RetentionJob.FILENAME))
+        self.__batch_size = config.get("batch_size", RetentionJob.BATCH_SIZE)
+        self.__sleep_seconds = config.get("sleep_seconds", RetentionJob.SLEEP_SECONDS)
+        self.__policies = [RetentionPolicy.from_config(table) for table in config["tables"]]
+
+    def run(self, today: datetime = None) -> dict:
+        """ :return: {table_name: number of rows archived / deleted} """
+        today = today if today else datetime.today()
+        result = dict()
+        for policy in self.__policies:
+            result[policy.table_name] = self.apply(policy=policy, today=today)
+            print(policy, ":", result[policy.table_name], "rows")
+        return result
+
+    def apply(self, policy: RetentionPolicy, today: datetime) -> int:
+        limit = policy.get_limit(today)
+        kept = self.__get_kept_ids(policy) if policy.keep_latest_by is not None else set()
+        if policy.mode is RetentionMode.ARCHIVE:
+            my_sql.execute_and_close(query=policy.generate_archive_table_query())
+
+        last_id = 0
+        nb_rows = 0
+        while policy.max_rows is None or nb_rows < policy.max_rows:
+            batch_size = self.__batch_size
+            if policy.max_rows is not None:
+                batch_size = min(batch_size, policy.max_rows - nb_rows)
+            ids = RetentionJob.__fetch_ids(
+                query=policy.generate_select_query(),
+                params=policy.generate_select_params(last_id=last_id, limit=limit, batch_size=batch_size)
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            expired = [my_id for my_id in ids if my_id not in kept]
+            if expired:
+                RetentionJob.__move(policy=policy, ids=expired)
+                nb_rows += len(expired)
+            if len(ids) < batch_size:
+                break
+            time.sleep(self.__sleep_seconds)
+        return nb_rows
+
+    @staticmethod
+    def __get_kept_ids(policy: RetentionPolicy) -> set:
+        return set(RetentionJob.__fetch_ids(query=policy.generate_latest_query()))
+
+    @staticmethod
+    def __fetch_ids(query: str, params: tuple = None) -> list:
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=query, params=params)
+        result = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+    @staticmethod
+    def __move(policy: RetentionPolicy, ids: list):
+        """ one transaction : a batch is archived and deleted, or nothing """
+        cursor = my_sql.generate_cursor()
+        if policy.mode is RetentionMode.ARCHIVE:
+            cursor.execute(operation=policy.generate_copy_query(nb_row=len(ids)), params=ids)
+        cursor.execute(operation=policy.generate_delete_query(nb_row=len(ids)), params=ids)
+        my_sql.commit()
+        cursor.close()
+
+    @property
+    def policies(self):
+        return self.__policies
@@ -0,0 +1,349 @@
+from datetime import datetime, timedelta, date
+from enum import Enum
+from fractions import Fraction
+
+from model.utils import my_sql, ROLLUP_HOUR_TABLE_NAME, ROLLUP_DAY_TABLE_NAME, ROLLUP_COMPO, \
+    ROLLUP_WATERMARK_TABLE_NAME
+
+
+def floor_hour(time: datetime) -> datetime:
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(time: datetime) -> datetime:
+    floor = floor_hour(time)
+    return floor if floor == time else floor + timedelta(hours=1)
+
+
+def floor_day(time: datetime) -> datetime:
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_day(time: datetime) -> datetime:
+    floor = floor_day(time)
+    return floor if floor == time else floor + timedelta(days=1)
+
+
+class RollupTier(Enum):
+    HOUR = "HOUR", ROLLUP_HOUR_TABLE_NAME, timedelta(hours=1)
+    DAY = "DAY", ROLLUP_DAY_TABLE_NAME, timedelta(days=1)
+
+    def __new__(cls, str_name, table_name, duration):
+        obj = object.__new__(cls)
+        obj._value_ = str_name
+        obj.table_name = table_name
+        obj.duration = duration
+        return obj
+
+
+class BucketSummary:
+    """
+        Data of a meter in one hour / day : enough to apply MAX, MIN and AVERAGE on the data,
+        or on the differences between consecutive data (index meters), without the rows.
+        Sums are exact fractions so averages are rounded once, like statistics.mean
+    """
+    __slots__ = ("bucket", "count", "minimum", "maximum", "total", "first", "last",
+                 "delta_min", "delta_max", "delta_total")
+
+    def __init__(self, bucket: datetime, count: int, minimum, maximum, total: Fraction, first, last,
+                 delta_min, delta_max, delta_total: Fraction):
+        self.bucket = bucket
+        self.count = count
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total = total
+        self.first = first
+        self.last = last
+        self.delta_min = delta_min
+        self.delta_max = delta_max
+        self.delta_total = delta_total
+
+    @staticmethod
+    def summarize(bucket: datetime, values: list):
+        """ :param values: data of the bucket in time order - at least one """
+        deltas = [values[i] - values[i - 1] for i in range(1, len(values))]
+        return BucketSummary(
+            bucket=bucket,
+            count=len(values),
+            minimum=min(values),
+            maximum=max(values),
+            total=sum(map(Fraction, values), Fraction(0)),
+            first=values[0],
+            last=values[-1],
+            delta_min=min(deltas) if deltas else None,
+            delta_max=max(deltas) if deltas else None,
+            delta_total=sum(map(Fraction, deltas), Fraction(0))
+        )
+
+    @property
+    def delta_count(self) -> int:
+        return self.count - 1
+
+    def to_row(self, meter_id: int) -> tuple:
+        """ values in ROLLUP_COMPO order """
+        return (
+            meter_id,
+            self.bucket,
+            self.count,
+            self.minimum,
+            self.maximum,
+            float(self.total),
+            str(self.total),
+            self.first,
+            self.last,
+            self.delta_min,
+            self.delta_max,
+            str(self.delta_total)
+        )
+
+    @staticmethod
+    def from_row(row: tuple):
+        """ :param row: columns of ROLLUP_COMPO without meter_id """
+        bucket, count, minimum, maximum, total, sum_exact, first, last, delta_min, delta_max, delta_sum_exact = row
+        return BucketSummary(
+            bucket=bucket,
+            count=count,
+            minimum=minimum,
+            maximum=maximum,
+            total=Fraction(sum_exact),
+            first=first,
+            last=last,
+            delta_min=delta_min,
+            delta_max=delta_max,
+            delta_total=Fraction(delta_sum_exact)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, BucketSummary):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in BucketSummary.__slots__)
+
+    def __repr__(self):
+        return "BucketSummary({} : {} data)".format(self.bucket.isoformat(), self.count)
+
+
+class Rollup:
+    """
+        Hourly and daily rollups of bi_donnescomptage, used by HandleDataFromDB.ROLLUP.
+
+        refresh() is the rollup job : rows added since the watermark (last id read) give the (meter, day) touched,
+        and all buckets of these days are calculated again in python from the rows.
+        Buckets are only used if they end SAFETY_LAG before the last refresh - later rows may still come - and
+        before the hour of the first row added after the watermark (a late row not rolled up yet).
+        Rows changed or deleted in the past are not seen by the watermark : call invalidate() for them
+    """
+    WATERMARK_NAME = "bi_donnescomptage"
+    SAFETY_LAG = timedelta(hours=2)
+    STATE_TTL = timedelta(minutes=1)  # the watermark is read again after this
+
+    table_name = "bi_donnescomptage"
+    id_column_name = "id"
+    value_column_name = "valeur"
+    meter_id_column_name = "r_compteur"
+    hour_column_name = "date_heure"
+
+    __usable_until: datetime
+    __state_time: datetime
+
+    def __init__(self):
+        self.__usable_until = None
+        self.__state_time = None
+
+    # ____________________________________________ QUERIES _____________________________________________________________
+
+    @staticmethod
+    def generate_max_id_query() -> str:
+        return "SELECT MAX({}) FROM {}".format(Rollup.id_column_name, Rollup.table_name)
+
+    @staticmethod
+    def generate_pending_start_query() -> str:
+        """ rows after the watermark : a range of the primary key """
+        return "SELECT MIN({}) FROM {} WHERE {} > %s".format(
+            Rollup.hour_column_name,
+            Rollup.table_name,
+            Rollup.id_column_name
+        )
+
+    @staticmethod
+    def generate_touched_query() -> str:
+        return "SELECT DISTINCT {meter}, DATE({hour}) FROM {table} WHERE {id} > %s AND {id} <= %s".format(
+            meter=Rollup.meter_id_column_name,
+            hour=Rollup.hour_column_name,
+            table=Rollup.table_name,
+            id=Rollup.id_column_name
+        )
+
+    @staticmethod
+    def generate_rows_query() -> str:
+        return "SELECT {value}, {hour} FROM {table} WHERE {meter} = %s AND {hour} >= %s AND {hour} < %s " \
+               "ORDER BY {hour}, {id}".format(
+                    value=Rollup.value_column_name,
+                    hour=Rollup.hour_column_name,
+                    table=Rollup.table_name,
+                    meter=Rollup.meter_id_column_name,
+                    id=Rollup.id_column_name
+                )
+
+    @staticmethod
+    def generate_delete_query(tier: RollupTier) -> str:
+        return "DELETE FROM {} WHERE meter_id = %s AND bucket >= %s AND bucket < %s".format(tier.table_name)
+
+    @staticmethod
+    def generate_insert_query(tier: RollupTier) -> str:
+        return "INSERT INTO {} ({}) VALUES ({})".format(
+            tier.table_name,
+            ", ".join(ROLLUP_COMPO.keys()),
+            ", ".join(["%s" for key in ROLLUP_COMPO])
+        )
+
+    @staticmethod
+    def generate_load_query(tier: RollupTier) -> str:
+        return "SELECT {} FROM {} WHERE meter_id = %s AND bucket >= %s AND bucket < %s ORDER BY bucket".format(
+            ", ".join(key for key in ROLLUP_COMPO.keys() if key != "meter_id"),
+            tier.table_name
+        )
+
+    @staticmethod
+    def generate_watermark_query() -> str:
+        return "SELECT last_id, refresh_datetime FROM {} WHERE name = %s".format(ROLLUP_WATERMARK_TABLE_NAME)
+
+    @staticmethod
+    def generate_save_watermark_query() -> str:
+        return "INSERT INTO {} (name, last_id, refresh_datetime) VALUES (%s, %s, %s) " \
+               "ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), refresh_datetime = VALUES(refresh_datetime)".format(
+                    ROLLUP_WATERMARK_TABLE_NAME
+                )
+
+    @staticmethod
+    def __fetch_all(query: str, params: tuple = None) -> list:
+        print("query :", query)
+        print("params :", params)
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=query, params=params)
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    # ____________________________________________ REFRESH _____________________________________________________________
+
+    def get_watermark(self):
+        """ :return: (last_id, refresh_datetime) or None if never refreshed """
+        result = Rollup.__fetch_all(query=Rollup.generate_watermark_query(), params=(Rollup.WATERMARK_NAME,))
+        return tuple(result[0]) if result else None
+
+    def refresh(self) -> int:
+        """ :return: number of (meter, day) calculated again """
+        watermark = self.get_watermark()
+        last_id = watermark[0] if watermark else 0
+        # taken before reading the rows : rows added during the refresh are after the new watermark
+        refresh_datetime = datetime.today()
+        max_id = Rollup.__fetch_all(query=Rollup.generate_max_id_query())[0][0]
+        if max_id is None or max_id <= last_id:
+            max_id = last_id
+            touched = list()
+        else:
+            touched = Rollup.__fetch_all(query=Rollup.generate_touched_query(), params=(last_id, max_id))
+
+        for meter_id, day in touched:
+            self.refresh_day(meter_id=meter_id, day=day)
+
+        my_sql.execute_and_close(
+            query=Rollup.generate_save_watermark_query(),
+            params=(Rollup.WATERMARK_NAME, max_id, refresh_datetime)
+        )
+        self.__state_time = None
+        print("rollup :", len(touched), "days refreshed up to id", max_id)
+        return len(touched)
+
+    def refresh_day(self, meter_id: int, day: date):
+        """ calculate again the hour buckets and the day bucket of the meter for this day """
+        start = datetime(day.year, day.month, day.day)
+        end = start + timedelta(days=1)
+        rows = Rollup.__fetch_all(query=Rollup.generate_rows_query(), params=(meter_id, start, end))
+
+        hours = dict()
+        for value, time in rows:
+            hours.setdefault(floor_hour(time), list()).append(value)
+        summaries = {
+            RollupTier.HOUR: [BucketSummary.summarize(bucket=bucket, values=values) for bucket, values in hours.items()],
+            RollupTier.DAY: [BucketSummary.summarize(bucket=start, values=[row[0] for row in rows])] if rows else []
+        }
+
+        cursor = my_sql.generate_cursor()
+        for tier, tier_summaries in summaries.items():
+            cursor.execute(operation=Rollup.generate_delete_query(tier), params=(meter_id, start, end))
+            if tier_summaries:
+                cursor.executemany(
+                    operation=Rollup.generate_insert_query(tier),
+                    seq_params=[summary.to_row(meter_id=meter_id) for summary in tier_summaries]
+                )
+        my_sql.commit()
+        cursor.close()
+
+    def invalidate(self, meter_id: int, start: datetime, end: datetime):
+        """ Hook to call when past rows of the meter are changed or deleted : days of [start, end] are calculated again """
+        day = floor_day(start)
+        while day <= end:
+            self.refresh_day(meter_id=meter_id, day=day)
+            day += timedelta(days=1)
+
+    # ____________________________________________ READ ________________________________________________________________
+
+    def get_pending_start(self, last_id: int):
+        """ :return: date_heure of the oldest row not rolled up yet (id after the watermark), None if there is none """
+        return Rollup.__fetch_all(query=Rollup.generate_pending_start_query(), params=(last_id,))[0][0]
+
+    def get_usable_until(self):
+        """ :return: end of the last bucket that can be used, None if the rollups were never refreshed """
+        now = datetime.today()
+        if self.__state_time is None or now - self.__state_time > Rollup.STATE_TTL:
+            watermark = self.get_watermark()
+            self.__usable_until = floor_hour(watermark[1] - Rollup.SAFETY_LAG) if watermark else None
+            if watermark:
+                pending_start = self.get_pending_start(last_id=watermark[0])
+                if pending_start is not None:
+                    self.__usable_until = min(self.__usable_until, floor_hour(pending_start))
+            self.__state_time = now
+        return self.__usable_until
+
+    def get_covered_range(self, start: datetime, end: datetime):
+        """
+        :return: (low, high) whole hours of [start, end] that can be read from the rollups, None if there is none.
+        Data of [start, low[ and [high, end] have to be read from the rows
+        """
+        usable_until = self.get_usable_until()
+        if usable_until is None:
+            return None
+        low, high = ceil_hour(start), min(floor_hour(end), usable_until)
+        return (low, high) if low < high else None
+
+    @staticmethod
+    def split_tiers(start: datetime, end: datetime, whole_days: bool) -> list:
+        """
+        :param start: start of an hour
+        :param end: start of an hour
+        :param whole_days: False if data have to be filtered by hour : only hour buckets can be used
+        :return: (tier, start, end) covering [start, end[ in time order, with day buckets where possible
+        """
+        if whole_days:
+            first_day, last_day = ceil_day(start), floor_day(end)
+            if first_day < last_day:
+                tiers = [
+                    (RollupTier.HOUR, start, first_day),
+                    (RollupTier.DAY, first_day, last_day),
+                    (RollupTier.HOUR, last_day, end)
+                ]
+                return [tier for tier in tiers if tier[1] < tier[2]]
+        return [(RollupTier.HOUR, start, end)]
+
+    def load(self, tier: RollupTier, meter_id: int, start: datetime, end: datetime) -> list:
+        """ buckets of the tier with start <= bucket < end, in time order """
+        rows = Rollup.__fetch_all(query=Rollup.generate_load_query(tier), params=(meter_id, start, end))
+        return [BucketSummary.from_row(row) for row in rows]
+
+    def get_buckets(self, meter_id: int, start: datetime, end: datetime, whole_days: bool) -> list:
+        """ buckets covering [start, end[ (see split_tiers), in time order """
+        buckets = list()
+        for tier, tier_start, tier_end in Rollup.split_tiers(start=start, end=end, whole_days=whole_days):
+            buckets.extend(self.load(tier=tier, meter_id=meter_id, start=tier_start, end=tier_end))
+        return buckets
@@ -0,0 +1,145 @@
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_IN_HOUR = 3600
+HOURS_IN_DAY = 24
+
+
+def to_epoch(time: datetime) -> int:
+    """ epoch seconds of a naive datetime (no timezone applied) """
+    return (time - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(epoch: int) -> datetime:
+    return EPOCH + timedelta(seconds=epoch)
+
+
+def hour_of_epoch(epoch: int) -> int:
+    return (epoch // SECONDS_IN_HOUR) % HOURS_IN_DAY
+
+
+class MeterSeries:
+    """
+        Data of a meter stored in contiguous arrays : array('d') of values and array('q') of epoch seconds
+        - 16 bytes by data instead of a boxed float and a datetime in a list
+        - iterable and sized on the values, so MyOperator.calculate can be used on it
+    """
+    __slots__ = ("__values", "__epochs")
+
+    def __init__(self, values=(), epochs=None):
+        self.__values = values if isinstance(values, array) and values.typecode == "d" else array("d", values)
+        if epochs is None:
+            self.__epochs = None
+        else:
+            self.__epochs = epochs if isinstance(epochs, array) and epochs.typecode == "q" else array("q", epochs)
+            if len(self.__epochs) != len(self.__values):
+                raise ValueError("values and epochs must have the same length")
+
+    @staticmethod
+    def from_rows(rows, time_needed: bool):
+        """
+        :param rows: iterable of (valeur,) or (valeur, date_heure) rows - or of values when the time is not selected
+        """
+        if isinstance(rows, list):
+            return MeterSeries.__from_row_list(rows, time_needed=time_needed)
+
+        values = array("d")
+        if not time_needed:
+            for row in rows:
+                values.append(row[0] if isinstance(row, tuple) else row)
+            return MeterSeries(values=values)
+
+        epochs = array("q")
+        for value, time in rows:
+            values.append(value)
+            epochs.append(time if isinstance(time, int) else to_epoch(time))
+        return MeterSeries(values=values, epochs=epochs)
+
+    @staticmethod
+    def __from_row_list(rows: list, time_needed: bool):
+        """ rows from fetchall : arrays are allocated once with the right size """
+        values = array("d", bytes(8 * len(rows)))
+        if not time_needed:
+            for i, row in enumerate(rows):
+                values[i] = row[0] if isinstance(row, tuple) else row
+            return MeterSeries(values=values)
+
+        epochs = array("q", bytes(8 * len(rows)))
+        for i, (value, time) in enumerate(rows):
+            values[i] = value
+            epochs[i] = time if isinstance(time, int) else to_epoch(time)
+        return MeterSeries(values=values, epochs=epochs)
+
+    # ____________________________________________ TREATMENT __________________________________________________________
+
+    def __check_epochs(self):
+        if self.__epochs is None:
+            raise ValueError("time is not loaded in this MeterSeries")
+
+    def between(self, start: datetime, end: datetime):
+        """ data with start <= date_heure <= end (same bounds as SQL BETWEEN) """
+        self.__check_epochs()
+        start, end = to_epoch(start), to_epoch(end)
+        return self.__select([start <= epoch <= end for epoch in self.__epochs])
+
+    def hour_mask(self, hour_start: int, hour_end: int):
+        """ data in [hour_start, hour_end[ - wraps past midnight when hour_end <= hour_start """
+        self.__check_epochs()
+        if hour_start < hour_end:
+            mask = [hour_start <= hour_of_epoch(epoch) < hour_end for epoch in self.__epochs]
+        else:
+            mask = [hour_of_epoch(epoch) >= hour_start or hour_of_epoch(epoch) < hour_end for epoch in self.__epochs]
+        return self.__select(mask)
+
+    def delta(self):
+        """ difference between each data and the previous one, dated at the later one """
+        values = array("d", (self.__values[i] - self.__values[i - 1] for i in range(1, len(self.__values))))
+        epochs = None if self.__epochs is None else self.__epochs[1:]
+        return MeterSeries(values=values, epochs=epochs)
+
+    def __select(self, mask: list):
+        values = array("d", (value for value, keep in zip(self.__values, mask) if keep))
+        epochs = array("q", (epoch for epoch, keep in zip(self.__epochs, mask) if keep))
+        return MeterSeries(values=values, epochs=epochs)
+
+    # ____________________________________________ SEQUENCE ___________________________________________________________
+
+    def __len__(self):
+        return len(self.__values)
+
+    def __iter__(self):
+        return iter(self.__values)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            epochs = None if self.__epochs is None else self.__epochs[item]
+            return MeterSeries(values=self.__values[item], epochs=epochs)
+        return self.__values[item]
+
+    def __eq__(self, other):
+        if not isinstance(other, MeterSeries):
+            return NotImplemented
+        return self.__values == other.values and self.__epochs == other.epochs
+
+    def __repr__(self):
+        return "MeterSeries({} values{})".format(len(self), "" if self.__epochs is None else " with time")
+
+    @property
+    def values(self) -> array:
+        return self.__values
+
+    @property
+    def epochs(self) -> array:
+        return self.__epochs
+
+    @property
+    def has_time(self) -> bool:
+        return self.__epochs is not None
+
+    @property
+    def nbytes(self) -> int:
+        size = self.__values.itemsize * len(self.__values)
+        if self.__epochs is not None:
+            size += self.__epochs.itemsize * len(self.__epochs)
+        return size
@@ -0,0 +1,83 @@
+import re
+import threading
+
+from model.utils import FileWatcher, get_data_from_json_file, get_str_from_file
+
+PLACEHOLDER = re.compile(r"\{\{(.*?)\}\}", re.DOTALL)
+
+
+class CompiledTemplate:
+    """
+        Template split once in literal parts and {{key}} placeholders,
+        render() builds the result in one pass (placeholders without replacement are kept)
+    """
+    __slots__ = ("__source", "__parts")
+
+    def __init__(self, source: str):
+        self.__source = source
+        # [literal, key, literal, key, ..., literal]
+        self.__parts = PLACEHOLDER.split(source)
+
+    def render(self, replacements: dict) -> str:
+        parts = self.__parts
+        result = [parts[0]]
+        for i in range(1, len(parts), 2):
+            key = parts[i]
+            result.append(replacements[key] if key in replacements else "{{" + key + "}}")
+            result.append(parts[i + 1])
+        return "".join(result)
+
+    @property
+    def source(self) -> str:
+        return self.__source
+
+    @property
+    def keys(self) -> list:
+        return self.__parts[1::2]
+
+
+class TemplateRegistry:
+    """
+        Email configs and templates read once and kept in memory,
+        read again when their FileWatcher sees a change
+    """
+    __files: dict
+    __lock: threading.Lock
+    __nb_loads: int
+
+    def __init__(self):
+        self.__files = dict()
+        self.__lock = threading.Lock()
+        self.__nb_loads = 0
+
+    def __get(self, path: str, loader):
+        with self.__lock:
+            entry = self.__files.get(path)
+            if entry is None or entry[0].has_changed():
+                if entry is not None:
+                    entry[0].close()
+                watcher = FileWatcher(path)  # before reading : a change during the read is seen next time
+                entry = (watcher, loader(path))
+                self.__files[path] = entry
+                self.__nb_loads += 1
+            return entry[1]
+
+    def get_config(self, path: str) -> dict:
+        """ do not modify the returned dict : it is shared """
+        return self.__get(path=path, loader=get_data_from_json_file)
+
+    def get_template(self, path: str) -> CompiledTemplate:
+        return self.__get(path=path, loader=lambda file_path: CompiledTemplate(get_str_from_file(file_path)))
+
+    def clear(self):
+        with self.__lock:
+            for watcher, content in self.__files.values():
+                watcher.close()
+            self.__files = dict()
+
+    @property
+    def nb_loads(self) -> int:
+        return self.__nb_loads
+
+
+template_registry = TemplateRegistry()
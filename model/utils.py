@@ -1,12 +1,18 @@
 import calendar
+import ctypes
+import ctypes.util
 import datetime
 import json
 import logging as log
 import os.path
+import struct
+import threading
+import time
 from enum import Enum
 
 import dateutil.parser
 from mysql.connector import MySQLConnection
+from mysql.connector.pooling import MySQLConnectionPool
 
 from definition import ROOT_DIR
 
@@ -70,6 +76,116 @@ def get_file_last_modification_time(file_path_name: str) -> datetime:
     return os.path.getmtime(file_path_name)
 
 
+class FileWatcher:
+    """
+        Tell if a file may have changed since the last call of has_changed :
+        - with inotify (linux) on its folder, the events are read at most once every INOTIFY_TTL seconds
+        - else os.stat, at most once every TTL seconds
+        Between two reads has_changed is only a clock comparison : it is called before each query
+    """
+    TTL = 5.0
+    INOTIFY_TTL = 1.0
+    USE_INOTIFY = True
+
+    # inotify
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    IN_EVENTS = 0x00000008 | 0x00000080 | 0x00000100 | 0x00000200 | 0x00000004  # CLOSE_WRITE MOVED_TO CREATE DELETE ATTRIB
+    IN_Q_OVERFLOW = 0x00004000  # events were lost : the file may have changed
+    EVENT_HEADER = struct.Struct("iIII")
+
+    __path: str
+    __inotify_fd: int
+    __last_check: float
+    __signature: tuple
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__inotify_fd = FileWatcher.__init_inotify(path) if FileWatcher.USE_INOTIFY else None
+        self.__last_check = time.monotonic()
+        self.__signature = self.__get_signature()
+
+    @staticmethod
+    def __init_inotify(path: str):
+        """ :return: file descriptor watching the folder of path, None if inotify is not available """
+        library = ctypes.util.find_library("c")
+        if not library:
+            return None
+        try:
+            libc = ctypes.CDLL(library, use_errno=True)
+            fd = libc.inotify_init1(FileWatcher.IN_NONBLOCK | FileWatcher.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        folder = os.path.dirname(os.path.abspath(path)).encode()
+        if libc.inotify_add_watch(fd, folder, FileWatcher.IN_EVENTS) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def __get_signature(self):
+        try:
+            stat = os.stat(self.__path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def __read_events(self) -> bool:
+        """
+        :return: True if an event concerns the file or if events were lost.
+        Events of the other files of the folder (e.g. the SQLite caches of data/) are ignored
+        """
+        name = os.path.basename(self.__path).encode()
+        changed = False
+        while True:
+            try:
+                buffer = os.read(self.__inotify_fd, 4096)
+            except BlockingIOError:
+                return changed
+            i = 0
+            while i < len(buffer):
+                wd, mask, cookie, length = FileWatcher.EVENT_HEADER.unpack_from(buffer, i)
+                i += FileWatcher.EVENT_HEADER.size
+                if mask & FileWatcher.IN_Q_OVERFLOW or buffer[i:i + length].rstrip(b"\0") == name:
+                    changed = True
+                i += length
+
+    def has_changed(self) -> bool:
+        now = time.monotonic()
+        if self.__inotify_fd is not None:
+            # the events wait in the kernel queue until the next read
+            if now - self.__last_check < FileWatcher.INOTIFY_TTL:
+                return False
+            self.__last_check = now
+            # an event may not change the stat signature (same size in the same mtime tick)
+            if not self.__read_events():
+                return False
+            self.__signature = self.__get_signature()
+            return True
+        if now - self.__last_check < FileWatcher.TTL:
+            return False
+        self.__last_check = now
+        signature = self.__get_signature()
+        if signature == self.__signature:
+            return False
+        self.__signature = signature
+        return True
+
+    def close(self):
+        if self.__inotify_fd is not None:
+            os.close(self.__inotify_fd)
+            self.__inotify_fd = None
+
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def is_inotify_used(self) -> bool:
+        return self.__inotify_fd is not None
+
+
 def enum_str_values(enum: Enum) -> "Str of each member of the enum":
     my_str = ""
     for name, member in enum.__members__.items():
@@ -80,12 +196,51 @@ def enum_str_values(enum: Enum) -> "Str of each member of the enum":
 
 # __________________________________________________ MY SQL ____________________________________________________________
 
+# FETCH - thresholds on the estimated row count of a query
+FETCH_ALL_MAX_ROWS = 2000  # under : one fetchall
+FETCH_STREAM_MIN_ROWS = 200000  # over : rows stay on the server (unbuffered cursor)
+FETCH_MIN_SIZE = 10
+FETCH_MAX_SIZE = 10000
+
+
+class FetchStrategy(Enum):
+    ALL = "ALL", True  # buffered cursor, one fetchall - small results
+    BATCH = "BATCH", True  # buffered cursor, fetchmany with growing size
+    STREAM = "STREAM", False  # unbuffered cursor, fetchmany with growing size - huge results, low memory
+
+    def __new__(cls, str_name, buffered):
+        obj = object.__new__(cls)
+        obj._value_ = str_name
+        obj.buffered = buffered
+        return obj
+
+    @staticmethod
+    def from_row_count(estimated_row_count: int = None):
+        if estimated_row_count is None:
+            return FetchStrategy.BATCH
+        if estimated_row_count <= FETCH_ALL_MAX_ROWS:
+            return FetchStrategy.ALL
+        if estimated_row_count >= FETCH_STREAM_MIN_ROWS:
+            return FetchStrategy.STREAM
+        return FetchStrategy.BATCH
+
+
+def get_fetch_size(estimated_row_count: int = None) -> int:
+    """ first fetchmany size : about 1% of the rows, then iter_row doubles it """
+    if estimated_row_count is None:
+        return FETCH_MIN_SIZE
+    return max(FETCH_MIN_SIZE, min(FETCH_MAX_SIZE, estimated_row_count // 100))
+
 
 class MySqlConnection:
     TEST_MODE = False
     FILENAME = "mysql_config.json"
     FILENAME_TEST = "mysql_config_test.json"
 
+    # POOL - connections used by parallel queries (see HandleDataFromDB.CHUNKED_SCAN)
+    POOL_NAME = "alert_manager"
+    POOL_SIZE = 4
+
     __host: str
     __username: str
     __password: str
@@ -93,13 +248,26 @@ class MySqlConnection:
     __port: str
 
     __open_time: datetime
+    __watcher: FileWatcher
+    __settings: dict
 
     __connection: MySQLConnection
+    __connection_settings: dict
+
+    __pool: MySQLConnectionPool
+    __pool_settings: dict
+    __lock: threading.Lock
 
     def __init__(self) -> None:
         super().__init__()
         self.__open_time = None
+        self.__watcher = None
+        self.__settings = None
         self.__connection = None
+        self.__connection_settings = None
+        self.__pool = None
+        self.__pool_settings = None
+        self.__lock = threading.Lock()
 
         # CONFIG
     def update_open_time(self):
@@ -113,13 +281,28 @@ class MySqlConnection:
             return get_path_in_data_folder_of(MySqlConnection.FILENAME_TEST)
 
     def update_file_if_needed(self) -> bool:
-        if not self.open_time or self.open_time.timestamp() < get_file_last_modification_time(self.get_file_path()):
-            self.__update_connection_info()
+        """
+        The config file is read again only if the FileWatcher saw a change
+
+        :return: True if the settings changed
+        """
+        with self.__lock:
+            path = self.get_file_path()
+            if not self.__watcher or self.__watcher.path != path:
+                if self.__watcher:
+                    self.__watcher.close()
+                self.__watcher = FileWatcher(path)
+                self.__settings = None
+            if self.__settings is not None and not self.__watcher.has_changed():
+                return False
+            setup = get_data_from_json_file(path)
+            if setup == self.__settings:
+                return False
+            self.__update_connection_info(setup=setup)
             return True
-        return False
 
-    def __update_connection_info(self):
-        setup = get_data_from_json_file(self.get_file_path())
+    def __update_connection_info(self, setup: dict):
+        self.__settings = setup
         self.update_open_time()
         self.__host = setup["host"]
         self.__username = setup["username"]
@@ -129,6 +312,7 @@ class MySqlConnection:
 
     def connect_without_database(self):
         self.update_file_if_needed()
+        self.__connection_settings = self.__settings
         self.__connection = MySQLConnection(
             host=self.host,
             user=self.username,
@@ -140,6 +324,7 @@ class MySqlConnection:
 
     # CONNECTION
     def __connect(self):
+        self.__connection_settings = self.__settings
         self.__connection = MySQLConnection(
             host=self.host,
             user=self.username,
@@ -151,10 +336,39 @@ class MySqlConnection:
         print("connected")
 
 
-    def generate_cursor(self):
-        if self.update_file_if_needed() or not self.__connection or not self.__connection.is_connected():
+    def generate_cursor(self, fetch_strategy: FetchStrategy = None):
+        """
+        :param fetch_strategy: None for the connector default (buffered or not from the connection).
+        An unbuffered cursor (FetchStrategy.STREAM) has to be read until the end before the next query
+        """
+        self.update_file_if_needed()
+        if self.__connection_settings is not self.__settings or not self.__connection or not self.__connection.is_connected():
             self.__connect()
-        return self.__connection.cursor()
+        options = dict()
+        if fetch_strategy:
+            options["buffered"] = fetch_strategy.buffered
+        return self.__connection.cursor(**options)
+
+    def get_pooled_connection(self):
+        """
+        Connection from the pool - thread safe. The pool is created again if the config file changed.
+        close() the connection to give it back to the pool
+        """
+        self.update_file_if_needed()
+        with self.__lock:
+            if not self.__pool or self.__pool_settings is not self.__settings:
+                setup = self.__pool_settings = self.__settings
+                self.__pool = MySQLConnectionPool(
+                    pool_name=MySqlConnection.POOL_NAME,
+                    pool_size=MySqlConnection.POOL_SIZE,
+                    host=setup["host"],
+                    user=setup["username"],
+                    password=setup["password"],
+                    db=setup["database"],
+                    port=setup["port"]
+                )
+                print("connection pool created")
+            return self.__pool.get_connection()
 
     def execute_and_close(self, query: str, params=None, return_id=False):
         my_cursor = self.generate_cursor()
@@ -195,57 +409,291 @@ class MySqlConnection:
         return self.__database
 
 
-def iter_row(cursor, size=10):
+def iter_row(cursor, size=10, max_size: int = None):
+    """ :param max_size: if given, size is doubled after each full fetch until max_size """
     while True:
         rows = cursor.fetchmany(size=size)
         if not rows:
             break
         for row in rows:
             yield row
+        if max_size and len(rows) == size:
+            size = min(size * 2, max_size)
+
+
+def fetch_rows(cursor, fetch_strategy: FetchStrategy, estimated_row_count: int = None):
+    """ read a cursor generated with fetch_strategy """
+    if fetch_strategy is FetchStrategy.ALL:
+        return cursor.fetchall()
+    return iter_row(cursor, size=get_fetch_size(estimated_row_count), max_size=FETCH_MAX_SIZE)
 
 # -------------------------- #   MySQL Connection   # -------------------------- #
 my_sql = MySqlConnection()
 # -------------------------- #     ABSTRACT Table Creation     # -------------------------- #
 
+class TableIndex:
+    """ index or unique key of a table : created with the table, or added later by TableToGenerate.request_index_creation """
+
+    __name: str
+    __columns: list
+    __unique: bool
+
+    def __init__(self, name: str, columns: list, unique: bool = False):
+        self.__name = name
+        self.__columns = columns
+        self.__unique = unique
+
+    def generate_definition(self) -> str:
+        """ part of CREATE TABLE """
+        return "{} {} ({})".format("UNIQUE KEY" if self.__unique else "INDEX", self.__name, ", ".join(self.__columns))
+
+    def generate_creation_query(self, table_name: str) -> str:
+        return "CREATE {}INDEX {} ON {} ({})".format(
+            "UNIQUE " if self.__unique else "",
+            self.__name,
+            table_name,
+            ", ".join(self.__columns)
+        )
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def columns(self):
+        return self.__columns
+
+    @property
+    def unique(self):
+        return self.__unique
+
+
+class TablePartitioning:
+    """
+        Monthly RANGE COLUMNS partitioning on a DATETIME column : partition pYYYYMM holds the rows of the month,
+        pmax the rows after the last month. MySQL prunes partitions on BETWEEN / range conditions on the column.
+        MySQL constraints : a partitioned table has no foreign key and its unique keys (primary key included)
+        contain the column
+    """
+    MAX_PARTITION = "pmax"
+
+    __column: str
+    __months_ahead: int
+    __retention_months: int
+    __archive: bool
+
+    def __init__(self, column: str, months_ahead: int = 3, retention_months: int = None, archive: bool = True):
+        """
+        :param months_ahead: partitions created in advance after the current month
+        :param retention_months: full months kept before the current month, None to keep everything
+        :param archive: expired partitions are moved to a table named <table>_<partition> instead of being dropped
+        """
+        self.__column = column
+        self.__months_ahead = months_ahead
+        self.__retention_months = retention_months
+        self.__archive = archive
+
+    # MONTHS
+
+    @staticmethod
+    def get_month(day: datetime.datetime, shift: int = 0) -> datetime.datetime:
+        """ first day of the month of day, shift months later """
+        index = day.year * 12 + day.month - 1 + shift
+        return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def get_partition_name(month: datetime.datetime) -> str:
+        return month.strftime("p%Y%m")
+
+    @staticmethod
+    def get_partition_month(partition_name: str):
+        """ :return: month of the partition, None for pmax """
+        if partition_name == TablePartitioning.MAX_PARTITION:
+            return None
+        return datetime.datetime.strptime(partition_name, "p%Y%m")
+
+    def get_missing_months(self, months: list, today: datetime.datetime) -> list:
+        """ months to add after the existing ones, up to months_ahead after today """
+        last = TablePartitioning.get_month(today, shift=self.__months_ahead)
+        month = TablePartitioning.get_month(max(months), shift=1) if months else TablePartitioning.get_month(today)
+        missing = list()
+        while month <= last:
+            missing.append(month)
+            month = TablePartitioning.get_month(month, shift=1)
+        return missing
+
+    def get_expired_months(self, months: list, today: datetime.datetime) -> list:
+        if self.__retention_months is None:
+            return list()
+        limit = TablePartitioning.get_month(today, shift=-self.__retention_months)
+        return [month for month in sorted(months) if month < limit]
+
+    # QUERIES
+
+    def generate_partition(self, month: datetime.datetime) -> str:
+        return "PARTITION {} VALUES LESS THAN ('{}')".format(
+            TablePartitioning.get_partition_name(month),
+            TablePartitioning.get_month(month, shift=1).strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    def generate_max_partition(self) -> str:
+        return "PARTITION {} VALUES LESS THAN (MAXVALUE)".format(TablePartitioning.MAX_PARTITION)
+
+    def generate_definition(self, today: datetime.datetime) -> str:
+        """ part of CREATE TABLE : the first partition (current month) also holds the rows before it """
+        partitions = [self.generate_partition(month) for month in self.get_missing_months(months=[], today=today)]
+        partitions.append(self.generate_max_partition())
+        return "PARTITION BY RANGE COLUMNS({}) ({})".format(self.__column, ", ".join(partitions))
+
+    def generate_add_query(self, table_name: str, months: list) -> str:
+        """ rows of the new months are in pmax : it is split """
+        partitions = [self.generate_partition(month) for month in months]
+        partitions.append(self.generate_max_partition())
+        return "ALTER TABLE {} REORGANIZE PARTITION {} INTO ({})".format(
+            table_name,
+            TablePartitioning.MAX_PARTITION,
+            ", ".join(partitions)
+        )
+
+    @staticmethod
+    def get_archive_name(table_name: str, month: datetime.datetime) -> str:
+        return "{}_{}".format(table_name, TablePartitioning.get_partition_name(month))
+
+    def generate_expire_queries(self, table_name: str, month: datetime.datetime, exchanged: bool = False,
+                                partitioned_archive: bool = True) -> list:
+        """
+        Queries of a previous run stopped halfway are not executed again :
+        :param exchanged: the rows of the partition are already in the archive table
+        :param partitioned_archive: the archive table does not exist yet or is still partitioned
+        """
+        partition = TablePartitioning.get_partition_name(month)
+        queries = list()
+        if self.__archive and not exchanged:
+            archive = TablePartitioning.get_archive_name(table_name=table_name, month=month)
+            queries.append("CREATE TABLE IF NOT EXISTS {} LIKE {}".format(archive, table_name))
+            if partitioned_archive:
+                queries.append("ALTER TABLE {} REMOVE PARTITIONING".format(archive))
+            queries.append("ALTER TABLE {} EXCHANGE PARTITION {} WITH TABLE {}".format(table_name, partition, archive))
+        queries.append("ALTER TABLE {} DROP PARTITION {}".format(table_name, partition))
+        return queries
+
+    def get_allowed_indexes(self, indexes: list) -> list:
+        """ unique keys without the column can not be created on the partitioned table : they are skipped """
+        allowed = list()
+        for index in indexes:
+            if index.unique and self.__column not in index.columns:
+                print("unique key {} skipped : a partitioned table needs {} in it".format(index.name, self.__column))
+                continue
+            allowed.append(index)
+        return allowed
+
+    @property
+    def column(self):
+        return self.__column
+
+    @property
+    def archive(self):
+        return self.__archive
+
+
 class TableToGenerate:
+    # PARTITIONING - tables with a TablePartitioning are created partitioned (without their foreign keys)
+    PARTITIONING = False
 
     __table_name: str
     __compo: dict
+    __generated_compo: dict
+    __primary_key: list
     __foreign_key: list
-
-    def __init__(self, table_name: str, compo: dict, foreign_keys: list=None):
+    __indexes: list
+    __partitioning: TablePartitioning
+
+    def __init__(self, table_name: str, compo: dict, foreign_keys: list=None, indexes: list=None,
+                 partitioning: TablePartitioning=None, generated_compo: dict=None, primary_key: list=None):
+        """
+        :param generated_compo: generated columns, created with the table but never written by the INSERT queries
+        :param primary_key: columns of a composite primary key (a single one is declared in the compo)
+        """
         self.__table_name = table_name
         self.__compo = compo
+        self.__generated_compo = generated_compo if generated_compo else dict()
+        self.__primary_key = primary_key
         self.__foreign_key = foreign_keys
+        self.__indexes = indexes if indexes else list()
+        self.__partitioning = partitioning
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self.__partitioning is not None and TableToGenerate.PARTITIONING
+
+    def __get_indexes(self) -> list:
+        if self.is_partitioned:
+            return self.__partitioning.get_allowed_indexes(self.__indexes)
+        return self.__indexes
 
     @staticmethod
     def __generate_one_compo(key: str, value: str):
         return key + " " + value
 
     def __generate_table_creation_param_from_compo(self) -> tuple:
+        if self.is_partitioned:
+            return self.__generate_partitioned_param_from_compo()
         my_params = tuple(TableToGenerate.__generate_one_compo(key, value) for key, value in self.__compo.items())
         return my_params
 
+    def __generate_partitioned_param_from_compo(self) -> tuple:
+        """ the primary key is extended with the partition column """
+        my_params = list()
+        primary_key = list()
+        for key, value in self.__compo.items():
+            if "PRIMARY KEY" in value:
+                value = value.replace("PRIMARY KEY", "").strip()
+                primary_key.append(key)
+            my_params.append(TableToGenerate.__generate_one_compo(key, value))
+        if primary_key:
+            my_params[-1] += ", PRIMARY KEY ({})".format(", ".join(primary_key + [self.__partitioning.column]))
+        return tuple(my_params)
+
     def __generate_alert_table_creation_query(self):
         # BASE
         my_format = "CREATE TABLE IF NOT EXISTS {} (".format(self.__table_name)
 
         # COMPO
-        params = self.__generate_table_creation_param_from_compo()
+        params = self.__generate_table_creation_param_from_compo() + tuple(
+            TableToGenerate.__generate_one_compo(key, value) for key, value in self.__generated_compo.items()
+        )
         i = 0
-        size = len(self.__compo)
+        size = len(params)
         while i < size:
             my_format += params[i]
             i += 1
             if i < size:
                 my_format += ", "
 
+        # PRIMARY KEY
+        if self.__primary_key:
+            columns = list(self.__primary_key)
+            if self.is_partitioned and self.__partitioning.column not in columns:
+                columns.append(self.__partitioning.column)
+            my_format += ", PRIMARY KEY ({})".format(", ".join(columns))
+
        # FOREIGN KEYS
         if self.__foreign_key:
             for key in self.__foreign_key:
+                if self.is_partitioned and key.startswith("FOREIGN KEY"):
+                    continue
                 my_format += ", "
                 my_format += key
+
+        # INDEXES
+        for index in self.__get_indexes():
+            my_format += ", "
+            my_format += index.generate_definition()
         my_format += ")"
+
+        # PARTITIONS
+        if self.is_partitioned:
+            my_format += " " + self.__partitioning.generate_definition(today=datetime.datetime.today())
         return my_format
 
     def request_table_creation(self):
@@ -253,6 +701,41 @@ class TableToGenerate:
         my_sql.execute_and_close(query=query)
         return TableToGenerate.check_if_table_created(table_name=self.__table_name)
 
+    def request_index_creation(self) -> list:
+        """
+        Migration of an existing table : create the indexes it does not have yet (can be run again)
+
+        :return: names of the created indexes
+        """
+        existing = TableToGenerate.get_index_names(table_name=self.__table_name)
+        created = list()
+        for index in self.__get_indexes():
+            if index.name not in existing:
+                query = index.generate_creation_query(table_name=self.__table_name)
+                print(query)
+                my_sql.execute_and_close(query=query)
+                created.append(index.name)
+        return created
+
+    def request_column_creation(self) -> list:
+        """
+        Migration of an existing table : add the generated columns it does not have yet (can be run again)
+
+        :return: names of the created columns
+        """
+        existing = TableToGenerate.get_column_names(table_name=self.__table_name)
+        created = list()
+        for key, value in self.__generated_compo.items():
+            if key not in existing:
+                query = "ALTER TABLE {} ADD COLUMN {}".format(
+                    self.__table_name,
+                    TableToGenerate.__generate_one_compo(key, value)
+                )
+                print(query)
+                my_sql.execute_and_close(query=query)
+                created.append(key)
+        return created
+
 
     def __str__(self):
         return self.__table_name + " table"
@@ -262,6 +745,10 @@ class TableToGenerate:
     def name(self):
         return self.__table_name
 
+    @property
+    def indexes(self):
+        return self.__indexes
+
     # CHECK
     @staticmethod
     def show_tables_request():
@@ -275,6 +762,162 @@ class TableToGenerate:
         cursor.close()
         return result
 
+    def request_partition_maintenance(self, today: datetime.datetime = None) -> list:
+        """
+        Add the partitions of the next months and archive / drop the expired ones (can be run again)
+
+        :return: executed queries
+        """
+        if not self.__partitioning:
+            return list()
+        today = today if today else datetime.datetime.today()
+        names = TableToGenerate.get_partition_names(table_name=self.__table_name)
+        if not names:
+            print(self, "is not partitioned")
+            return list()
+
+        months = [
+            TablePartitioning.get_partition_month(name) for name in names if name != TablePartitioning.MAX_PARTITION
+        ]
+        queries = list()
+        missing = self.__partitioning.get_missing_months(months=months, today=today)
+        if missing:
+            queries.append(self.__partitioning.generate_add_query(table_name=self.__table_name, months=missing))
+        for month in self.__partitioning.get_expired_months(months=months, today=today):
+            queries += self.__get_expire_queries(month=month)
+
+        for query in queries:
+            print(query)
+            my_sql.execute_and_close(query=query)
+        return queries
+
+    def request_partitioning(self, today: datetime.datetime = None) -> list:
+        """
+        Migration of an existing table to its partitioning (can be run again). The table is rebuilt :
+        to run when the checks are stopped. The foreign keys of and to the table are dropped and the partition
+        column is added to the primary key. The rows before the current month are in its partition
+
+        :return: executed queries, empty if already partitioned or if a unique key does not have the column
+        """
+        if not self.__partitioning:
+            return list()
+        if TableToGenerate.get_partition_names(table_name=self.__table_name):
+            print(self, "is already partitioned")
+            return list()
+        today = today if today else datetime.datetime.today()
+        column = self.__partitioning.column
+        unique_keys = TableToGenerate.get_unique_keys(table_name=self.__table_name)
+        blocking = [name for name, columns in unique_keys.items() if name != "PRIMARY" and column not in columns]
+        if blocking:
+            # e.g. uk_current_alert of Alert.UPSERT
+            print(self, ": unique keys", blocking, "without", column, "- the table can not be partitioned")
+            return list()
+
+        queries = [
+            "ALTER TABLE {} DROP FOREIGN KEY {}".format(table_name, name)
+            for table_name, name in TableToGenerate.get_foreign_keys(table_name=self.__table_name)
+        ]
+        primary_key = unique_keys.get("PRIMARY")
+        if primary_key and column not in primary_key:
+            queries.append("ALTER TABLE {} DROP PRIMARY KEY, ADD PRIMARY KEY ({})".format(
+                self.__table_name,
+                ", ".join(primary_key + [column])
+            ))
+        queries.append("ALTER TABLE {} {}".format(self.__table_name, self.__partitioning.generate_definition(today=today)))
+
+        for query in queries:
+            print(query)
+            my_sql.execute_and_close(query=query)
+        return queries
+
+    def __get_expire_queries(self, month: datetime.datetime) -> list:
+        """ state of the archive table read from db : the queries of a stopped run are not executed again """
+        if not self.__partitioning.archive:
+            return self.__partitioning.generate_expire_queries(table_name=self.__table_name, month=month)
+        archive = TablePartitioning.get_archive_name(table_name=self.__table_name, month=month)
+        if not TableToGenerate.get_column_names(table_name=archive):
+            return self.__partitioning.generate_expire_queries(table_name=self.__table_name, month=month)
+        partition = TablePartitioning.get_partition_name(month)
+        exchanged = TableToGenerate.has_rows(table_name=archive)
+        if exchanged and TableToGenerate.has_rows(table_name=self.__table_name, partition=partition):
+            # a second EXCHANGE would bring the archived rows back in the partition before the DROP
+            print(self, ": rows in", partition, "and in", archive, "- partition left unchanged, to check")
+            return list()
+        return self.__partitioning.generate_expire_queries(
+            table_name=self.__table_name,
+            month=month,
+            exchanged=exchanged,
+            partitioned_archive=bool(TableToGenerate.get_partition_names(table_name=archive))
+        )
+
+    @staticmethod
+    def has_rows(table_name: str, partition: str = None) -> bool:
+        request = "SELECT 1 FROM {}{} LIMIT 1".format(
+            table_name,
+            " PARTITION ({})".format(partition) if partition else ""
+        )
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request)
+        result = cursor.fetchall()
+        cursor.close()
+        return bool(result)
+
+    @staticmethod
+    def get_unique_keys(table_name: str) -> dict:
+        """ :return: {index name: columns} of the unique keys, the primary key is PRIMARY """
+        request = "SELECT index_name, column_name FROM information_schema.statistics " \
+                  "WHERE table_schema = DATABASE() AND table_name = %s AND non_unique = 0 " \
+                  "ORDER BY index_name, seq_in_index"
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request, params=(table_name,))
+        result = dict()
+        for name, column in cursor.fetchall():
+            result.setdefault(name, list()).append(column)
+        cursor.close()
+        return result
+
+    @staticmethod
+    def get_foreign_keys(table_name: str) -> list:
+        """ :return: (table, constraint name) of the foreign keys of the table and of the ones referencing it """
+        request = "SELECT table_name, constraint_name FROM information_schema.referential_constraints " \
+                  "WHERE constraint_schema = DATABASE() AND (table_name = %s OR referenced_table_name = %s)"
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request, params=(table_name, table_name))
+        result = [(row[0], row[1]) for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+    @staticmethod
+    def get_partition_names(table_name: str) -> list:
+        request = "SELECT partition_name FROM information_schema.partitions " \
+                  "WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL " \
+                  "ORDER BY partition_ordinal_position"
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request, params=(table_name,))
+        result = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+    @staticmethod
+    def get_column_names(table_name: str) -> set:
+        request = "SELECT column_name FROM information_schema.columns " \
+                  "WHERE table_schema = DATABASE() AND table_name = %s"
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request, params=(table_name,))
+        result = set(row[0] for row in cursor.fetchall())
+        cursor.close()
+        return result
+
+    @staticmethod
+    def get_index_names(table_name: str) -> set:
+        request = "SELECT DISTINCT index_name FROM information_schema.statistics " \
+                  "WHERE table_schema = DATABASE() AND table_name = %s"
+        cursor = my_sql.generate_cursor()
+        cursor.execute(operation=request, params=(table_name,))
+        result = set(row[0] for row in cursor.fetchall())
+        cursor.close()
+        return result
+
     @staticmethod
     def check_if_table_created(table_name: str):
         # check
@@ -297,6 +940,18 @@ class TableToGenerate:
 
 METER_TABLE_NAME = "bi_compteurs"
 
+# ---- #     Meter data (not created by the AlertManager)    # ---- #
+
+METER_DATA_TABLE_NAME = "bi_donnescomptage"
+
+# recommended : every data query reads one meter on a date_heure range
+METER_DATA_INDEXES = [
+    TableIndex(name="idx_meter_date_heure", columns=["r_compteur", "date_heure"])
+]
+
+# data are kept : baselines read the previous years
+METER_DATA_PARTITIONING = TablePartitioning(column="date_heure")
+
 
 # ---- #     Notification DEFINITION    # ---- #
 
@@ -379,6 +1034,24 @@ ALERT_FOREIGN_KEY = [
     "FOREIGN KEY (alert_definition_id) REFERENCES {}(id)".format(DEFINITION_TABLE_NAME)
 ]
 
+ALERT_INDEXES = [
+    TableIndex(name="idx_definition_meter_status", columns=["alert_definition_id", "meter_id", "status"])
+]
+
+# Alert.UPSERT only - created by scripts/alert_current_key_migration.py, goes with Alert.UPSERT = True :
+# without the upsert, the second alert of a (alert_definition_id, meter_id) would break uk_current_alert.
+# current_key is 1 for the CURRENT alerts (AlertStatus.CURRENT), NULL for the archived ones :
+# uk_current_alert allows one CURRENT alert per (alert_definition_id, meter_id) and any number of archived ones
+ALERT_UPSERT_GENERATED_COMPO = {
+    "current_key": "TINYINT AS (IF(status = 1, 1, NULL)) STORED"
+}
+
+ALERT_UPSERT_INDEXES = [
+    TableIndex(name="uk_current_alert", columns=["alert_definition_id", "meter_id", "current_key"], unique=True)
+]
+
+ALERT_PARTITIONING = TablePartitioning(column="creation_date", retention_months=24, archive=True)
+
 # ---- #     Alert Definition Notification      # ---- #
 ALERT_DEFINITION_NOTIFICATION_TIME = "alert_definition_notification_time"
 
@@ -394,6 +1067,14 @@ ALERT_DEFINITION_NOTIFICATION_TIME_FOREIGN_KEY = [
     "FOREIGN KEY (alert_definition_id) REFERENCES {}(id)".format(DEFINITION_TABLE_NAME)
 ]
 
+# last notification of a definition : ORDER BY notification_datetime DESC LIMIT 1 read from the index
+ALERT_DEFINITION_NOTIFICATION_TIME_INDEXES = [
+    TableIndex(
+        name="idx_definition_notification_datetime",
+        columns=["alert_definition_id", "alert_notification_id", "notification_datetime"]
+    )
+]
+
 
 # ---- #     Alert Manager      # ---- #
 
@@ -404,6 +1085,42 @@ ALERT_MANAGER_TABLE_COMPO = {
     "launch_datetime": "DATETIME NOT NULL"
 }
 
+# last check : ORDER BY launch_datetime DESC LIMIT 1
+ALERT_MANAGER_INDEXES = [
+    TableIndex(name="idx_launch_datetime", columns=["launch_datetime"])
+]
+
+# ---- #     Rollups (see model/rollup.py)     # ---- #
+
+ROLLUP_HOUR_TABLE_NAME = "alert_rollup_hour"
+ROLLUP_DAY_TABLE_NAME = "alert_rollup_day"
+
+# same columns for the hour and day tables, bucket is the start of the hour / day
+ROLLUP_COMPO = {
+    "meter_id": "INT NOT NULL",
+    "bucket": "DATETIME NOT NULL",
+    "nb_data": "INT NOT NULL",
+    "min_data": "DOUBLE NOT NULL",
+    "max_data": "DOUBLE NOT NULL",
+    "sum_data": "DOUBLE NOT NULL",
+    "sum_exact": "TEXT NOT NULL",  # exact sum as a fraction "numerator/denominator"
+    "first_data": "DOUBLE NOT NULL",
+    "last_data": "DOUBLE NOT NULL",
+    "delta_min": "DOUBLE DEFAULT NULL",  # differences between consecutive data of the bucket (index meters)
+    "delta_max": "DOUBLE DEFAULT NULL",
+    "delta_sum_exact": "TEXT NOT NULL"
+}
+
+ROLLUP_PRIMARY_KEY = ["meter_id", "bucket"]
+
+ROLLUP_WATERMARK_TABLE_NAME = "alert_rollup_watermark"
+
+ROLLUP_WATERMARK_COMPO = {
+    "name": "VARCHAR(32) PRIMARY KEY",
+    "last_id": "BIGINT NOT NULL",
+    "refresh_datetime": "DATETIME NOT NULL"
+}
+
 # ______________________________________________________________________________________________________________________
 
 
@@ -0,0 +1,81 @@
+from fractions import Fraction
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by CalculationEngine.NUMPY
+    np = None
+
+
+MANTISSA_BITS = 53
+HALF_MANTISSA_BITS = 27
+
+
+def is_numpy_available() -> bool:
+    return np is not None
+
+
+# _______________________________________________ LOAD _________________________________________________________________
+
+
+def load_series(series) -> tuple:
+    """
+    Views on the buffers of a MeterSeries - nothing is copied
+
+    :return: float64 values and int64 epoch seconds (None if time is not loaded)
+    """
+    values = np.frombuffer(series.values, dtype=np.float64)
+    epochs = np.frombuffer(series.epochs, dtype=np.int64) if series.has_time else None
+    return values, epochs
+
+
+# _______________________________________________ TREATMENT ____________________________________________________________
+
+
+def hour_mask(epochs: "np.ndarray", hour_start: int, hour_end: int) -> "np.ndarray":
+    """ vectorized HandleDataFromDB.is_between_hour """
+    hours = (epochs // 3600) % 24
+    if hour_start < hour_end:
+        return (hours >= hour_start) & (hours < hour_end)
+    return (hours >= hour_start) | (hours < hour_end)
+
+
+def diff(values: "np.ndarray") -> "np.ndarray":
+    return np.diff(values)
+
+
+# _______________________________________________ OPERATOR _____________________________________________________________
+
+
+def find_max_array(values: "np.ndarray") -> float:
+    return float(values.max())
+
+
+def find_min_array(values: "np.ndarray") -> float:
+    return float(values.min())
+
+
+def calculate_average_array(values: "np.ndarray") -> float:
+    """
+    Same rounding as statistics.mean : the exact sum is calculated with python int
+    from the mantissas (grouped by exponent) and the exact mean is rounded once
+    """
+    mantissas, exponents = np.frexp(values)
+    mantissas = np.ldexp(mantissas, MANTISSA_BITS).astype(np.int64)
+    exponents = exponents.astype(np.int64) - MANTISSA_BITS
+
+    order = np.argsort(exponents, kind="stable")
+    mantissas = mantissas[order]
+    exponents = exponents[order]
+    starts = np.flatnonzero(np.r_[True, exponents[1:] != exponents[:-1]])
+
+    # int64 sums can not overflow on half mantissas
+    high = np.add.reduceat(mantissas >> HALF_MANTISSA_BITS, starts)
+    low = np.add.reduceat(mantissas & ((1 << HALF_MANTISSA_BITS) - 1), starts)
+
+    min_exponent = int(exponents[0])
+    total = 0
+    for my_high, my_low, exponent in zip(high.tolist(), low.tolist(), exponents[starts].tolist()):
+        total += ((my_high << HALF_MANTISSA_BITS) + my_low) << (exponent - min_exponent)
+
+    exact_sum = Fraction(total) * Fraction(2) ** min_exponent
+    return float(exact_sum / len(values))
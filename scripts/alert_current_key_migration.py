@@ -0,0 +1,50 @@
+from model.alert import AlertStatus
+from model.utils import TableToGenerate, my_sql, ALERT_TABLE_NAME, ALERT_TABLE_COMPO, ALERT_UPSERT_GENERATED_COMPO, \
+    ALERT_UPSERT_INDEXES
+
+# alert_alert with only what Alert.UPSERT adds : current_key and uk_current_alert
+alert_upsert_table = TableToGenerate(
+    table_name=ALERT_TABLE_NAME,
+    compo=ALERT_TABLE_COMPO,
+    indexes=ALERT_UPSERT_INDEXES,
+    generated_compo=ALERT_UPSERT_GENERATED_COMPO
+)
+
+
+def generate_duplicate_archive_query() -> str:
+    """ keep the last CURRENT alert of each (alert_definition_id, meter_id), archive the older ones """
+    return "UPDATE {table} a JOIN (" \
+           "SELECT alert_definition_id, meter_id, MAX(id) AS id FROM {table} WHERE status = %s " \
+           "GROUP BY alert_definition_id, meter_id" \
+           ") last_alert ON a.alert_definition_id = last_alert.alert_definition_id " \
+           "AND a.meter_id = last_alert.meter_id " \
+           "SET a.status = %s WHERE a.status = %s AND a.id < last_alert.id".format(table=ALERT_TABLE_NAME)
+
+
+def migrate_current_key() -> bool:
+    """
+    To run before setting Alert.UPSERT = True (both go together) - can be run again :
+    archive the duplicated CURRENT alerts, then add current_key and uk_current_alert
+
+    :return: False if alert_alert is partitioned : uk_current_alert can not be created, Alert.UPSERT can not be used
+    """
+    if TableToGenerate.get_partition_names(table_name=ALERT_TABLE_NAME):
+        print(alert_upsert_table, "is partitioned : uk_current_alert needs creation_date, Alert.UPSERT is not possible")
+        return False
+
+    cursor = my_sql.generate_cursor()
+    cursor.execute(
+        operation=generate_duplicate_archive_query(),
+        params=(AlertStatus.CURRENT.value, AlertStatus.ARCHIVE.value, AlertStatus.CURRENT.value)
+    )
+    my_sql.commit()
+    print("archived duplicated CURRENT alerts :", cursor.rowcount)
+    cursor.close()
+
+    print(alert_upsert_table, ": columns", alert_upsert_table.request_column_creation())
+    print(alert_upsert_table, ": indexes", alert_upsert_table.request_index_creation())
+    return True
+
+
+if __name__ == '__main__':
+    migrate_current_key()
@@ -0,0 +1,25 @@
+from model.utils import TableToGenerate, METER_DATA_TABLE_NAME, METER_DATA_INDEXES, METER_DATA_PARTITIONING
+from scripts.alert_tables_creation import ALERT_RELATED_TABLES
+
+# not created by the AlertManager : only its recommended indexes and partitions are maintained
+meter_data_table = TableToGenerate(
+    table_name=METER_DATA_TABLE_NAME,
+    compo=dict(),
+    indexes=METER_DATA_INDEXES,
+    partitioning=METER_DATA_PARTITIONING
+)
+
+
+def migrate_indexes():
+    """ add the declared indexes missing in an existing database - can be run again """
+    existing_tables = TableToGenerate.show_tables_request()
+    for table in ALERT_RELATED_TABLES + [meter_data_table]:
+        if table.name not in existing_tables:
+            print(table, "does not exist")
+            continue
+        created = table.request_index_creation()
+        print(table, ":", created if created else "up to date")
+
+
+if __name__ == '__main__':
+    migrate_indexes()
@@ -0,0 +1,22 @@
+from model.utils import TableToGenerate
+from scripts.alert_indexes_migration import meter_data_table
+from scripts.alert_tables_creation import alert_alert_table
+
+
+def migrate_partitioning():
+    """
+    Existing alert_alert and bi_donnescomptage partitioned in place - can be run again.
+    The tables are rebuilt : to run when the AlertManager is stopped, then set TableToGenerate.PARTITIONING = True
+    and run alert_partitions_maintenance every month
+    """
+    existing_tables = TableToGenerate.show_tables_request()
+    for table in [alert_alert_table, meter_data_table]:
+        if table.name not in existing_tables:
+            print(table, "does not exist")
+            continue
+        queries = table.request_partitioning()
+        print(table, ":", len(queries), "queries executed")
+
+
+if __name__ == '__main__':
+    migrate_partitioning()
@@ -0,0 +1,17 @@
+from scripts.alert_indexes_migration import meter_data_table
+from scripts.alert_tables_creation import ALERT_RELATED_TABLES
+
+
+def maintain_partitions():
+    """
+    To run every month (cron) : partitions of the next months are added before rows come,
+    expired partitions are archived or dropped - tables which are not partitioned are left unchanged
+    """
+    for table in ALERT_RELATED_TABLES + [meter_data_table]:
+        queries = table.request_partition_maintenance()
+        if queries:
+            print(table, ":", len(queries), "queries executed")
+
+
+if __name__ == '__main__':
+    maintain_partitions()
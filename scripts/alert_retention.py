@@ -0,0 +1,10 @@
+from model.retention import RetentionJob
+
+
+def apply_retention():
+    """ retention job : to run regularly (cron), see data/alert_retention_config.json """
+    RetentionJob().run()
+
+
+if __name__ == '__main__':
+    apply_retention()
@@ -2,7 +2,10 @@ from model.utils import TableToGenerate, ALERT_TABLE_NAME, ALERT_FOREIGN_KEY, AL
     NOTIFICATION_COMPO, DEFINITION_TABLE_NAME, DEFINITON_ALERT_FOREIGN_KEY, DEFINITION_COMPO, CALCULATOR_NAME, \
     CALCULATOR_COMPO, METER_DEFINITIONS_ALERT_TABLE_NAME, METER_DEFINITION_COMPO, \
     METER_DEFINITION_ALERT_FOREIGN_KEY, ALERT_DEFINITION_NOTIFICATION_TIME, ALERT_DEFINITION_NOTIFICATION_TIME_COMPO, \
-    ALERT_DEFINITION_NOTIFICATION_TIME_FOREIGN_KEY, ALERT_MANAGER_TABLE_NAME, ALERT_MANAGER_TABLE_COMPO
+    ALERT_DEFINITION_NOTIFICATION_TIME_FOREIGN_KEY, ALERT_MANAGER_TABLE_NAME, ALERT_MANAGER_TABLE_COMPO, \
+    ROLLUP_HOUR_TABLE_NAME, ROLLUP_DAY_TABLE_NAME, ROLLUP_COMPO, ROLLUP_PRIMARY_KEY, ROLLUP_WATERMARK_TABLE_NAME, \
+    ROLLUP_WATERMARK_COMPO, ALERT_INDEXES, ALERT_DEFINITION_NOTIFICATION_TIME_INDEXES, ALERT_MANAGER_INDEXES, \
+    ALERT_PARTITIONING
 
 # NOTIFICATION
 alert_notification_table = TableToGenerate(
@@ -31,7 +34,9 @@ alert_definition_table = TableToGenerate(
 alert_alert_table = TableToGenerate(
     table_name=ALERT_TABLE_NAME,
     compo=ALERT_TABLE_COMPO,
-    foreign_keys=ALERT_FOREIGN_KEY
+    foreign_keys=ALERT_FOREIGN_KEY,
+    indexes=ALERT_INDEXES,
+    partitioning=ALERT_PARTITIONING
 )
 
 # ALERT_DEFINITION METER
@@ -46,30 +51,56 @@ alert_definition_meter_table = TableToGenerate(
 alert_definition_notification_table = TableToGenerate(
     table_name=ALERT_DEFINITION_NOTIFICATION_TIME,
     compo=ALERT_DEFINITION_NOTIFICATION_TIME_COMPO,
-    foreign_keys=ALERT_DEFINITION_NOTIFICATION_TIME_FOREIGN_KEY
+    foreign_keys=ALERT_DEFINITION_NOTIFICATION_TIME_FOREIGN_KEY,
+    indexes=ALERT_DEFINITION_NOTIFICATION_TIME_INDEXES
 )
 
 alert_manager_table = TableToGenerate(
     table_name=ALERT_MANAGER_TABLE_NAME,
-    compo=ALERT_MANAGER_TABLE_COMPO
+    compo=ALERT_MANAGER_TABLE_COMPO,
+    indexes=ALERT_MANAGER_INDEXES
 )
 
+# ROLLUPS
+alert_rollup_hour_table = TableToGenerate(
+    table_name=ROLLUP_HOUR_TABLE_NAME,
+    compo=ROLLUP_COMPO,
+    primary_key=ROLLUP_PRIMARY_KEY
+)
+
+alert_rollup_day_table = TableToGenerate(
+    table_name=ROLLUP_DAY_TABLE_NAME,
+    compo=ROLLUP_COMPO,
+    primary_key=ROLLUP_PRIMARY_KEY
+)
+
+alert_rollup_watermark_table = TableToGenerate(
+    table_name=ROLLUP_WATERMARK_TABLE_NAME,
+    compo=ROLLUP_WATERMARK_COMPO
+)
+
+
+ALERT_RELATED_TABLES = [
+    alert_notification_table,
+    alert_calculator_table,
+    alert_definition_table,
+    alert_alert_table,
+    alert_definition_meter_table,
+    alert_definition_notification_table,
+    alert_manager_table,
+    alert_rollup_hour_table,
+    alert_rollup_day_table,
+    alert_rollup_watermark_table
+]
+
 
 # CREATE TABLES
 def create_alert_related_tables():
-    tables = [
-        alert_notification_table,
-        alert_calculator_table,
-        alert_definition_table,
-        alert_alert_table,
-        alert_definition_meter_table,
-        alert_definition_notification_table,
-        alert_manager_table
-    ]
-
-    for table in tables:
+    for table in ALERT_RELATED_TABLES:
         print("\n", table, " start creation ... ")
         table.request_table_creation()
+        # tables created before their indexes were declared
+        table.request_index_creation()
 
 
 # CREATE TABLES
@@ -0,0 +1,10 @@
+from model.rollup import Rollup
+
+
+def refresh_rollups():
+    """ rollup job : to run regularly (cron), before the AlertManager runs """
+    Rollup().refresh()
+
+
+if __name__ == '__main__':
+    refresh_rollups()
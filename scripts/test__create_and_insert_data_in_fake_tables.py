@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 from model.utils import METER_TABLE_NAME, TableToGenerate, NOTIFICATION_COMPO, NOTIFICATION_NAME, \
     CALCULATOR_COMPO, CALCULATOR_NAME, DEFINITION_COMPO, DEFINITION_TABLE_NAME, METER_DEFINITION_COMPO, \
     METER_DEFINITIONS_ALERT_TABLE_NAME, insert_query_construction, ALERT_DEFINITION_NOTIFICATION_TIME_COMPO, \
-    ALERT_DEFINITION_NOTIFICATION_TIME, ALERT_MANAGER_TABLE_NAME, ALERT_MANAGER_TABLE_COMPO
+    ALERT_DEFINITION_NOTIFICATION_TIME, ALERT_MANAGER_TABLE_NAME, ALERT_MANAGER_TABLE_COMPO, METER_DATA_INDEXES, \
+    METER_DATA_PARTITIONING
 from scripts.alert_tables_creation import create_alert_related_tables
 
 
@@ -45,7 +46,9 @@ COMPTAGE_FOREIGN_KEY = {
 bi_comptages_donnees = TableToGenerate(
     table_name=HandleDataFromDB.table_name,
     compo=COMPTAGE_COMPO,
-    foreign_keys=COMPTAGE_FOREIGN_KEY
+    foreign_keys=COMPTAGE_FOREIGN_KEY,
+    indexes=METER_DATA_INDEXES,
+    partitioning=METER_DATA_PARTITIONING
 )
 
 
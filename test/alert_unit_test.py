@@ -2,6 +2,8 @@
 # -*-coding:Utf-8 -*
 import unittest
 from datetime import datetime, timedelta
+from decimal import Decimal
+from fractions import Fraction
 from unittest.mock import patch, MagicMock
 
 from model.alert import AlertDefinition, Level, MyOperator, MyComparator, PeriodUnitDefinition, \
@@ -9,11 +11,15 @@ from model.alert import AlertDefinition, Level, MyOperator, MyComparator, Period
     UserBasedGoBackPeriodGenerator, \
     UserBasedValueGenerator, ValueGenerator, PeriodBasedValueGenerator, DataBaseValueGenerator, PeriodGeneratorType, \
     ValueGeneratorType, NoPeriodBasedValueGenerator, SimpleDBBasedValueGenerator, AlertData, AlertValue, \
-    AlertNotification, NotificationPeriod, Day, Hour, AlertManager, ValuePeriodType
+    AlertNotification, NotificationPeriod, Day, Hour, AlertManager, ValuePeriodType, HandleDataFromDB, CalculationEngine, \
+    run_memo, DataPlanner, ObjectiveRepository, objective_repository, MeterRegistry, Alert, AlertStatus
 
 from model.alert import AlertDefinitionStatus
-from model.my_exception import EnumError, ConfigError
-from model.utils import generate_hours_flag, generate_days_flag
+from model.my_exception import EnumError, ConfigError, NoDataFoundInDatabase
+from model.utils import generate_hours_flag, generate_days_flag, FetchStrategy, iter_row, get_fetch_size
+from model.series import to_epoch
+from model.rollup import Rollup, RollupTier, BucketSummary
+from model.vectorized import np
 
 
 class NotificationTest(unittest.TestCase):
@@ -849,6 +855,626 @@ class AlertValueTest(unittest.TestCase):
         pass  # TODO
 
 
+class ObjectiveRepositoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = ObjectiveRepository()
+        self.cursor = MagicMock()
+        self.cursor.fetchall.return_value = [(1, 240, "DAY"), (2, 50, None), (1, 999, None)]
+
+    def test__generate_query(self):
+        self.assertEqual(
+            ObjectiveRepository.generate_query(nb_meter=2),
+            "SELECT o.r_compteur, o.value, o.time_unit from bi_objectifs o where o.r_compteur IN (%s, %s)"
+        )
+
+    def test__load(self):
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.cursor) as mock:
+            self.repository.load(meter_ids=[1, 2, 3, 1])
+        mock.assert_called_once()
+        self.cursor.execute.assert_called_once_with(operation=ObjectiveRepository.generate_query(nb_meter=3), params=[1, 2, 3])
+        self.assertEqual(self.repository.get(meter_id=1), 10)
+        self.assertEqual(self.repository.get(meter_id=2), 50)
+        self.assertIsNone(self.repository.get(meter_id=3))
+
+    def test__ttl(self):
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.cursor) as mock:
+            self.repository.load(meter_ids=[1, 2])
+            self.assertFalse(self.repository.is_expired())
+            with patch("model.alert.ObjectiveRepository.TTL", timedelta(seconds=-1)):
+                self.assertTrue(self.repository.is_expired())
+                self.assertEqual(self.repository.get(meter_id=1), 10)
+            self.assertEqual(mock.call_count, 2)
+
+    def test__simple_db_based_value_generator(self):
+        generator = SimpleDBBasedValueGenerator()
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.cursor):
+            objective_repository.load(meter_ids=[2])
+        try:
+            with patch("model.alert.SimpleDBBasedValueGenerator.PRELOAD_OBJECTIVES", True), \
+                    patch("model.alert.my_sql.generate_cursor", return_value=self.cursor) as mock:
+                self.assertEqual(generator.get_value_in_db(meter_id=2, is_index=False), 50)
+                mock.assert_not_called()
+                # not preloaded : query of one meter
+                self.cursor.fetchall.return_value = [(240, "DAY")]
+                self.assertEqual(generator.get_value_in_db(meter_id=5, is_index=False), 10)
+                mock.assert_called_once()
+        finally:
+            objective_repository.clear()
+
+
+class MeterRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MeterRegistry()
+        self.cursor = MagicMock()
+        self.cursor.fetchall.return_value = [(3, 1), (1, 0)]
+
+    def test__load(self):
+        self.assertEqual(MeterRegistry.generate_query(nb_meter=2), "select id, IS_INDEX from bi_compteurs where id IN (%s, %s)")
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.cursor) as mock:
+            self.registry.load(meter_ids=[1, 2, 3, 1, None])
+        mock.assert_called_once()
+        self.cursor.execute.assert_called_once_with(operation=MeterRegistry.generate_query(nb_meter=3), params=[1, 2, 3])
+        self.assertEqual(self.registry.get(meter_id=3), {"id": 3, "IS_INDEX": 1})
+        self.assertIsNone(self.registry.get(meter_id=2))
+
+        self.assertTrue(self.registry.is_loaded(meter_ids=[1, 2, None]))
+        self.assertFalse(self.registry.is_loaded(meter_ids=[1, 4]))
+        # meter 2 does not exist
+        self.assertEqual(self.registry.find_is_index(meter_ids=[1, 2, 3]), [(1, 0), (3, 1)])
+        # a meter repeated in the AlertDefinition is checked once, as with the query
+        self.assertEqual(self.registry.find_is_index(meter_ids=[3, 1, 3, None]), [(1, 0), (3, 1)])
+
+        self.registry.clear()
+        self.assertFalse(self.registry.is_loaded(meter_ids=[1]))
+
+
+class HandleDataFromDBTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.today = datetime(year=2019, month=8, day=13)
+        self.period = Period(start=self.today - timedelta(days=1), end=self.today)
+
+    @staticmethod
+    def get_cursor_mock(rows: list):
+        cursor = MagicMock()
+        cursor.fetchmany.side_effect = [rows, []]
+        cursor.fetchall.return_value = rows
+        return cursor
+
+    @staticmethod
+    def get_cursor_generator(rows: list):
+        """ generate_cursor answering the period queries (BETWEEN or half-open, with or without time) from rows """
+        def generate_cursor(**kwargs):
+            cursor = MagicMock()
+
+            def execute(operation, params):
+                start, end = params[1], params[2]
+                half_open = "date_heure < %s" in operation
+                selected = [row for row in rows if start <= row[1] < end or (not half_open and row[1] == end)]
+                time_needed = "date_heure FROM" in operation
+                cursor.fetchall.return_value = selected if time_needed else [row[:1] for row in selected]
+                cursor.fetchmany.side_effect = [cursor.fetchall.return_value, []]
+            cursor.execute.side_effect = execute
+            return cursor
+        return generate_cursor
+
+    def test__generate_batch_query(self):
+        query = HandleDataFromDB.generate_batch_query(time_needed=False, nb_meter=3)
+        self.assertEqual(
+            query,
+            "SELECT r_compteur, valeur FROM bi_donnescomptage WHERE r_compteur IN (%s, %s, %s) "
+            "AND date_heure BETWEEN %s AND %s ORDER BY r_compteur, date_heure"
+        )
+
+        query = HandleDataFromDB.generate_batch_query(time_needed=True, nb_meter=1)
+        self.assertIn("SELECT r_compteur, valeur, date_heure FROM", query)
+
+    def test__prefetch(self):
+        rows = [(1, 3), (1, 5), (2, 10), (2, 4)]
+        cursor = self.get_cursor_mock(rows=rows)
+
+        hdl = HandleDataFromDB(period=self.period)
+        with patch("model.alert.my_sql.generate_cursor", return_value=cursor) as mock:
+            hdl.prefetch(meters=[(1, False), (2, True), (3, False)], operator=MyOperator.MAX)
+            mock.assert_called_once()
+            cursor.execute.assert_called_once()
+
+            # Data split per meter - no more query
+            self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False), [3, 5])
+            self.assertEqual(hdl.calculate_from_db(meter_id=2, is_index=True, operator=MyOperator.MAX), -6)
+            self.assertIsNone(hdl.calculate_from_db(meter_id=3, is_index=False, operator=MyOperator.MAX))
+            mock.assert_called_once()
+
+    def test__prefetch_chunks(self):
+        with patch("model.alert.HandleDataFromDB.BATCH_SIZE", 2):
+            with patch("model.alert.my_sql.generate_cursor", side_effect=lambda **kwargs: self.get_cursor_mock([])) as mock:
+                HandleDataFromDB(period=self.period).prefetch(
+                    meters=[(1, 0), (2, 0), (3, 0), (4, 0), (5, 0)],
+                    operator=MyOperator.MAX
+                )
+                self.assertEqual(mock.call_count, 3)
+
+    # -- PUSHDOWN --
+
+    def test__generate_aggregate_query(self):
+        self.assertEqual(MyOperator.MAX.sql_function, "MAX")
+        self.assertEqual(MyOperator.MIN.sql_function, "MIN")
+
+        query = HandleDataFromDB.generate_aggregate_query(operator=MyOperator.AVERAGE)
+        self.assertEqual(
+            query,
+            "SELECT AVG(valeur), COUNT(valeur) FROM bi_donnescomptage WHERE r_compteur = %s "
+            "AND date_heure BETWEEN %s AND %s"
+        )
+        query = HandleDataFromDB.generate_aggregate_query(operator=MyOperator.MIN, nb_meter=2)
+        self.assertEqual(
+            query,
+            "SELECT r_compteur, MIN(valeur), COUNT(valeur) FROM bi_donnescomptage WHERE r_compteur IN (%s, %s) "
+            "AND date_heure BETWEEN %s AND %s GROUP BY r_compteur"
+        )
+
+    def test__can_push_down(self):
+        with patch("model.alert.HandleDataFromDB.AGGREGATION_PUSHDOWN", True):
+            self.assertTrue(HandleDataFromDB.can_push_down(is_index=False))
+            self.assertTrue(HandleDataFromDB.can_push_down(is_index=False, hour_start=8, hour_end=8))
+            self.assertFalse(HandleDataFromDB.can_push_down(is_index=True))
+            self.assertFalse(HandleDataFromDB.can_push_down(is_index=False, hour_start=8, hour_end=18))
+        self.assertFalse(HandleDataFromDB.can_push_down(is_index=False))
+
+    def test__calculate_from_db_pushdown(self):
+        hdl = HandleDataFromDB(period=self.period)
+        with patch("model.alert.HandleDataFromDB.AGGREGATION_PUSHDOWN", True):
+            with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock([(36, 4)])):
+                self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX), 36)
+            # NO DATA
+            with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock([(None, 0)])):
+                self.assertIsNone(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX))
+            # INDEX - rows needed
+            cursor = self.get_cursor_mock([(3,), (5,), (10,)])
+            with patch("model.alert.my_sql.generate_cursor", return_value=cursor):
+                self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=True, operator=MyOperator.MAX), 5)
+                self.assertNotIn("MAX(", cursor.execute.call_args[1]["operation"])
+
+
+    # -- HOUR FILTER --
+
+    def test__generate_hour_condition(self):
+        self.assertEqual(
+            HandleDataFromDB.generate_hour_condition(hour_start=8, hour_end=18),
+            "HOUR(date_heure) >= %s AND HOUR(date_heure) < %s"
+        )
+        # past midnight
+        self.assertEqual(
+            HandleDataFromDB.generate_hour_condition(hour_start=22, hour_end=6),
+            "(HOUR(date_heure) >= %s OR HOUR(date_heure) < %s)"
+        )
+
+    def test__hour_filter_in_query(self):
+        hdl = HandleDataFromDB(period=self.period)
+        with patch("model.alert.HandleDataFromDB.HOUR_FILTER_IN_QUERY", True):
+            query = HandleDataFromDB.generate_query(time_needed=False, hour_start=22, hour_end=6)
+            self.assertTrue(query.endswith("BETWEEN %s AND %s AND (HOUR(date_heure) >= %s OR HOUR(date_heure) < %s)"))
+
+            cursor = self.get_cursor_mock([(3,), (5,)])
+            with patch("model.alert.my_sql.generate_cursor", return_value=cursor):
+                result = hdl.get_data_from_db(meter_id=1, is_index=False, hour_start=22, hour_end=6)
+                self.assertEqual(result, [3, 5])
+                params = cursor.execute.call_args[1]["params"]
+                self.assertEqual(params, (1, self.period.get_start_date(), self.period.get_end_date(), 22, 6))
+
+            # no filter
+            query = HandleDataFromDB.generate_query(time_needed=False, hour_start=8, hour_end=8)
+            self.assertNotIn("HOUR(", query)
+
+            # hour filter does not prevent pushdown any more
+            with patch("model.alert.HandleDataFromDB.AGGREGATION_PUSHDOWN", True):
+                self.assertTrue(HandleDataFromDB.can_push_down(is_index=False, hour_start=8, hour_end=18))
+
+    def test__hour_filter_in_python(self):
+        hdl = HandleDataFromDB(period=self.period)
+        rows = [(3, self.today.replace(hour=7)), (5, self.today.replace(hour=8)), (10, self.today.replace(hour=23))]
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock(rows)):
+            self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False, hour_start=8, hour_end=18), [5])
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock(rows)):
+            self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False, hour_start=22, hour_end=8), [3, 10])
+
+    def test__integer_time(self):
+        hdl = HandleDataFromDB(period=self.period)
+        with patch("model.alert.HandleDataFromDB.INTEGER_TIME", True):
+            self.assertEqual(
+                HandleDataFromDB.generate_query(time_needed=True),
+                "SELECT valeur, TIMESTAMPDIFF(SECOND, '1970-01-01', date_heure) FROM bi_donnescomptage "
+                "WHERE r_compteur = %s AND date_heure BETWEEN %s AND %s"
+            )
+            self.assertNotIn("TIMESTAMPDIFF", HandleDataFromDB.generate_query(time_needed=False))
+
+            rows = [(3, to_epoch(self.today.replace(hour=7))), (5, to_epoch(self.today.replace(hour=8))), (10, to_epoch(self.today.replace(hour=23)))]
+            with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock(rows)):
+                self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False, hour_start=22, hour_end=8), [3, 10])
+            with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock(rows)):
+                self.assertEqual(list(hdl.get_series_from_db(meter_id=1, is_index=True, hour_start=8, hour_end=23)), [])
+            with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock(rows)):
+                self.assertEqual(hdl.calculate_from_db(
+                    meter_id=1,
+                    is_index=True,
+                    operator=MyOperator.MAX,
+                    hour_start=22,
+                    hour_end=8,
+                    engine=CalculationEngine.NUMPY if np is not None else CalculationEngine.SERIES
+                ), 7)
+
+    # -- FETCH --
+
+    def test__fetch_strategy(self):
+        hdl = HandleDataFromDB(period=self.period)
+        self.assertEqual(hdl.estimate_row_count(), 25)
+        self.assertEqual(hdl.estimate_row_count(nb_meter=2), 50)
+
+        self.assertIs(FetchStrategy.from_row_count(None), FetchStrategy.BATCH)
+        self.assertIs(HandleDataFromDB.get_fetch_strategy(25), FetchStrategy.ALL)
+        self.assertIs(HandleDataFromDB.get_fetch_strategy(50000), FetchStrategy.BATCH)
+        self.assertIs(HandleDataFromDB.get_fetch_strategy(10 ** 6), FetchStrategy.STREAM)
+        self.assertFalse(FetchStrategy.STREAM.buffered)
+        with patch("model.alert.HandleDataFromDB.FETCH_STRATEGY", FetchStrategy.STREAM):
+            self.assertIs(HandleDataFromDB.get_fetch_strategy(25), FetchStrategy.STREAM)
+
+        rows = [(3,), (5,)]
+        cursor = self.get_cursor_mock(rows)
+        with patch("model.alert.my_sql.generate_cursor", return_value=cursor) as mock:
+            self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False), [3, 5])
+        mock.assert_called_once_with(fetch_strategy=FetchStrategy.ALL)
+        cursor.fetchall.assert_called_once()
+        cursor.fetchmany.assert_not_called()
+
+    def test__iter_row(self):
+        cursor = MagicMock()
+        cursor.fetchmany.side_effect = [[1] * 10, [2] * 20, [3] * 5, []]
+        self.assertEqual(len(list(iter_row(cursor, size=10, max_size=25))), 35)
+        self.assertEqual([call.kwargs["size"] for call in cursor.fetchmany.call_args_list], [10, 20, 25, 25])
+        self.assertEqual(get_fetch_size(10 ** 9), 10000)
+        self.assertEqual(get_fetch_size(50000), 500)
+
+    # -- CHUNKED SCAN --
+
+    def test__split_period(self):
+        period = Period(start=datetime(2019, 11, 15, 10), end=datetime(2020, 2, 1))
+        chunks = HandleDataFromDB.split_period(period)
+        self.assertEqual(
+            [(chunk.get_start_date(), chunk.get_end_date()) for chunk in chunks],
+            [
+                (datetime(2019, 11, 15, 10), datetime(2019, 12, 1)),
+                (datetime(2019, 12, 1), datetime(2020, 1, 1)),
+                (datetime(2020, 1, 1), datetime(2020, 2, 1))
+            ]
+        )
+        self.assertEqual(len(HandleDataFromDB.split_period(self.period)), 1)
+
+    def test__generate_chunk_query(self):
+        self.assertEqual(
+            HandleDataFromDB.generate_chunk_query(time_needed=True),
+            "SELECT valeur, date_heure FROM bi_donnescomptage "
+            "WHERE r_compteur = %s AND date_heure >= %s AND date_heure < %s ORDER BY date_heure"
+        )
+        self.assertIn("date_heure BETWEEN %s AND %s", HandleDataFromDB.generate_chunk_query(time_needed=False, half_open=False))
+
+    def test__accumulator_merge(self):
+        data = [0.1, 7, 0.2, 1e16, 3, -1e16, 0.3]
+        for operator in MyOperator:
+            accumulator = operator.accumulator()
+            for i in range(0, len(data), 3):
+                partial = operator.accumulator()
+                for value in data[i:i + 3]:
+                    partial.add(value)
+                accumulator.merge(partial)
+            accumulator.merge(operator.accumulator())
+            self.assertEqual(accumulator.result, operator.calculate(data))
+            self.assertEqual(accumulator.count, len(data))
+
+    def test__calculate_by_chunks(self):
+        rows = list()
+        time = datetime(2019, 10, 20)
+        value = 0
+        while time <= datetime(2020, 1, 10):
+            value += (time.hour * 7 + time.day) % 5
+            rows.append((value, time))
+            time += timedelta(hours=5)
+
+        generate_cursor = self.get_cursor_generator(rows)
+        connection = MagicMock()
+        connection.cursor.side_effect = generate_cursor
+
+        hdl = HandleDataFromDB(period=Period(start=datetime(2019, 10, 25, 3), end=datetime(2020, 1, 5)))
+        cases = [
+            dict(is_index=False),
+            dict(is_index=True),
+            dict(is_index=True, hour_start=22, hour_end=8),
+        ]
+        for case in cases:
+            for operator in MyOperator:
+                with patch("model.alert.my_sql.generate_cursor", side_effect=generate_cursor):
+                    expected = hdl.calculate_from_db(meter_id=1, operator=operator, **case)
+                with patch("model.alert.HandleDataFromDB.CHUNKED_SCAN", True), \
+                        patch("model.alert.my_sql.get_pooled_connection", return_value=connection) as mock:
+                    self.assertEqual(hdl.calculate_from_db(meter_id=1, operator=operator, **case), expected)
+                    self.assertEqual(mock.call_count, 4)
+
+    def test__calculate_from_rollup(self):
+        rows = list()
+        time = datetime(2019, 10, 20)
+        value = 0.0
+        while time <= datetime(2020, 1, 10):
+            value += ((time.hour * 7 + time.day) % 5) / 10
+            rows.append((value, time))
+            time += timedelta(minutes=50)
+
+        class MyRollup(Rollup):
+            def get_usable_until(self):
+                return datetime(2020, 1, 2, 5)
+
+            def load(self, tier, meter_id, start, end):
+                buckets = dict()
+                for value, time in rows:
+                    if start <= time < end:
+                        bucket = time.replace(minute=0) if tier is RollupTier.HOUR else time.replace(hour=0, minute=0)
+                        buckets.setdefault(bucket, list()).append(value)
+                return [BucketSummary.summarize(bucket=bucket, values=values) for bucket, values in buckets.items()]
+
+        generate_cursor = self.get_cursor_generator(rows)
+        connection = MagicMock()
+        connection.cursor.side_effect = generate_cursor
+
+        hdl = HandleDataFromDB(period=Period(start=datetime(2019, 10, 25, 3, 10), end=datetime(2020, 1, 5)))
+        self.assertEqual(hdl.get_rollup_range(meter_id=1), None)
+        cases = [
+            dict(is_index=False),
+            dict(is_index=True),
+            dict(is_index=False, hour_start=22, hour_end=8),
+            dict(is_index=True, hour_start=9, hour_end=17),
+        ]
+        for case in cases:
+            for operator in MyOperator:
+                with patch("model.alert.my_sql.generate_cursor", side_effect=generate_cursor):
+                    expected = hdl.calculate_from_db(meter_id=1, operator=operator, **case)
+                with patch("model.alert.HandleDataFromDB.ROLLUP", MyRollup()), \
+                        patch("model.alert.my_sql.get_pooled_connection", return_value=connection) as mock:
+                    self.assertEqual(hdl.get_rollup_range(meter_id=1), (datetime(2019, 10, 25, 4), datetime(2020, 1, 2, 5)))
+                    self.assertEqual(hdl.calculate_from_db(meter_id=1, operator=operator, **case), expected)
+                    # only the edges are read from the rows
+                    self.assertEqual(mock.call_count, 2)
+
+        # short period
+        hdl = HandleDataFromDB(period=Period(start=datetime(2019, 12, 1), end=datetime(2019, 12, 3)))
+        with patch("model.alert.HandleDataFromDB.ROLLUP", MyRollup()):
+            self.assertEqual(hdl.get_rollup_range(meter_id=1), None)
+
+    def test__accumulator_merge_summary(self):
+        data = [0.1, 7.0, 0.2, 1e16, 3.0, -1e16, 0.3]
+        for operator in MyOperator:
+            accumulator = operator.accumulator()
+            accumulator.add(data[0])
+            summary = BucketSummary.summarize(bucket=datetime(2019, 1, 1), values=data[1:])
+            accumulator.merge_summary(summary.count, summary.minimum, summary.maximum, summary.total)
+            accumulator.merge_summary(0, None, None, Fraction(0))
+            self.assertEqual(accumulator.result, operator.calculate(data))
+            self.assertEqual(accumulator.count, len(data))
+
+    # -- MEMO --
+
+    def test__memoize(self):
+        run_memo.reset()
+        cursor = self.get_cursor_mock([(3,), (5,)])
+        with patch("model.alert.HandleDataFromDB.MEMOIZE", True), \
+                patch("model.alert.my_sql.generate_cursor", return_value=cursor) as mock:
+            for i in range(3):
+                hdl = HandleDataFromDB(period=Period(start=self.period.get_start_date(), end=self.period.get_end_date()))
+                self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX), 5)
+            self.assertEqual(mock.call_count, 1)
+            self.assertEqual((run_memo.hits, run_memo.misses), (2, 1))
+
+            # other key
+            mock.return_value = self.get_cursor_mock([(3,), (5,)])
+            self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MIN), 3)
+            self.assertEqual((run_memo.hits, run_memo.misses), (2, 2))
+            self.assertEqual(run_memo.summary(), "memo : 2 hits / 2 misses")
+
+        run_memo.reset()
+        self.assertEqual(run_memo.size, 0)
+
+    # -- PLANNER --
+
+    def test__merge_periods(self):
+        day = datetime(2019, 8, 1)
+        periods = [
+            Period(start=day + timedelta(days=7), end=day + timedelta(days=14)),
+            Period(start=day, end=day + timedelta(days=7)),  # adjacent
+            Period(start=day + timedelta(days=2), end=day + timedelta(days=3)),  # inside
+            Period(start=day + timedelta(days=20), end=day + timedelta(days=21)),
+        ]
+        merged = DataPlanner.merge_periods(periods)
+        self.assertEqual(
+            [(period.get_start_date(), period.get_end_date()) for period in merged],
+            [(day, day + timedelta(days=14)), (day + timedelta(days=20), day + timedelta(days=21))]
+        )
+
+    def test__planner(self):
+        day = datetime(2019, 8, 1)
+        rows = [(float(i % 5), day + timedelta(hours=i)) for i in range(24 * 14)]
+        data_period = Period(start=day + timedelta(days=7), end=day + timedelta(days=14))
+        value_period = Period(start=day, end=day + timedelta(days=7))
+
+        def generate_cursor(**kwargs):
+            return self.get_cursor_mock(rows)
+
+        planner = DataPlanner()
+        planner.add(meter_id=1, period=data_period)
+        planner.add(meter_id=1, period=value_period)
+        with patch("model.alert.my_sql.generate_cursor", side_effect=generate_cursor) as mock:
+            planner.load()
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(planner.nb_scans, 1)
+        self.assertEqual(planner.summary(), "planner : 2 periods read with 1 scans")
+        self.assertIsNone(planner.get_series(meter_id=2, period=data_period))
+
+        with patch("model.alert.run_planner", planner), patch("model.alert.HandleDataFromDB.PLANNING", True), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=generate_cursor) as mock:
+            for period in (data_period, value_period):
+                expected = [row[0] for row in rows if period.get_start_date() <= row[1] <= period.get_end_date()]
+                hdl = HandleDataFromDB(period=period)
+                self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=False), expected)
+                self.assertEqual(
+                    hdl.calculate_from_db(meter_id=1, is_index=True, operator=MyOperator.MIN, hour_start=8, hour_end=18),
+                    -4
+                )
+            self.assertEqual(mock.call_count, 0)
+
+        # planned rows are used before the pushdown / rollup / chunked paths
+        rollup = MagicMock()
+        with patch("model.alert.run_planner", planner), patch("model.alert.HandleDataFromDB.PLANNING", True), \
+                patch("model.alert.HandleDataFromDB.AGGREGATION_PUSHDOWN", True), \
+                patch("model.alert.HandleDataFromDB.ROLLUP", rollup), \
+                patch("model.alert.HandleDataFromDB.CHUNKED_SCAN", True), \
+                patch("model.alert.my_sql.get_pooled_connection") as pool_mock, \
+                patch("model.alert.my_sql.generate_cursor", side_effect=generate_cursor) as mock:
+            hdl = HandleDataFromDB(period=data_period)
+            # pushdown
+            self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX), 4)
+            # rollup (7 days of index)
+            self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=True, operator=MyOperator.MIN), -4)
+            self.assertEqual(mock.call_count, 0)
+            rollup.get_covered_range.assert_not_called()
+            pool_mock.assert_not_called()
+
+            # not planned : MySQL pushdown
+            hdl = HandleDataFromDB(period=Period(start=day - timedelta(days=2), end=day))
+            hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX)
+            self.assertEqual(mock.call_count, 1)
+
+    # -- INDEX DELTA --
+
+    def test__index_delta_query(self):
+        query = HandleDataFromDB.generate_aggregate_query(operator=MyOperator.MAX, index_delta=True)
+        self.assertEqual(
+            query,
+            "SELECT MAX(valeur), COUNT(valeur) FROM (SELECT r_compteur, date_heure, "
+            "valeur - LAG(valeur) OVER (PARTITION BY r_compteur ORDER BY date_heure) AS valeur "
+            "FROM bi_donnescomptage WHERE r_compteur = %s AND date_heure BETWEEN %s AND %s) AS deltas "
+            "WHERE valeur IS NOT NULL"
+        )
+        query = HandleDataFromDB.generate_batch_query(time_needed=False, nb_meter=2, index_delta=True)
+        self.assertIn("PARTITION BY r_compteur", query)
+        self.assertTrue(query.endswith("ORDER BY r_compteur, date_heure"))
+
+    def test__is_index_delta_in_query(self):
+        self.assertFalse(HandleDataFromDB.is_index_delta_in_query(is_index=True))
+        with patch("model.alert.HandleDataFromDB.INDEX_DELTA_IN_QUERY", True):
+            self.assertTrue(HandleDataFromDB.is_index_delta_in_query(is_index=True))
+            self.assertFalse(HandleDataFromDB.is_index_delta_in_query(is_index=False))
+            # hour filter has to be done before differences
+            self.assertFalse(HandleDataFromDB.is_index_delta_in_query(is_index=True, hour_start=8, hour_end=18))
+            with patch("model.alert.HandleDataFromDB.HOUR_FILTER_IN_QUERY", True):
+                self.assertTrue(HandleDataFromDB.is_index_delta_in_query(is_index=True, hour_start=8, hour_end=18))
+                with patch("model.alert.HandleDataFromDB.AGGREGATION_PUSHDOWN", True):
+                    self.assertTrue(HandleDataFromDB.can_push_down(is_index=True, hour_start=8, hour_end=18))
+
+    def test__index_delta_rows(self):
+        hdl = HandleDataFromDB(period=self.period)
+        with patch("model.alert.HandleDataFromDB.INDEX_DELTA_IN_QUERY", True):
+            cursor = self.get_cursor_mock([(2,), (-1,)])
+            with patch("model.alert.my_sql.generate_cursor", return_value=cursor):
+                # deltas are not calculated twice
+                self.assertEqual(hdl.get_data_from_db(meter_id=1, is_index=True), [2, -1])
+                self.assertIn("LAG(valeur)", cursor.execute.call_args[1]["operation"])
+
+
+    # -- ENGINE --
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test__numpy_engine(self):
+        hdl = HandleDataFromDB(period=self.period)
+        rows = [(float(value), self.today.replace(hour=hour)) for value, hour in zip([3, 2.5, 5, 1, 4, 17], [1, 7, 8, 12, 22, 23])]
+        cases = [
+            dict(is_index=False),
+            dict(is_index=True),
+            dict(is_index=False, hour_start=8, hour_end=18),
+            dict(is_index=True, hour_start=22, hour_end=8),
+        ]
+        for case in cases:
+            for operator in MyOperator:
+                results = list()
+                for engine in CalculationEngine:
+                    time_needed = HandleDataFromDB.is_time_needed(case.get("hour_start"), case.get("hour_end"))
+                    cursor = self.get_cursor_mock(rows if time_needed else [row[:1] for row in rows])
+                    with patch("model.alert.my_sql.generate_cursor", return_value=cursor):
+                        results.append(hdl.calculate_from_db(meter_id=1, operator=operator, engine=engine, **case))
+                for result in results[1:]:
+                    self.assertEqual(results[0], result)
+
+        # NO DATA
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock([(3,)])):
+            self.assertIsNone(hdl.calculate_from_db(
+                meter_id=1,
+                is_index=True,
+                operator=MyOperator.MAX,
+                engine=CalculationEngine.NUMPY
+            ))
+
+    def test__decimal_engine_parity(self):
+        # DECIMAL valeur column : the connector gives Decimal, MeterSeries keeps floats
+        hdl = HandleDataFromDB(period=self.period)
+        rows = [(Decimal(value), self.today.replace(hour=hour)) for value, hour in zip(["1.5", "2.25", "0.125", "4"], [1, 7, 8, 12])]
+        engines = [engine for engine in CalculationEngine if np is not None or engine is not CalculationEngine.NUMPY]
+        for operator in MyOperator:
+            results = list()
+            for engine in engines:
+                with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock([row[:1] for row in rows])):
+                    results.append(hdl.calculate_from_db(meter_id=1, is_index=False, operator=operator, engine=engine))
+            for result in results:
+                self.assertIs(type(result), float)
+                self.assertEqual(results[0], result)
+
+    def test__accumulator(self):
+        data_sets = [
+            [3, 2, 5, 1],
+            [0.1, 0.2, 0.3, 1e16, -1e16],
+            [Decimal("1.5"), Decimal("2.25"), Decimal("0.1")],
+            [1, 2],
+            [7],
+        ]
+        for data in data_sets:
+            for operator in MyOperator:
+                accumulator = operator.accumulator()
+                for value in data:
+                    accumulator.add(value)
+                self.assertEqual(operator.calculate(data), accumulator.result)
+                self.assertEqual(type(operator.calculate(data)), type(accumulator.result))
+                self.assertEqual(len(data), accumulator.count)
+
+        # NO DATA
+        for operator in MyOperator:
+            self.assertIsNone(operator.accumulator().result)
+
+    def test__streaming_engine(self):
+        hdl = HandleDataFromDB(period=self.period)
+        rows = [(value, self.today.replace(hour=hour)) for value, hour in zip([3, 2, 5, 1, 4, 17], [1, 7, 8, 12, 22, 23])]
+        cursor = self.get_cursor_mock(rows)
+        with patch("model.alert.my_sql.generate_cursor", return_value=cursor):
+            data = hdl.iter_data_from_db(meter_id=1, is_index=True, hour_start=22, hour_end=8)
+            self.assertNotIsInstance(data, list)
+            self.assertEqual([-1, 2, 13], list(data))
+        cursor.close.assert_called_once()
+
+        # NO DATA
+        with patch("model.alert.my_sql.generate_cursor", return_value=self.get_cursor_mock([(3,)])):
+            self.assertIsNone(hdl.calculate_from_db(
+                meter_id=1,
+                is_index=True,
+                operator=MyOperator.AVERAGE,
+                engine=CalculationEngine.STREAMING
+            ))
+
+
 class AlertCalculatorTest(unittest.TestCase):
 
     def setUp(self):
@@ -1066,6 +1692,86 @@ class AlertDefinitionTest(unittest.TestCase):
                 alert_definition = self.update_setup_and_get_alert_definition()
                 self.assertTrue(alert_definition.level == Level.LOW)
 
+    # UPSERT
+    def test__check_upsert(self):
+        self.meter_ids = [1, 2, 3]
+        with patch("model.alert.AlertCalculator") as calculator_mock, \
+                patch("model.alert.AlertNotification") as notification_mock, \
+                patch("model.alert.AlertDefinition.find_is_index", return_value=[(1, 0), (2, 0), (3, 1)]), \
+                patch("model.alert.Alert.save") as save_mock, \
+                patch("model.alert.Alert.archive") as archive_mock:
+            calculator_mock.return_value.is_alert_situation.side_effect = [False, True, False]
+            notification_mock.return_value.is_notification_allowed.return_value = False
+            alert_definition = self.update_setup_and_get_alert_definition()
+
+            alert_definition.check(today=self.today)
+            self.assertEqual(save_mock.call_count, 1)
+            archive_mock.assert_not_called()
+
+            calculator_mock.return_value.is_alert_situation.side_effect = [False, True, False]
+            with patch("model.alert.Alert.UPSERT", True):
+                alert_definition.check(today=self.today)
+            self.assertEqual(save_mock.call_count, 2)
+            archive_mock.assert_called_once_with(
+                alert_definition_id=self.alert_definition_id, meter_ids=[1, 3], today=self.today
+            )
+
+            # a meter stops the check : the situations already seen ended are archived
+            calculator_mock.return_value.is_alert_situation.side_effect = [False, NoDataFoundInDatabase("test")]
+            with patch("model.alert.Alert.UPSERT", True), self.assertRaises(NoDataFoundInDatabase):
+                alert_definition.check(today=self.today)
+            archive_mock.assert_called_with(alert_definition_id=self.alert_definition_id, meter_ids=[1], today=self.today)
+
+
+class AlertTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.today = datetime(2019, 11, 15, 10)
+        self.alert = Alert(alert_definition_id=1, value=15, data=20, today=self.today, meter_id=2)
+
+    def test__save(self):
+        cursor = MagicMock()
+        cursor.lastrowid = 12
+        with patch("model.alert.my_sql.generate_cursor", return_value=cursor), patch("model.alert.my_sql.commit"):
+            self.alert.save()
+            query = cursor.execute.call_args[1]["operation"]
+            self.assertTrue(query.startswith("INSERT INTO alert_alert (creation_date, modification_date, data, value"))
+            self.assertNotIn("current_key", query)
+            self.assertNotIn("ON DUPLICATE KEY UPDATE", query)
+            self.assertEqual(
+                cursor.execute.call_args[1]["params"],
+                [self.today, self.today, 20, 15, AlertStatus.CURRENT.value, 1, 2]
+            )
+            self.assertEqual(self.alert.id, 12)
+
+            with patch("model.alert.Alert.UPSERT", True):
+                self.alert.save()
+            self.assertIn(
+                " ON DUPLICATE KEY UPDATE modification_date = VALUES(modification_date), data = VALUES(data), "
+                "value = VALUES(value), id = LAST_INSERT_ID(id)",
+                cursor.execute.call_args[1]["operation"]
+            )
+
+    def test__archive(self):
+        cursor = MagicMock()
+        cursor.rowcount = 1
+        with patch("model.alert.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.alert.my_sql.commit") as commit_mock:
+            self.assertEqual(Alert.archive(alert_definition_id=1, meter_ids=[], today=self.today), 0)
+            cursor.execute.assert_not_called()
+
+            self.assertEqual(Alert.archive(alert_definition_id=1, meter_ids=[2, 3], today=self.today), 1)
+            commit_mock.assert_called_once()
+        self.assertEqual(
+            cursor.execute.call_args[1]["operation"],
+            "UPDATE alert_alert SET status = %s, modification_date = %s "
+            "WHERE alert_definition_id = %s AND status = %s AND meter_id IN (%s, %s)"
+        )
+        self.assertEqual(
+            cursor.execute.call_args[1]["params"],
+            [AlertStatus.ARCHIVE.value, self.today, 1, AlertStatus.CURRENT.value, 2, 3]
+        )
+
 
 class AlertManager(unittest.TestCase):
 
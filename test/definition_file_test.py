@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch, MagicMock, PropertyMock
+
+from model.alert import AlertDefinition, AlertManager, AlertStatus, Day, Hour, Level, AlertDefinitionStatus
+from model.definition_file import AlertDefinitionFile
+from model.utils import get_path_in_data_folder_of, DEFINITION_TABLE_NAME, NOTIFICATION_NAME
+
+
+class AlertDefinitionFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "alert_definitions.json")
+        self.compiled_path = os.path.join(self.directory.name, "alert_definitions.pickle")
+        with open(get_path_in_data_folder_of(AlertDefinitionFile.FILENAME)) as f:
+            self.definitions = json.load(f)
+        self.write()
+        # ids saved in the DB
+        self.existing_ids = {DEFINITION_TABLE_NAME: {3}, NOTIFICATION_NAME: {1}}
+        patcher = patch("model.definition_file.my_sql.generate_cursor", side_effect=self.generate_cursor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def generate_cursor(self, **kwargs):
+        cursor = MagicMock()
+
+        def execute(operation, params):
+            table_name = operation.split(" ")[3]
+            cursor.fetchall.return_value = [(my_id,) for my_id in params if my_id in self.existing_ids[table_name]]
+        cursor.execute.side_effect = execute
+        return cursor
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump(self.definitions, f)
+
+    def get_definition_file(self):
+        return AlertDefinitionFile(path=self.path, compiled_path=self.compiled_path)
+
+    def test__generate_setup(self):
+        setup = AlertDefinitionFile.generate_setup(self.definitions[0])
+        self.assertEqual(3, setup["id"])
+        self.assertEqual(1, setup["notification_id"])
+        self.assertEqual("category_1", setup["category"])
+        self.assertEqual(Level.LOW.value, setup["level"])
+        self.assertEqual(AlertDefinitionStatus.ACTIVE.value, setup["status"])
+        self.assertEqual(Day.MONDAY.value | Day.TUESDAY.value, setup["notification_days"])
+        self.assertEqual(Hour.H_8.value | Hour.H_9.value | Hour.H_10.value | Hour.H_11.value | Hour.H_12.value,
+                         setup["notification_hours"])
+        self.assertEqual(2, setup["data_period_quantity"])
+        self.assertEqual("WEEK", setup["data_period_unit"])
+        self.assertEqual("LAST_DATA_PERIOD", setup["value_period_type"])
+        # same keys as the setup from the DB
+        AlertDefinition(setup=setup, last_check=datetime(2019, 8, 27), today=datetime(2019, 8, 28))
+
+    def test__compiled_once(self):
+        definition_file = self.get_definition_file()
+        setups = definition_file.load()
+        self.assertEqual(1, len(setups))
+        self.assertEqual(1, definition_file.nb_compilations)
+
+        # next start : the compiled file is read, not the json
+        definition_file = self.get_definition_file()
+        with patch("model.definition_file.get_data_from_json_file") as json_mock:
+            self.assertEqual(setups, definition_file.load())
+            json_mock.assert_not_called()
+        self.assertEqual(0, definition_file.nb_compilations)
+
+    def test__compiled_again_when_changed(self):
+        definition_file = self.get_definition_file()
+        definition_file.load()
+        self.definitions[0]["name"] = "new name"
+        self.write()
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual("new name", definition_file.load()[0]["name"])
+        self.assertEqual(2, definition_file.nb_compilations)
+
+    def test__touched_but_same_content(self):
+        definition_file = self.get_definition_file()
+        definition_file.load()
+        os.utime(self.path, ns=(0, 0))
+        definition_file.load()
+        self.assertEqual(1, definition_file.nb_compilations)
+
+    def test__wrong_definitions(self):
+        wrong_operator = json.loads(json.dumps(self.definitions[0]))
+        wrong_operator["id"] = 4
+        wrong_operator["calculator"]["operator"] = "MEDIAN"
+        inactive = json.loads(json.dumps(self.definitions[0]))
+        inactive["id"] = 5
+        inactive["status"] = "INACTIVE"
+        self.definitions.extend([wrong_operator, inactive])
+        self.write()
+
+        with self.assertLogs(level="ERROR") as logs:
+            setups = self.get_definition_file().load()
+        self.assertEqual([3], [setup["id"] for setup in setups])
+        self.assertIn("[ALERT_DEFINITION_4]", logs.output[0])
+
+        # errors are logged again with the compiled file
+        with self.assertLogs(level="ERROR"):
+            self.get_definition_file().load()
+
+    def test__ids(self):
+        # ids are the foreign keys of the saved alerts and notification times
+        not_integer = json.loads(json.dumps(self.definitions[0]))
+        not_integer["id"] = "id_6"
+        no_notification_id = json.loads(json.dumps(self.definitions[0]))
+        no_notification_id["id"] = 7
+        del no_notification_id["notification"]["id"]
+        not_in_db = json.loads(json.dumps(self.definitions[0]))
+        not_in_db["id"] = 8
+        notification_not_in_db = json.loads(json.dumps(self.definitions[0]))
+        notification_not_in_db["id"] = 9
+        notification_not_in_db["notification"]["id"] = 2
+        self.definitions.extend([not_integer, no_notification_id, not_in_db, notification_not_in_db])
+        self.existing_ids[DEFINITION_TABLE_NAME].add(9)
+        self.write()
+
+        with self.assertLogs(level="ERROR") as logs:
+            setups = self.get_definition_file().load()
+        self.assertEqual([3], [setup["id"] for setup in setups])
+        self.assertEqual(4, len(logs.output))
+        self.assertIn("[ALERT_DEFINITION_id_6] AlertDefinition id must be an integer", logs.output[0])
+        self.assertIn("[ALERT_DEFINITION_7] notification id must be an integer", logs.output[1])
+        self.assertIn("[ALERT_DEFINITION_8] not in alert_definition", logs.output[2])
+        self.assertIn("[ALERT_DEFINITION_9] notification 2 not in alert_notification", logs.output[3])
+
+        # saved later in the DB : checked at each load, the compiled file is used
+        self.existing_ids[DEFINITION_TABLE_NAME].add(8)
+        definition_file = self.get_definition_file()
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual([3, 8], [setup["id"] for setup in definition_file.load()])
+        self.assertEqual(0, definition_file.nb_compilations)
+
+    def test__check(self):
+        # Tuesday 9h : in the notification days and hours of the file
+        today = datetime(2019, 8, 27, 9)
+        setup = self.get_definition_file().load()[0]
+        alert_definition = AlertDefinition(setup=setup, last_check=datetime(2019, 8, 26), today=today)
+        cursor = MagicMock()
+        cursor.fetchall.return_value = []  # never notified
+        with patch("model.alert.AlertDefinition.find_is_index", return_value=[(1, 0)]), \
+                patch("model.alert.AlertCalculator.is_alert_situation", return_value=True), \
+                patch("model.alert.AlertCalculator.value", new_callable=PropertyMock, return_value=15), \
+                patch("model.alert.AlertCalculator.data", new_callable=PropertyMock, return_value=20), \
+                patch("model.alert.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.alert.my_sql.commit"), \
+                patch("model.alert.Email") as email_mock:
+            email_mock.return_value.send.return_value = True
+            alert_definition.check(today=today)
+
+        calls = cursor.execute.call_args_list
+        self.assertEqual(3, len(calls))
+        # alert saved with the ids of the file
+        self.assertTrue(calls[0][1]["operation"].startswith("INSERT INTO alert_alert"))
+        self.assertEqual([today, today, 20, 15, AlertStatus.CURRENT.value, 3, 1], calls[0][1]["params"])
+        # last notification of the definition and its notification, then the new one
+        self.assertEqual((3, 1), calls[1][1]["params"])
+        self.assertTrue(calls[2][1]["operation"].startswith("INSERT INTO alert_definition_notification_time"))
+        self.assertEqual([1, 3, today], calls[2][1]["params"])
+        email_mock.return_value.send.assert_called_once_with(setup["notification_email"])
+
+    def test__alert_manager_source(self):
+        AlertManager.DEFINITION_FILE = self.get_definition_file()
+        try:
+            with patch("model.alert.AlertManager.get_alert_def_in_db") as db_mock:
+                self.assertEqual([3], [setup["id"] for setup in AlertManager.get_alert_def()])
+                db_mock.assert_not_called()
+        finally:
+            AlertManager.DEFINITION_FILE = None
+
+
+if __name__ == '__main__':
+    unittest.main()
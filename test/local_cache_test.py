@@ -0,0 +1,390 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from fractions import Fraction
+from statistics import mean
+from unittest.mock import patch, MagicMock
+
+from model.alert import HandleDataFromDB, Period, MyOperator, run_memo
+from model.local_cache import SeriesCache, BaselineCache, Baseline, NoDataCache
+from model.series import MeterSeries, to_epoch
+
+
+class SeriesCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SeriesCache(path=os.path.join(self.directory.name, "cache.sqlite"))
+        self.start = datetime(2019, 8, 1)
+        self.rows = [(float(i), self.start + timedelta(hours=i)) for i in range(48)]
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def store(self, meter_id: int, start: int, end: int):
+        rows = [row for row in self.rows if self.start + timedelta(hours=start) <= row[1] <= self.start + timedelta(hours=end)]
+        self.cache.store(
+            meter_id=meter_id,
+            series=MeterSeries.from_rows(rows, time_needed=True),
+            start=self.start + timedelta(hours=start),
+            end=self.start + timedelta(hours=end)
+        )
+
+    def test__store_and_load(self):
+        self.store(meter_id=1, start=0, end=23)
+        self.assertEqual(self.cache.get_ranges(1), [(to_epoch(self.start), to_epoch(self.start + timedelta(hours=23)))])
+        series = self.cache.load(meter_id=1, start=self.start + timedelta(hours=2), end=self.start + timedelta(hours=4))
+        self.assertEqual(list(series), [2, 3, 4])
+        self.assertEqual(series.epochs[0], to_epoch(self.start + timedelta(hours=2)))
+        self.assertEqual(self.cache.get_ranges(2), [])
+
+    def test__get_missing_range(self):
+        start, end = self.start + timedelta(hours=10), self.start + timedelta(hours=40)
+        self.assertEqual(self.cache.get_missing_range(meter_id=1, start=start, end=end), (start, end))
+
+        self.store(meter_id=1, start=0, end=23)
+        self.assertIsNone(self.cache.get_missing_range(meter_id=1, start=start, end=self.start + timedelta(hours=20)))
+        # overlap with the high-water mark
+        self.assertEqual(
+            self.cache.get_missing_range(meter_id=1, start=start, end=end),
+            (self.start + timedelta(hours=23) - SeriesCache.REFETCH_OVERLAP, end)
+        )
+        # before low
+        self.assertEqual(self.cache.get_missing_range(meter_id=1, start=self.start - timedelta(days=1), end=end),
+                         (self.start - timedelta(days=1), end))
+
+    def test__incremental_store(self):
+        self.store(meter_id=1, start=0, end=23)
+        self.store(meter_id=1, start=21, end=47)
+        self.assertEqual(self.cache.get_ranges(1), [(to_epoch(self.start), to_epoch(self.start + timedelta(hours=47)))])
+        series = self.cache.load(meter_id=1, start=self.start, end=self.start + timedelta(hours=47))
+        self.assertEqual(list(series), list(range(48)))
+        self.assertEqual(self.cache.nb_rows, 48)
+
+        # no continuity : a second segment
+        self.rows += [(float(i), self.start + timedelta(hours=i)) for i in range(100, 111)]
+        self.store(meter_id=1, start=100, end=110)
+        self.assertEqual(len(self.cache.get_ranges(1)), 2)
+        self.assertEqual(self.cache.nb_rows, 59)
+        self.assertIsNone(self.cache.get_missing_range(
+            meter_id=1, start=self.start + timedelta(hours=100), end=self.start + timedelta(hours=110)
+        ))
+        self.assertIsNone(self.cache.get_missing_range(meter_id=1, start=self.start, end=self.start + timedelta(hours=47)))
+
+        # segments joined by a store between them
+        self.store(meter_id=1, start=47, end=100)
+        self.assertEqual(
+            self.cache.get_ranges(1), [(to_epoch(self.start), to_epoch(self.start + timedelta(hours=110)))]
+        )
+        self.assertEqual(self.cache.nb_rows, 59)
+
+    def test__invalidate(self):
+        self.store(meter_id=1, start=0, end=23)
+        self.store(meter_id=2, start=0, end=23)
+        self.cache.invalidate(meter_id=1, since=self.start + timedelta(hours=10))
+        self.assertEqual(self.cache.get_ranges(1)[-1][1], to_epoch(self.start + timedelta(hours=10)) - 1)
+        self.assertEqual(self.cache.nb_rows, 34)
+        self.cache.invalidate(meter_id=2)
+        self.assertEqual(self.cache.get_ranges(2), [])
+        self.cache.invalidate()
+        self.assertEqual(self.cache.nb_rows, 0)
+
+    def test__evict(self):
+        self.store(meter_id=1, start=0, end=23)
+        self.store(meter_id=2, start=0, end=23)
+        self.cache.load(meter_id=1, start=self.start, end=self.start)
+        with patch("model.local_cache.SeriesCache.MAX_ROWS", 40):
+            self.store(meter_id=3, start=0, end=9)
+        # meter 2 is the least recently used
+        self.assertEqual(self.cache.get_ranges(2), [])
+        self.assertNotEqual(self.cache.get_ranges(1), [])
+        self.assertEqual(self.cache.nb_rows, 34)
+        self.assertGreater(self.cache.size, 0)
+
+    @staticmethod
+    def generate_cursor_mock(rows: list, executed: list):
+        """ MySQL cursor answering the period queries from rows, params of the queries added to executed """
+        def generate_cursor(**kwargs):
+            cursor = MagicMock()
+
+            def execute(operation, params):
+                executed.append(params)
+                selected = [row for row in rows if params[1] <= row[1] <= params[2]]
+                cursor.fetchall.return_value = selected
+                cursor.fetchmany.side_effect = [selected, []]
+            cursor.execute.side_effect = execute
+            return cursor
+        return generate_cursor
+
+    def test__handle_data_from_db(self):
+        rows = [(i % 7, self.start + timedelta(hours=i)) for i in range(48)]
+        executed = list()
+
+        with patch("model.alert.HandleDataFromDB.LOCAL_CACHE", self.cache), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor_mock(rows, executed)):
+            hdl = HandleDataFromDB(period=Period(start=self.start, end=self.start + timedelta(hours=30)))
+            self.assertEqual(hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.AVERAGE), mean(i % 7 for i in range(31)))
+            hdl = HandleDataFromDB(period=Period(start=self.start + timedelta(hours=5), end=self.start + timedelta(hours=47)))
+            self.assertEqual(
+                hdl.get_data_from_db(meter_id=1, is_index=True, hour_start=22, hour_end=2),
+                [1, 1, 1, 0, 1]
+            )
+        # only data after the high-water mark were read the second time
+        self.assertEqual(executed[1][1], self.start + timedelta(hours=30) - SeriesCache.REFETCH_OVERLAP)
+
+    def test__last_year_periods(self):
+        # a LAST_YEAR baseline : the current period and the same period a year ago, for the same meter
+        current = Period(start=self.start, end=self.start + timedelta(days=14))
+        last_year = Period(start=self.start - timedelta(days=365), end=self.start - timedelta(days=351))
+        rows = list()
+        for period in (last_year, current):
+            rows += [(i % 5, period.get_start_date() + timedelta(hours=i)) for i in range(14 * 24 + 1)]
+        executed = list()
+
+        with patch("model.alert.HandleDataFromDB.LOCAL_CACHE", self.cache), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor_mock(rows, executed)):
+            for run in range(2):
+                for period in (current, last_year):
+                    hdl = HandleDataFromDB(period=period)
+                    self.assertEqual(
+                        hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX), 4
+                    )
+                if run == 0:
+                    self.assertEqual(len(executed), 2)
+        # the second run reads nothing from MySQL : both periods stay in cache
+        self.assertEqual(len(executed), 2)
+        self.assertEqual(len(self.cache.get_ranges(1)), 2)
+
+    def test__schema_version(self):
+        self.store(meter_id=1, start=0, end=23)
+        self.cache.close()
+        connection = sqlite3.connect(self.cache.path)
+        connection.execute("PRAGMA user_version = 1")
+        connection.commit()
+        connection.close()
+        # file of another version : emptied
+        self.cache = SeriesCache(path=self.cache.path)
+        self.assertEqual(self.cache.nb_rows, 0)
+        self.assertEqual(self.cache.get_ranges(1), [])
+
+
+class BaselineCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = BaselineCache(path=os.path.join(self.directory.name, "baseline.sqlite"))
+        self.start = datetime(2019, 8, 1)
+        self.rows = [(float((i * 7) % 11), self.start + timedelta(hours=i)) for i in range(24 * 10)]
+        self.rows[3] = (50.0, self.rows[3][1])  # max in the first day
+        self.executed = list()
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def generate_cursor(self, **kwargs):
+        cursor = MagicMock()
+
+        def execute(operation, params):
+            self.executed.append(params)
+            selected = [row for row in self.rows if params[1] <= row[1] <= params[2]]
+            if "date_heure FROM" not in operation:
+                selected = [row[:1] for row in selected]
+            cursor.fetchall.return_value = selected
+            cursor.fetchmany.side_effect = [selected, []]
+        cursor.execute.side_effect = execute
+        return cursor
+
+    def calculate(self, day: int, operator: MyOperator, is_index: bool = False):
+        """ :return: number of scans of the whole period """
+        period = Period(start=self.start + timedelta(days=day), end=self.start + timedelta(days=day + 5))
+        hdl = HandleDataFromDB(period=period)
+        with patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor):
+            expected = hdl.calculate_from_db(meter_id=1, is_index=is_index, operator=operator)
+            self.executed.clear()
+            result = hdl.calculate_baseline(
+                meter_id=1,
+                is_index=is_index,
+                operator=operator,
+                cache=self.cache,
+                key=(1, "DAY", 5, operator.name, None, None, is_index)
+            )
+        self.assertEqual(result, expected)
+        self.assertIsInstance(result, float)
+        return len([params for params in self.executed if params[1:] == (period.get_start_date(), period.get_end_date())])
+
+    def test__fresh(self):
+        self.calculate(day=0, operator=MyOperator.AVERAGE)
+        with patch("model.local_cache.BaselineCache.TOLERANCE", timedelta(days=1)):
+            self.assertEqual(self.calculate(day=0, operator=MyOperator.AVERAGE), 0)
+
+    def test__update(self):
+        for operator in MyOperator:
+            self.assertEqual(self.calculate(day=0, operator=operator), 1)
+        # AVERAGE : exact sums are always updated by slices
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.AVERAGE), 0)
+        self.assertEqual(self.calculate(day=3, operator=MyOperator.AVERAGE), 0)
+        # MAX / MIN were in the removed day : whole period
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.MAX), 1)
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.MIN), 1)
+        # no overlap
+        self.assertEqual(self.calculate(day=8, operator=MyOperator.AVERAGE), 1)
+
+    def test__update_max(self):
+        self.rows = [(float(i), self.start + timedelta(hours=i)) for i in range(24 * 10)]
+        self.assertEqual(self.calculate(day=0, operator=MyOperator.MAX), 1)
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.MAX), 0)
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.MIN), 1)
+        self.assertEqual(self.calculate(day=2, operator=MyOperator.MIN), 1)
+
+    def test__index(self):
+        self.calculate(day=0, operator=MyOperator.AVERAGE, is_index=True)
+        self.assertEqual(self.calculate(day=1, operator=MyOperator.AVERAGE, is_index=True), 1)
+        self.assertEqual(len(self.executed), 1)
+
+    def test__invalidate(self):
+        self.calculate(day=0, operator=MyOperator.MIN)
+        key = (1, "DAY", 5, MyOperator.MIN.name, None, None, False)
+        self.assertIsInstance(self.cache.get(key=key, accumulator=MyOperator.MIN.accumulator), Baseline)
+        self.cache.invalidate(meter_id=2)
+        self.assertIsNotNone(self.cache.get(key=key, accumulator=MyOperator.MIN.accumulator))
+        self.cache.invalidate(meter_id=1)
+        self.assertIsNone(self.cache.get(key=key, accumulator=MyOperator.MIN.accumulator))
+
+    def test__summary(self):
+        # plain fields, the accumulator is rebuilt with merge_summary
+        start, end = datetime(2019, 8, 1, 10, 0, 0, 5), datetime(2019, 8, 6, 10, 0, 0, 5)
+        for operator, values in [(MyOperator.AVERAGE, [0.1, 0.2, 0.4]), (MyOperator.MAX, [3, 7, 5]),
+                                 (MyOperator.MIN, [3.5, 1.5])]:
+            accumulator = operator.accumulator()
+            for value in values:
+                accumulator.add(value)
+            key = (1, "DAY", 5, operator.name, None, None, False)
+            self.cache.put(key=key, baseline=Baseline(start=start, end=end, accumulator=accumulator))
+            baseline = BaselineCache(path=self.cache.path).get(key=key, accumulator=operator.accumulator)
+            self.assertEqual((baseline.start, baseline.end), (start, end))
+            self.assertEqual(baseline.accumulator.count, len(values))
+            self.assertEqual(baseline.value, operator.calculate(values))
+        row = sqlite3.connect(self.cache.path).execute("SELECT count, minimum, maximum, total FROM baseline").fetchall()
+        self.assertIn((3, None, None, str(sum(Fraction(value) for value in [0.1, 0.2, 0.4]))), row)
+
+    def test__schema_version(self):
+        self.cache.close()
+        connection = sqlite3.connect(self.cache.path)
+        connection.executescript("DROP TABLE baseline; CREATE TABLE baseline (key TEXT, meter_id INTEGER, state BLOB);"
+                                 "PRAGMA user_version = 0;")
+        connection.close()
+        self.cache = BaselineCache(path=self.cache.path)
+        self.assertIsNone(self.cache.get(key=(1,), accumulator=MyOperator.MAX.accumulator))
+
+    def test__memo_and_no_data(self):
+        key = (1, "DAY", 5, MyOperator.MAX.name, None, None, False)
+        period = Period(start=self.start, end=self.start + timedelta(days=5))
+        with patch("model.alert.HandleDataFromDB.MEMOIZE", True), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor):
+            run_memo.reset()
+            expected = HandleDataFromDB(period=period).calculate_from_db(meter_id=1, is_index=False,
+                                                                         operator=MyOperator.MAX)
+            self.executed.clear()
+            result = HandleDataFromDB(period=period).calculate_baseline(
+                meter_id=1, is_index=False, operator=MyOperator.MAX, cache=self.cache, key=key
+            )
+            run_memo.reset()
+        # same memo key as calculate_from_db
+        self.assertEqual(result, expected)
+        self.assertEqual(self.executed, [])
+
+        no_data_cache = NoDataCache(path=os.path.join(self.directory.name, "no_data.sqlite"))
+        no_data_cache.put(meter_id=2, last_data=None, checked_until=self.start + timedelta(days=6))
+        with patch("model.alert.HandleDataFromDB.NO_DATA_CACHE", no_data_cache), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor):
+            self.assertIsNone(HandleDataFromDB(period=period).calculate_baseline(
+                meter_id=2, is_index=False, operator=MyOperator.MAX, cache=self.cache, key=(2,) + key[1:]
+            ))
+        no_data_cache.close()
+        self.assertEqual(self.executed, [])
+
+
+class NoDataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = NoDataCache(path=os.path.join(self.directory.name, "no_data.sqlite"))
+        self.start = datetime(2019, 8, 1)
+        self.last_data = self.start - timedelta(days=3)
+        self.queries = list()
+        self.new_rows = list()
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def generate_cursor(self, **kwargs):
+        cursor = MagicMock()
+
+        def execute(operation, params):
+            self.queries.append(operation)
+            if operation.startswith("SELECT MAX"):
+                cursor.fetchall.return_value = [(self.last_data,)]
+            elif operation.startswith("SELECT 1"):
+                cursor.fetchall.return_value = [(1,)] if [row for row in self.new_rows if params[1] < row[1] <= params[2]] else []
+            else:
+                selected = [row for row in self.new_rows if params[1] <= row[1] <= params[2]]
+                cursor.fetchall.return_value = selected
+                cursor.fetchmany.side_effect = [selected, []]
+        cursor.execute.side_effect = execute
+        return cursor
+
+    def calculate(self, day: int):
+        hdl = HandleDataFromDB(period=Period(start=self.start + timedelta(days=day), end=self.start + timedelta(days=day + 1)))
+        self.queries.clear()
+        with patch("model.alert.HandleDataFromDB.NO_DATA_CACHE", self.cache), \
+                patch("model.alert.my_sql.generate_cursor", side_effect=self.generate_cursor):
+            return hdl.calculate_from_db(meter_id=1, is_index=False, operator=MyOperator.MAX)
+
+    def test__store(self):
+        self.assertIsNone(self.cache.get(meter_id=1))
+        self.cache.put(meter_id=1, last_data=None, checked_until=self.start)
+        self.assertEqual(self.cache.get(meter_id=1), (None, self.start))
+        self.cache.put(meter_id=2, last_data=self.last_data, checked_until=self.start)
+        self.assertEqual(self.cache.get(meter_id=2), (self.last_data, self.start))
+        self.assertEqual(self.cache.run_meter_ids, [1, 2])
+        self.cache.reset_run()
+        self.assertEqual(self.cache.run_meter_ids, [])
+        self.cache.invalidate(meter_id=1)
+        self.assertIsNone(self.cache.get(meter_id=1))
+
+    def test__handle_data_from_db(self):
+        self.assertIsNone(self.calculate(day=0))
+        self.assertEqual(len(self.queries), 2)  # scan + MAX(date_heure)
+        self.assertEqual(self.cache.get(meter_id=1), (self.last_data, self.start + timedelta(days=1)))
+
+        # same period : no query
+        self.assertIsNone(self.calculate(day=0))
+        self.assertEqual(self.queries, [])
+
+        # later period : existence check only
+        self.assertIsNone(self.calculate(day=1))
+        self.assertEqual(len(self.queries), 1)
+        self.assertTrue(self.queries[0].startswith("SELECT 1"))
+        self.assertEqual(self.cache.get(meter_id=1)[1], self.start + timedelta(days=2))
+
+        # period with the last data : scan
+        self.assertIsNone(self.calculate(day=-4))
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(self.cache.get(meter_id=1)[1], self.start + timedelta(days=2))
+
+        # meter sends data again
+        self.new_rows = [(5, self.start + timedelta(days=2, hours=3))]
+        self.assertEqual(self.calculate(day=2), 5)
+        self.assertIsNone(self.cache.get(meter_id=1))
+        self.assertEqual(self.cache.run_meter_ids, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import unittest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from model.my_exception import ConfigError, EnumError
+from model.retention import RetentionPolicy, RetentionMode, RetentionJob
+
+
+class RetentionPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetentionPolicy.from_config({
+            "table": "alert_alert",
+            "date_column": "modification_date",
+            "retention_days": 10,
+            "mode": "ARCHIVE",
+            "filters": {"status": 0}
+        })
+
+    def test__from_config(self):
+        self.assertEqual(self.policy.mode, RetentionMode.ARCHIVE)
+        self.assertEqual(self.policy.archive_table_name, "alert_alert_archive")
+        self.assertEqual(self.policy.get_limit(datetime(2019, 11, 15, 10)), datetime(2019, 11, 5, 10))
+        with self.assertRaises(EnumError):
+            RetentionPolicy.from_config({"table": "alert_manager", "date_column": "launch_datetime",
+                                         "retention_days": 1, "mode": "MOVE"})
+        with self.assertRaises(ConfigError):
+            RetentionPolicy.from_config({"table": "bi_compteurs", "date_column": "date", "retention_days": 1})
+        with self.assertRaises(ConfigError):
+            RetentionPolicy.from_config({"table": "alert_manager", "date_column": "date", "retention_days": 1})
+        with self.assertRaises(ConfigError):
+            RetentionPolicy.from_config({"table": "alert_alert", "date_column": "modification_date",
+                                         "retention_days": 1, "filters": {"status = 0 OR 1": 0}})
+        with self.assertRaises(ConfigError):
+            RetentionPolicy.from_config({"table": "alert_manager", "date_column": "launch_datetime",
+                                         "retention_days": 1, "keep_latest_by": ["meter_id"]})
+
+    def test__queries(self):
+        self.assertEqual(
+            self.policy.generate_select_query(),
+            "SELECT id FROM alert_alert WHERE id > %s AND modification_date < %s AND status = %s ORDER BY id LIMIT %s"
+        )
+        self.assertEqual(self.policy.generate_select_params(last_id=4, limit="limit", batch_size=2), (4, "limit", 0, 2))
+        self.assertEqual(
+            self.policy.generate_copy_query(nb_row=2),
+            "INSERT INTO alert_alert_archive (id, creation_date, modification_date, data, value, status, "
+            "alert_definition_id, meter_id) SELECT id, creation_date, modification_date, data, value, status, "
+            "alert_definition_id, meter_id FROM alert_alert WHERE id IN (%s, %s)"
+        )
+        self.assertEqual(self.policy.generate_delete_query(nb_row=1), "DELETE FROM alert_alert WHERE id IN (%s)")
+
+        notification = RetentionPolicy(table_name="alert_definition_notification_time",
+                                       date_column="notification_datetime", retention_days=1,
+                                       mode=RetentionMode.DELETE, keep_latest_by=["alert_definition_id"])
+        self.assertEqual(
+            notification.generate_latest_query(),
+            "SELECT MAX(id) FROM alert_definition_notification_time GROUP BY alert_definition_id"
+        )
+        manager = RetentionPolicy(table_name="alert_manager", date_column="launch_datetime", retention_days=1,
+                                  mode=RetentionMode.DELETE, keep_latest_by=[])
+        self.assertEqual(manager.generate_latest_query(), "SELECT MAX(id) FROM alert_manager")
+
+
+class RetentionJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.today = datetime(2019, 11, 15, 10)
+        with patch("model.retention.get_data_from_json_file", return_value={"batch_size": 3, "tables": []}):
+            self.job = RetentionJob()
+
+    def apply(self, policy, fetched):
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = fetched
+        with patch("model.retention.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.retention.my_sql.commit") as commit_mock, \
+                patch("model.retention.my_sql.execute_and_close") as execute_mock, \
+                patch("model.retention.time.sleep") as sleep_mock:
+            nb_rows = self.job.apply(policy=policy, today=self.today)
+        return nb_rows, cursor, commit_mock, execute_mock, sleep_mock
+
+    def test__archive(self):
+        policy = RetentionPolicy(table_name="alert_alert", date_column="modification_date", retention_days=10,
+                                 mode=RetentionMode.ARCHIVE, filters={"status": 0})
+        nb_rows, cursor, commit_mock, execute_mock, sleep_mock = self.apply(
+            policy=policy, fetched=[[(1,), (2,), (5,)], [(8,)]]
+        )
+        self.assertEqual(nb_rows, 4)
+        execute_mock.assert_called_once_with(query="CREATE TABLE IF NOT EXISTS alert_alert_archive LIKE alert_alert")
+        # one transaction by batch, a pause between the batches
+        self.assertEqual(commit_mock.call_count, 2)
+        sleep_mock.assert_called_once()
+        calls = cursor.execute.call_args_list
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(calls[0][1]["params"], (0, datetime(2019, 11, 5, 10), 0, 3))
+        self.assertTrue(calls[1][1]["operation"].startswith("INSERT INTO alert_alert_archive"))
+        self.assertEqual(calls[1][1]["params"], [1, 2, 5])
+        self.assertEqual(calls[2][1]["operation"], "DELETE FROM alert_alert WHERE id IN (%s, %s, %s)")
+        # keyset : next batch after the last id
+        self.assertEqual(calls[3][1]["params"], (5, datetime(2019, 11, 5, 10), 0, 3))
+        self.assertEqual(calls[5][1]["params"], [8])
+
+    def test__delete_keep_latest(self):
+        policy = RetentionPolicy(table_name="alert_definition_notification_time",
+                                 date_column="notification_datetime", retention_days=10, mode=RetentionMode.DELETE,
+                                 keep_latest_by=["alert_definition_id"], max_rows=4)
+        nb_rows, cursor, commit_mock, execute_mock, sleep_mock = self.apply(
+            policy=policy, fetched=[[(3,), (9,)], [(1,), (2,), (3,)], [(4,), (5,)]]
+        )
+        execute_mock.assert_not_called()
+        # 3 is the last notification of its AlertDefinition : kept
+        self.assertEqual(nb_rows, 4)
+        calls = cursor.execute.call_args_list
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(calls[0][1]["operation"], policy.generate_latest_query())
+        self.assertEqual(calls[2][1]["operation"], "DELETE FROM alert_definition_notification_time WHERE id IN (%s, %s)")
+        self.assertEqual(calls[2][1]["params"], [1, 2])
+        # max_rows : the last batch is smaller and no batch after it
+        self.assertEqual(calls[3][1]["params"], (3, datetime(2019, 11, 5, 10), 2))
+        self.assertEqual(calls[4][1]["params"], [4, 5])
+
+    def test__two_notifications_of_a_definition(self):
+        # shipped config : the last row of each (definition, notification) is kept for is_notification_allowed
+        job = RetentionJob()
+        policy = [policy for policy in job.policies if policy.table_name == "alert_definition_notification_time"][0]
+        self.assertEqual(
+            policy.generate_latest_query(),
+            "SELECT MAX(id) FROM alert_definition_notification_time GROUP BY alert_definition_id, alert_notification_id"
+        )
+        # definition 1 : id 3 is the last row of notification 1, id 4 of notification 2
+        nb_rows, cursor, commit_mock, execute_mock, sleep_mock = self.apply(
+            policy=policy, fetched=[[(3,), (4,)], [(1,), (2,), (3,)], [(4,)]]
+        )
+        self.assertEqual(nb_rows, 2)
+        calls = cursor.execute.call_args_list
+        self.assertEqual(calls[3][1]["operation"], "DELETE FROM alert_definition_notification_time WHERE id IN (%s, %s)")
+        self.assertEqual(calls[3][1]["params"], [1, 2])
+        self.assertEqual(len(calls), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import unittest
+from datetime import datetime, date, timedelta
+from fractions import Fraction
+from unittest.mock import patch, MagicMock
+
+from model.rollup import Rollup, RollupTier, BucketSummary, ceil_hour, floor_day
+
+
+class BucketSummaryTest(unittest.TestCase):
+
+    def test__summarize(self):
+        summary = BucketSummary.summarize(bucket=datetime(2019, 1, 1, 5), values=[3.0, 1.0, 4.0, 1.5])
+        self.assertEqual((summary.count, summary.minimum, summary.maximum), (4, 1.0, 4.0))
+        self.assertEqual(summary.total, Fraction(19, 2))
+        self.assertEqual((summary.first, summary.last), (3.0, 1.5))
+        self.assertEqual((summary.delta_count, summary.delta_min, summary.delta_max), (3, -2.5, 3.0))
+        self.assertEqual(summary.delta_total, Fraction(-3, 2))
+
+        single = BucketSummary.summarize(bucket=datetime(2019, 1, 1, 5), values=[0.1])
+        self.assertEqual((single.delta_count, single.delta_min, single.delta_max), (0, None, None))
+        self.assertEqual(single.total, Fraction(0.1))
+
+    def test__row(self):
+        summary = BucketSummary.summarize(bucket=datetime(2019, 1, 1, 5), values=[0.1, 0.2, 0.7])
+        row = summary.to_row(meter_id=4)
+        self.assertEqual(row[:3], (4, datetime(2019, 1, 1, 5), 3))
+        self.assertEqual(BucketSummary.from_row(row[1:]), summary)
+
+
+class RollupTest(unittest.TestCase):
+
+    def test__bounds(self):
+        self.assertEqual(ceil_hour(datetime(2019, 1, 1, 5)), datetime(2019, 1, 1, 5))
+        self.assertEqual(ceil_hour(datetime(2019, 1, 1, 5, 0, 1)), datetime(2019, 1, 1, 6))
+        self.assertEqual(floor_day(datetime(2019, 1, 1, 5, 3)), datetime(2019, 1, 1))
+
+    def test__split_tiers(self):
+        start, end = datetime(2019, 1, 1, 5), datetime(2019, 1, 4, 3)
+        self.assertEqual(Rollup.split_tiers(start=start, end=end, whole_days=True), [
+            (RollupTier.HOUR, start, datetime(2019, 1, 2)),
+            (RollupTier.DAY, datetime(2019, 1, 2), datetime(2019, 1, 4)),
+            (RollupTier.HOUR, datetime(2019, 1, 4), end),
+        ])
+        self.assertEqual(Rollup.split_tiers(start=start, end=end, whole_days=False), [(RollupTier.HOUR, start, end)])
+        self.assertEqual(
+            Rollup.split_tiers(start=datetime(2019, 1, 1), end=datetime(2019, 1, 3), whole_days=True),
+            [(RollupTier.DAY, datetime(2019, 1, 1), datetime(2019, 1, 3))]
+        )
+        # no whole day
+        self.assertEqual(
+            Rollup.split_tiers(start=start, end=datetime(2019, 1, 2, 4), whole_days=True),
+            [(RollupTier.HOUR, start, datetime(2019, 1, 2, 4))]
+        )
+
+    def test__get_covered_range(self):
+        rollup = Rollup()
+        with patch.object(rollup, "get_watermark", return_value=(10, datetime(2019, 2, 1, 12, 30))) as mock, \
+                patch.object(rollup, "get_pending_start", return_value=None) as pending_mock:
+            self.assertEqual(
+                rollup.get_covered_range(start=datetime(2019, 1, 1, 5, 10), end=datetime(2019, 1, 20, 3, 59)),
+                (datetime(2019, 1, 1, 6), datetime(2019, 1, 20, 3))
+            )
+            # not after the last refresh - SAFETY_LAG
+            self.assertEqual(
+                rollup.get_covered_range(start=datetime(2019, 1, 1, 5, 10), end=datetime(2019, 3, 1)),
+                (datetime(2019, 1, 1, 6), datetime(2019, 2, 1, 10))
+            )
+            self.assertEqual(rollup.get_covered_range(start=datetime(2019, 1, 1, 5, 10), end=datetime(2019, 1, 1, 6, 59)), None)
+            self.assertEqual(mock.call_count, 1)
+            pending_mock.assert_called_once_with(last_id=10)
+
+        # never refreshed
+        rollup = Rollup()
+        with patch.object(rollup, "get_watermark", return_value=None):
+            self.assertEqual(rollup.get_covered_range(start=datetime(2019, 1, 1), end=datetime(2019, 3, 1)), None)
+
+    def test__get_covered_range_late_rows(self):
+        # a row of 2019-01-10 added after the last refresh (id > 10) : the rollups are used before its hour only
+        rollup = Rollup()
+        results = [[(10, datetime(2019, 2, 1, 12, 30))], [(datetime(2019, 1, 10, 8, 15),)]]
+        with patch("model.rollup.my_sql.generate_cursor") as cursor_mock:
+            cursor_mock.return_value.fetchall.side_effect = results
+            self.assertEqual(
+                rollup.get_covered_range(start=datetime(2019, 1, 1, 5, 10), end=datetime(2019, 1, 20, 3, 59)),
+                (datetime(2019, 1, 1, 6), datetime(2019, 1, 10, 8))
+            )
+            self.assertEqual(
+                cursor_mock.return_value.execute.call_args[1],
+                dict(operation=Rollup.generate_pending_start_query(), params=(10,))
+            )
+            # range after the late row : all from the rows
+            self.assertIsNone(rollup.get_covered_range(start=datetime(2019, 1, 11), end=datetime(2019, 1, 20)))
+
+    def test__queries(self):
+        self.assertEqual(
+            Rollup.generate_pending_start_query(), "SELECT MIN(date_heure) FROM bi_donnescomptage WHERE id > %s"
+        )
+        self.assertEqual(
+            Rollup.generate_touched_query(),
+            "SELECT DISTINCT r_compteur, DATE(date_heure) FROM bi_donnescomptage WHERE id > %s AND id <= %s"
+        )
+        self.assertEqual(
+            Rollup.generate_load_query(RollupTier.DAY),
+            "SELECT bucket, nb_data, min_data, max_data, sum_data, sum_exact, first_data, last_data, delta_min, "
+            "delta_max, delta_sum_exact FROM alert_rollup_day WHERE meter_id = %s AND bucket >= %s AND bucket < %s "
+            "ORDER BY bucket"
+        )
+        self.assertTrue(Rollup.generate_insert_query(RollupTier.HOUR).startswith("INSERT INTO alert_rollup_hour (meter_id, bucket"))
+
+    def test__refresh(self):
+        day_rows = [(1.0, datetime(2019, 1, 1, 5, 10)), (3.0, datetime(2019, 1, 1, 5, 40)), (4.0, datetime(2019, 1, 1, 7))]
+        results = {
+            Rollup.generate_watermark_query(): [(10, datetime(2019, 1, 1))],
+            Rollup.generate_max_id_query(): [(13,)],
+            Rollup.generate_touched_query(): [(7, date(2019, 1, 1))],
+            Rollup.generate_rows_query(): day_rows,
+        }
+        cursors = list()
+
+        def generate_cursor(**kwargs):
+            cursor = MagicMock()
+            cursor.execute.side_effect = lambda operation, params=None: setattr(
+                cursor.fetchall, "return_value", results.get(operation, [])
+            )
+            cursors.append(cursor)
+            return cursor
+
+        with patch("model.rollup.my_sql.generate_cursor", side_effect=generate_cursor), \
+                patch("model.rollup.my_sql.commit"), \
+                patch("model.rollup.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(Rollup().refresh(), 1)
+
+        touched_cursor = cursors[2]
+        self.assertEqual(touched_cursor.execute.call_args[1]["params"], (10, 13))
+
+        write_cursor = cursors[-1]
+        inserted = {
+            call[1]["operation"]: call[1]["seq_params"] for call in write_cursor.executemany.call_args_list
+        }
+        hours = inserted[Rollup.generate_insert_query(RollupTier.HOUR)]
+        self.assertEqual([row[1] for row in hours], [datetime(2019, 1, 1, 5), datetime(2019, 1, 1, 7)])
+        self.assertEqual(hours[0][2:5], (2, 1.0, 3.0))
+        day = inserted[Rollup.generate_insert_query(RollupTier.DAY)]
+        self.assertEqual(day[0][:5], (7, datetime(2019, 1, 1), 3, 1.0, 4.0))
+        self.assertEqual(day[0][9:], (1.0, 2.0, "3"))
+        # buckets of the day are deleted first
+        self.assertEqual(write_cursor.execute.call_args_list[0][1]["params"], (7, datetime(2019, 1, 1), datetime(2019, 1, 2)))
+
+        self.assertEqual(execute_mock.call_args[1]["params"][:2], (Rollup.WATERMARK_NAME, 13))
+
+    def test__refresh_nothing_new(self):
+        rollup = Rollup()
+        with patch.object(rollup, "get_watermark", return_value=(13, datetime(2019, 1, 1))), \
+                patch("model.rollup.my_sql.generate_cursor") as cursor_mock, \
+                patch("model.rollup.my_sql.execute_and_close") as execute_mock, \
+                patch.object(rollup, "refresh_day") as refresh_mock:
+            cursor_mock.return_value.fetchall.return_value = [(13,)]
+            self.assertEqual(rollup.refresh(), 0)
+            refresh_mock.assert_not_called()
+            self.assertEqual(execute_mock.call_args[1]["params"][1], 13)
+
+    def test__invalidate(self):
+        rollup = Rollup()
+        with patch.object(rollup, "refresh_day") as refresh_mock:
+            rollup.invalidate(meter_id=3, start=datetime(2019, 1, 1, 5), end=datetime(2019, 1, 3))
+        self.assertEqual(
+            [call[1]["day"] for call in refresh_mock.call_args_list],
+            [datetime(2019, 1, 1), datetime(2019, 1, 2), datetime(2019, 1, 3)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import unittest
+from array import array
+from datetime import datetime
+
+from model.alert import MyOperator
+from model.series import MeterSeries, to_epoch, from_epoch, hour_of_epoch
+from model.vectorized import np
+
+
+class MeterSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.day = datetime(2019, 8, 12)
+        self.rows = [(value, self.day.replace(hour=hour)) for value, hour in zip([3, 2.5, 5, 1, 4, 17], [1, 7, 8, 12, 22, 23])]
+        self.series = MeterSeries.from_rows(self.rows, time_needed=True)
+
+    def test__epoch(self):
+        self.assertEqual(to_epoch(datetime(1970, 1, 1, 1)), 3600)
+        self.assertEqual(from_epoch(to_epoch(self.day.replace(hour=22))), self.day.replace(hour=22))
+        self.assertEqual(hour_of_epoch(to_epoch(self.day.replace(hour=22, minute=59))), 22)
+
+    def test__from_rows(self):
+        self.assertEqual(self.series.values.typecode, "d")
+        self.assertEqual(self.series.epochs.typecode, "q")
+        self.assertEqual(list(self.series), [3, 2.5, 5, 1, 4, 17])
+        self.assertEqual(self.series.nbytes, 6 * 16)
+
+        # generator (cursor read) and list (fetchall) give the same series
+        self.assertEqual(MeterSeries.from_rows(iter(self.rows), time_needed=True), self.series)
+
+        series = MeterSeries.from_rows([(3,), (4,)], time_needed=False)
+        self.assertFalse(series.has_time)
+        self.assertEqual(list(series), [3, 4])
+        with self.assertRaises(ValueError):
+            series.hour_mask(8, 18)
+
+        with self.assertRaises(ValueError):
+            MeterSeries(values=[1, 2], epochs=[1])
+
+    def test__slot(self):
+        with self.assertRaises(AttributeError):
+            self.series.other = 1
+
+    def test__between(self):
+        series = self.series.between(self.day.replace(hour=7), self.day.replace(hour=12))
+        self.assertEqual(list(series), [2.5, 5, 1])
+        self.assertEqual(series.epochs[0], to_epoch(self.day.replace(hour=7)))
+
+    def test__hour_mask(self):
+        self.assertEqual(list(self.series.hour_mask(8, 18)), [5, 1])
+        # past midnight
+        self.assertEqual(list(self.series.hour_mask(22, 8)), [3, 2.5, 4, 17])
+
+    def test__delta(self):
+        delta = self.series.delta()
+        self.assertEqual(list(delta), [-0.5, 2.5, -4, 3, 13])
+        self.assertEqual(delta.epochs, self.series.epochs[1:])
+        self.assertEqual(len(MeterSeries(values=[1]).delta()), 0)
+
+    def test__sequence(self):
+        self.assertEqual(self.series[2], 5)
+        self.assertEqual(self.series[1:3], MeterSeries(values=[2.5, 5], epochs=self.series.epochs[1:3]))
+
+    def test__operator(self):
+        for operator in MyOperator:
+            self.assertEqual(operator.calculate(self.series), operator.calculate([row[0] for row in self.rows]))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test__load_series(self):
+        from model import vectorized
+        values, epochs = vectorized.load_series(self.series)
+        self.assertEqual(values.tolist(), list(self.series))
+        self.assertEqual(epochs.tolist(), list(self.series.epochs))
+        self.assertIsNone(vectorized.load_series(MeterSeries(values=array("d", [1])))[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import json
+import os
+import tempfile
+import unittest
+
+from model.templates import CompiledTemplate, TemplateRegistry
+from model.utils import FileWatcher
+
+
+class CompiledTemplateTest(unittest.TestCase):
+
+    def test__render(self):
+        template = CompiledTemplate("Hello {{name}}, {{count}} alerts for {{name}}")
+        self.assertEqual(["name", "count", "name"], template.keys)
+        self.assertEqual("Hello Bob, 3 alerts for Bob", template.render({"name": "Bob", "count": "3"}))
+        # the template can be rendered again
+        self.assertEqual("Hello Ann, 0 alerts for Ann", template.render({"name": "Ann", "count": "0"}))
+
+    def test__render_unknown_key(self):
+        template = CompiledTemplate("{{known}} {{unknown}}")
+        self.assertEqual("value {{unknown}}", template.render({"known": "value", "other": "x"}))
+
+    def test__render_without_placeholder(self):
+        self.assertEqual("", CompiledTemplate("").render({"a": "b"}))
+        self.assertEqual("no key", CompiledTemplate("no key").render({}))
+
+    def test__render_value_with_placeholder(self):
+        # values are not rendered again
+        template = CompiledTemplate("{{a}}{{b}}")
+        self.assertEqual("{{b}}2", template.render({"a": "{{b}}", "b": "2"}))
+
+
+class TemplateRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.template_path = os.path.join(self.directory.name, "template.html")
+        self.config_path = os.path.join(self.directory.name, "config.json")
+        self.write(self.template_path, "Hello {{name}}")
+        self.write(self.config_path, json.dumps({"subject": "alert"}))
+        self.registry = TemplateRegistry()
+
+    def tearDown(self):
+        self.registry.clear()
+        self.directory.cleanup()
+
+    @staticmethod
+    def write(path: str, content: str):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test__loaded_once(self):
+        template = self.registry.get_template(self.template_path)
+        config = self.registry.get_config(self.config_path)
+        self.assertIs(template, self.registry.get_template(self.template_path))
+        self.assertIs(config, self.registry.get_config(self.config_path))
+        self.assertEqual({"subject": "alert"}, config)
+        self.assertEqual(2, self.registry.nb_loads)
+
+    def test__reloaded_when_changed(self):
+        default_ttl, default_inotify_ttl = FileWatcher.TTL, FileWatcher.INOTIFY_TTL
+        FileWatcher.TTL = FileWatcher.INOTIFY_TTL = 0
+        try:
+            self.assertEqual("Hello Bob", self.registry.get_template(self.template_path).render({"name": "Bob"}))
+            self.write(self.template_path, "Bye {{name}} !")
+            self.assertEqual("Bye Bob !", self.registry.get_template(self.template_path).render({"name": "Bob"}))
+            self.assertEqual(2, self.registry.nb_loads)
+        finally:
+            FileWatcher.TTL, FileWatcher.INOTIFY_TTL = default_ttl, default_inotify_ttl
+
+
+if __name__ == '__main__':
+    unittest.main()
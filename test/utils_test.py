@@ -0,0 +1,393 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from model.utils import FileWatcher, MySqlConnection, TableToGenerate, TableIndex, ALERT_MANAGER_TABLE_NAME, \
+    ALERT_MANAGER_TABLE_COMPO, ALERT_MANAGER_INDEXES, TablePartitioning, ALERT_TABLE_NAME, ALERT_TABLE_COMPO, \
+    ALERT_FOREIGN_KEY, ALERT_INDEXES, ALERT_UPSERT_GENERATED_COMPO, ALERT_UPSERT_INDEXES, \
+    ROLLUP_HOUR_TABLE_NAME, ROLLUP_COMPO, ROLLUP_PRIMARY_KEY
+
+
+class FileWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "config.json")
+        self.write("1")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, content: str, path: str = None):
+        with open(path if path else self.path, "w") as f:
+            f.write(content)
+
+    @patch("model.utils.FileWatcher.INOTIFY_TTL", 0)
+    def test__inotify(self):
+        watcher = FileWatcher(self.path)
+        if not watcher.is_inotify_used:
+            self.skipTest("inotify not available")
+        self.assertFalse(watcher.has_changed())
+        # other files of the folder (e.g. the SQLite caches of data/)
+        self.write("x", path=os.path.join(self.directory.name, "other.json"))
+        connection = sqlite3.connect(os.path.join(self.directory.name, "cache.sqlite"))
+        connection.execute("CREATE TABLE t (a INTEGER)")
+        connection.execute("INSERT INTO t VALUES (1)")
+        connection.commit()
+        connection.close()
+        self.assertFalse(watcher.has_changed())
+        self.write("22")
+        self.assertTrue(watcher.has_changed())
+        self.assertFalse(watcher.has_changed())
+        # replaced by rename (editors)
+        self.write("333", path=self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        self.assertTrue(watcher.has_changed())
+        watcher.close()
+
+    def test__inotify_ttl(self):
+        watcher = FileWatcher(self.path)
+        if not watcher.is_inotify_used:
+            self.skipTest("inotify not available")
+        self.write("22")
+        # no read of the events before INOTIFY_TTL
+        with patch("model.utils.os.read") as mock:
+            self.assertFalse(watcher.has_changed())
+            mock.assert_not_called()
+        # the event is kept by the kernel until the next read
+        with patch("model.utils.FileWatcher.INOTIFY_TTL", 0):
+            self.assertTrue(watcher.has_changed())
+            self.assertFalse(watcher.has_changed())
+        watcher.close()
+
+    @patch("model.utils.FileWatcher.INOTIFY_TTL", 0)
+    def test__inotify_overflow(self):
+        watcher = FileWatcher(self.path)
+        if not watcher.is_inotify_used:
+            self.skipTest("inotify not available")
+        # events lost : the file may have changed
+        overflow = FileWatcher.EVENT_HEADER.pack(-1, FileWatcher.IN_Q_OVERFLOW, 0, 0)
+        with patch("model.utils.os.read", side_effect=[overflow, BlockingIOError()]):
+            self.assertTrue(watcher.has_changed())
+        self.assertFalse(watcher.has_changed())
+        watcher.close()
+
+    def test__stat(self):
+        with patch("model.utils.FileWatcher.USE_INOTIFY", False):
+            watcher = FileWatcher(self.path)
+        self.assertFalse(watcher.is_inotify_used)
+        self.write("22")
+        # no stat before TTL
+        with patch("model.utils.os.stat") as mock:
+            self.assertFalse(watcher.has_changed())
+            mock.assert_not_called()
+        with patch("model.utils.FileWatcher.TTL", 0):
+            self.assertTrue(watcher.has_changed())
+            self.assertFalse(watcher.has_changed())
+
+
+class MySqlConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "mysql_config.json")
+        self.setup = dict(host="localhost", username="user", password="pwd", database="db", port=3306)
+        self.write(self.setup)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, setup: dict):
+        with open(self.path, "w") as f:
+            json.dump(setup, f)
+
+    def test__update_file_if_needed(self):
+        my_sql = MySqlConnection()
+        with patch("model.utils.MySqlConnection.get_file_path", return_value=self.path), \
+                patch("model.utils.FileWatcher.USE_INOTIFY", False), patch("model.utils.FileWatcher.TTL", 0), \
+                patch("model.utils.MySQLConnection") as connection:
+            self.assertTrue(my_sql.update_file_if_needed())
+            self.assertEqual(my_sql.host, "localhost")
+            self.assertFalse(my_sql.update_file_if_needed())
+
+            my_sql.generate_cursor()
+            my_sql.generate_cursor()
+            connection.assert_called_once()
+
+            # file written again with the same settings : no new connection
+            self.write(self.setup)
+            os.utime(self.path, ns=(0, 0))
+            my_sql.generate_cursor()
+            connection.assert_called_once()
+
+            self.setup["host"] = "other"
+            self.write(self.setup)
+            my_sql.generate_cursor()
+            self.assertEqual(connection.call_count, 2)
+            self.assertEqual(connection.call_args.kwargs["host"], "other")
+
+
+class TableToGenerateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = TableToGenerate(
+            table_name=ALERT_MANAGER_TABLE_NAME,
+            compo=ALERT_MANAGER_TABLE_COMPO,
+            indexes=ALERT_MANAGER_INDEXES + [TableIndex(name="uk_test", columns=["id", "launch_datetime"], unique=True)]
+        )
+
+    def test__index(self):
+        index = TableIndex(name="idx_test", columns=["a", "b"])
+        self.assertEqual(index.generate_definition(), "INDEX idx_test (a, b)")
+        self.assertEqual(index.generate_creation_query(table_name="my_table"), "CREATE INDEX idx_test ON my_table (a, b)")
+        unique = TableIndex(name="uk_test", columns=["a"], unique=True)
+        self.assertEqual(unique.generate_definition(), "UNIQUE KEY uk_test (a)")
+        self.assertEqual(unique.generate_creation_query(table_name="my_table"), "CREATE UNIQUE INDEX uk_test ON my_table (a)")
+
+    def test__request_table_creation(self):
+        with patch("model.utils.my_sql.execute_and_close") as execute_mock, \
+                patch("model.utils.TableToGenerate.check_if_table_created", return_value=True):
+            self.assertTrue(self.table.request_table_creation())
+        self.assertEqual(
+            execute_mock.call_args[1]["query"],
+            "CREATE TABLE IF NOT EXISTS alert_manager (id INT AUTO_INCREMENT PRIMARY KEY, "
+            "launch_datetime DATETIME NOT NULL, INDEX idx_launch_datetime (launch_datetime), "
+            "UNIQUE KEY uk_test (id, launch_datetime))"
+        )
+
+    def test__request_index_creation(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("PRIMARY",), ("idx_launch_datetime",)]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(self.table.request_index_creation(), ["uk_test"])
+        self.assertEqual(cursor.execute.call_args[1]["params"], ("alert_manager",))
+        self.assertEqual(execute_mock.call_count, 1)
+        self.assertEqual(
+            execute_mock.call_args[1]["query"], "CREATE UNIQUE INDEX uk_test ON alert_manager (id, launch_datetime)"
+        )
+
+        # already migrated
+        cursor.fetchall.return_value = [("PRIMARY",), ("idx_launch_datetime",), ("uk_test",)]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(self.table.request_index_creation(), [])
+            execute_mock.assert_not_called()
+
+    def test__primary_key(self):
+        table = TableToGenerate(table_name=ROLLUP_HOUR_TABLE_NAME, compo=ROLLUP_COMPO, primary_key=ROLLUP_PRIMARY_KEY)
+        with patch("model.utils.my_sql.execute_and_close") as execute_mock, \
+                patch("model.utils.TableToGenerate.check_if_table_created", return_value=True):
+            table.request_table_creation()
+        self.assertTrue(execute_mock.call_args[1]["query"].endswith(
+            "delta_sum_exact TEXT NOT NULL, PRIMARY KEY (meter_id, bucket))"
+        ))
+
+        # partitioned : the partition column is added if needed
+        table = TableToGenerate(table_name=ROLLUP_HOUR_TABLE_NAME, compo=ROLLUP_COMPO, primary_key=["meter_id"],
+                                partitioning=TablePartitioning(column="bucket"))
+        with patch("model.utils.my_sql.execute_and_close") as execute_mock, \
+                patch("model.utils.TableToGenerate.check_if_table_created", return_value=True), \
+                patch("model.utils.TableToGenerate.PARTITIONING", True):
+            table.request_table_creation()
+        self.assertIn(", PRIMARY KEY (meter_id, bucket)) PARTITION BY RANGE COLUMNS(bucket)", execute_mock.call_args[1]["query"])
+
+    def test__generated_columns(self):
+        table = TableToGenerate(
+            table_name=ALERT_TABLE_NAME,
+            compo=ALERT_TABLE_COMPO,
+            indexes=ALERT_INDEXES + ALERT_UPSERT_INDEXES,
+            generated_compo=ALERT_UPSERT_GENERATED_COMPO
+        )
+        with patch("model.utils.my_sql.execute_and_close") as execute_mock, \
+                patch("model.utils.TableToGenerate.check_if_table_created", return_value=True):
+            table.request_table_creation()
+        self.assertIn(
+            "meter_id INT NOT NULL, current_key TINYINT AS (IF(status = 1, 1, NULL)) STORED, ",
+            execute_mock.call_args[1]["query"]
+        )
+        self.assertIn(
+            "UNIQUE KEY uk_current_alert (alert_definition_id, meter_id, current_key))",
+            execute_mock.call_args[1]["query"]
+        )
+
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [(key,) for key in ALERT_TABLE_COMPO]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(table.request_column_creation(), ["current_key"])
+        self.assertEqual(
+            execute_mock.call_args[1]["query"],
+            "ALTER TABLE alert_alert ADD COLUMN current_key TINYINT AS (IF(status = 1, 1, NULL)) STORED"
+        )
+
+        # already migrated
+        cursor.fetchall.return_value = [(key,) for key in ALERT_TABLE_COMPO] + [("current_key",)]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(table.request_column_creation(), [])
+            execute_mock.assert_not_called()
+
+
+class TablePartitioningTest(unittest.TestCase):
+
+    def setUp(self):
+        self.partitioning = TablePartitioning(column="creation_date", months_ahead=2, retention_months=3)
+        self.today = datetime(2019, 11, 15, 10)
+
+    def test__months(self):
+        self.assertEqual(TablePartitioning.get_month(self.today, shift=2), datetime(2020, 1, 1))
+        self.assertEqual(TablePartitioning.get_month(self.today, shift=-11), datetime(2018, 12, 1))
+        self.assertEqual(TablePartitioning.get_partition_name(datetime(2019, 2, 1)), "p201902")
+        self.assertEqual(TablePartitioning.get_partition_month("p201902"), datetime(2019, 2, 1))
+        self.assertEqual(TablePartitioning.get_partition_month("pmax"), None)
+
+        months = [datetime(2019, 7, 1), datetime(2019, 8, 1), datetime(2019, 9, 1), datetime(2019, 10, 1)]
+        self.assertEqual(
+            self.partitioning.get_missing_months(months=months, today=self.today),
+            [datetime(2019, 11, 1), datetime(2019, 12, 1), datetime(2020, 1, 1)]
+        )
+        self.assertEqual(self.partitioning.get_expired_months(months=months, today=self.today), [datetime(2019, 7, 1)])
+        self.assertEqual(TablePartitioning(column="c").get_expired_months(months=months, today=self.today), [])
+
+    def test__generate_definition(self):
+        self.assertEqual(
+            self.partitioning.generate_definition(today=self.today),
+            "PARTITION BY RANGE COLUMNS(creation_date) ("
+            "PARTITION p201911 VALUES LESS THAN ('2019-12-01 00:00:00'), "
+            "PARTITION p201912 VALUES LESS THAN ('2020-01-01 00:00:00'), "
+            "PARTITION p202001 VALUES LESS THAN ('2020-02-01 00:00:00'), "
+            "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        )
+
+    def test__partitioned_table_creation(self):
+        table = TableToGenerate(
+            table_name=ALERT_TABLE_NAME,
+            compo=ALERT_TABLE_COMPO,
+            foreign_keys=ALERT_FOREIGN_KEY,
+            indexes=ALERT_INDEXES + ALERT_UPSERT_INDEXES,
+            partitioning=self.partitioning
+        )
+        with patch("model.utils.my_sql.execute_and_close") as execute_mock, \
+                patch("model.utils.TableToGenerate.check_if_table_created", return_value=True):
+            table.request_table_creation()
+            self.assertIn("FOREIGN KEY", execute_mock.call_args[1]["query"])
+            self.assertNotIn("PARTITION", execute_mock.call_args[1]["query"])
+
+            with patch("model.utils.TableToGenerate.PARTITIONING", True):
+                table.request_table_creation()
+            query = execute_mock.call_args[1]["query"]
+            self.assertNotIn("FOREIGN KEY", query)
+            self.assertIn("id INT AUTO_INCREMENT, ", query)
+            self.assertIn("meter_id INT NOT NULL, PRIMARY KEY (id, creation_date), ", query)
+            self.assertIn(") PARTITION BY RANGE COLUMNS(creation_date) (PARTITION p", query)
+            # a unique key without creation_date can not be created on the partitioned table
+            self.assertIn("INDEX idx_definition_meter_status", query)
+            self.assertNotIn("uk_current_alert", query)
+
+    def test__request_partition_maintenance(self):
+        table = TableToGenerate(table_name="my_table", compo=dict(), partitioning=self.partitioning)
+        cursor = MagicMock()
+        # partitions of my_table, then columns of my_table_p201907 : it does not exist
+        cursor.fetchall.side_effect = [
+            [("p201907",), ("p201908",), ("p201909",), ("p201910",), ("p201911",), ("pmax",)], []
+        ]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            queries = table.request_partition_maintenance(today=self.today)
+        self.assertEqual(queries, [
+            "ALTER TABLE my_table REORGANIZE PARTITION pmax INTO ("
+            "PARTITION p201912 VALUES LESS THAN ('2020-01-01 00:00:00'), "
+            "PARTITION p202001 VALUES LESS THAN ('2020-02-01 00:00:00'), "
+            "PARTITION pmax VALUES LESS THAN (MAXVALUE))",
+            "CREATE TABLE IF NOT EXISTS my_table_p201907 LIKE my_table",
+            "ALTER TABLE my_table_p201907 REMOVE PARTITIONING",
+            "ALTER TABLE my_table EXCHANGE PARTITION p201907 WITH TABLE my_table_p201907",
+            "ALTER TABLE my_table DROP PARTITION p201907",
+        ])
+        self.assertEqual(execute_mock.call_count, 5)
+
+        # not partitioned
+        cursor.fetchall.side_effect = None
+        cursor.fetchall.return_value = []
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(table.request_partition_maintenance(today=self.today), [])
+            execute_mock.assert_not_called()
+
+    def test__request_partition_maintenance_run_again(self):
+        table = TableToGenerate(table_name="my_table", compo=dict(), partitioning=self.partitioning)
+        partitions = [("p201907",), ("p201908",), ("p201909",), ("p201910",), ("p201911",), ("p201912",),
+                      ("p202001",), ("pmax",)]
+        columns = [("id",)]
+        create = "CREATE TABLE IF NOT EXISTS my_table_p201907 LIKE my_table"
+        remove = "ALTER TABLE my_table_p201907 REMOVE PARTITIONING"
+        exchange = "ALTER TABLE my_table EXCHANGE PARTITION p201907 WITH TABLE my_table_p201907"
+        drop = "ALTER TABLE my_table DROP PARTITION p201907"
+
+        def run_again(fetched: list) -> list:
+            """ :param fetched: partitions, archive columns, archive rows, [partition rows], partitions of the archive """
+            cursor = MagicMock()
+            cursor.fetchall.side_effect = fetched
+            with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                    patch("model.utils.my_sql.execute_and_close") as execute_mock:
+                queries = table.request_partition_maintenance(today=self.today)
+            self.assertEqual(execute_mock.call_count, len(queries))
+            return queries
+
+        # stopped after CREATE TABLE : the archive is still partitioned
+        self.assertEqual(run_again([partitions, columns, [], [("p201911",)]]), [create, remove, exchange, drop])
+        # stopped after REMOVE PARTITIONING
+        self.assertEqual(run_again([partitions, columns, [], []]), [create, exchange, drop])
+        # stopped after EXCHANGE : the rows are in the archive, a second EXCHANGE would bring them back
+        self.assertEqual(run_again([partitions, columns, [(1,)], [], []]), [drop])
+        # rows in both tables : nothing is dropped
+        self.assertEqual(run_again([partitions, columns, [(1,)], [(1,)]]), [])
+
+    def test__request_partitioning(self):
+        table = TableToGenerate(table_name=ALERT_TABLE_NAME, compo=ALERT_TABLE_COMPO, partitioning=self.partitioning)
+        cursor = MagicMock()
+        # partitions, unique keys, foreign keys
+        cursor.fetchall.side_effect = [
+            [], [("PRIMARY", "id")], [(ALERT_TABLE_NAME, "alert_alert_ibfk_1"), (ALERT_TABLE_NAME, "alert_alert_ibfk_2")]
+        ]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            queries = table.request_partitioning(today=self.today)
+        self.assertEqual(queries, [
+            "ALTER TABLE alert_alert DROP FOREIGN KEY alert_alert_ibfk_1",
+            "ALTER TABLE alert_alert DROP FOREIGN KEY alert_alert_ibfk_2",
+            "ALTER TABLE alert_alert DROP PRIMARY KEY, ADD PRIMARY KEY (id, creation_date)",
+            "ALTER TABLE alert_alert " + self.partitioning.generate_definition(today=self.today),
+        ])
+        self.assertEqual(execute_mock.call_count, 4)
+
+        # run again after the primary key change
+        cursor.fetchall.side_effect = [[], [("PRIMARY", "id"), ("PRIMARY", "creation_date")], []]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close"):
+            self.assertEqual(table.request_partitioning(today=self.today), queries[-1:])
+
+        # uk_current_alert (Alert.UPSERT) does not have creation_date
+        cursor.fetchall.side_effect = [[], [("PRIMARY", "id"), ("uk_current_alert", "alert_definition_id")]]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(table.request_partitioning(today=self.today), [])
+            execute_mock.assert_not_called()
+
+        # already partitioned
+        cursor.fetchall.side_effect = [[("p201911",), ("pmax",)]]
+        with patch("model.utils.my_sql.generate_cursor", return_value=cursor), \
+                patch("model.utils.my_sql.execute_and_close") as execute_mock:
+            self.assertEqual(table.request_partitioning(today=self.today), [])
+            execute_mock.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+# -*-coding:Utf-8 -*
+import random
+import unittest
+from statistics import mean
+
+from model import vectorized
+from model.vectorized import np
+
+
+@unittest.skipIf(np is None, "numpy not installed")
+class VectorizedTest(unittest.TestCase):
+
+    def test__hour_mask(self):
+        epochs = np.arange(24, dtype=np.int64) * 3600
+        self.assertEqual(np.flatnonzero(vectorized.hour_mask(epochs, 8, 11)).tolist(), [8, 9, 10])
+        # past midnight
+        self.assertEqual(np.flatnonzero(vectorized.hour_mask(epochs, 22, 2)).tolist(), [0, 1, 22, 23])
+
+    def test__calculate_average_array(self):
+        random.seed(4)
+        for i in range(200):
+            data = [random.uniform(-1, 1) * 10 ** random.randint(-20, 20) for j in range(random.randint(1, 100))]
+            self.assertEqual(vectorized.calculate_average_array(np.array(data)), mean(data))
+
+        data = [3, 5, 10, 25, 36, 174]
+        self.assertEqual(vectorized.calculate_average_array(np.array(data, dtype=np.float64)), mean(data))
+
+
+if __name__ == '__main__':
+    unittest.main()